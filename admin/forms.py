@@ -1,7 +1,9 @@
 from flask_wtf import FlaskForm
+from wtforms import Form
 from wtforms import StringField, TextAreaField, SubmitField, SelectField, BooleanField, IntegerField, PasswordField
 from wtforms.validators import DataRequired, Length, Email, ValidationError, EqualTo, Optional
 from models import User, Course, Lesson
+from courses.forms import CourseField
 
 class AdminUserForm(FlaskForm):
     fname = StringField('First Name', validators=[DataRequired(), Length(min=2, max=25)])
@@ -21,13 +23,13 @@ class AdminUserForm(FlaskForm):
 
     def validate_username(self, username):
         if username.data != self.original_username:
-            user = User.query.filter_by(username=self.username.data).first()
+            user = User.query.execution_options(include_deleted=True).filter_by(username=self.username.data).first()
             if user:
                 raise ValidationError('Username already exists!')
 
     def validate_email(self, email):
         if email.data != self.original_email:
-            user = User.query.filter_by(email=self.email.data).first()
+            user = User.query.execution_options(include_deleted=True).filter_by(email=self.email.data).first()
             if user:
                 raise ValidationError('Email already exists!')
     
@@ -48,12 +50,16 @@ class AdminCourseForm(FlaskForm):
 class AdminLessonForm(FlaskForm):
     title = StringField('Lesson Title', validators=[DataRequired(), Length(min=2, max=100)])
     content = TextAreaField('Content', validators=[DataRequired()])
-    course_id = SelectField('Course', coerce=int, validators=[DataRequired()])
+    course_id = CourseField('Course', validators=[DataRequired()])
     submit = SubmitField('Update Lesson')
 
-    def __init__(self, *args, **kwargs):
-        super(AdminLessonForm, self).__init__(*args, **kwargs)
-        self.course_id.choices = [(course.id, course.title) for course in Course.query.all()]
+class LessonFilterForm(Form):
+    """Course filter for the lesson list, read from the query string"""
+    course = CourseField('Course', blank='All')
+
+class BulkMoveForm(Form):
+    """Target course for moving selected lessons; the bulk view checks it"""
+    course_id = CourseField('Move to')
 
 class AdminStatsForm(FlaskForm):
     submit = SubmitField('Refresh Statistics')
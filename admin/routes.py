@@ -1,11 +1,46 @@
-from flask import render_template, url_for, flash, redirect, request, abort, jsonify
+from flask import render_template, url_for, flash, redirect, request, abort, jsonify, current_app, Response
 from flask_login import login_required, current_user
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, or_
 from datetime import datetime, timedelta
 from . import admin
-from .forms import AdminUserForm, AdminCourseForm, AdminLessonForm, AdminStatsForm
+from .forms import AdminUserForm, AdminCourseForm, AdminLessonForm, AdminStatsForm, LessonFilterForm, BulkMoveForm
 from app import db
-from models import User, Lesson, Course
+from models import User, Lesson, Course, lower_prefix
+from soft_delete import soft_delete, wake_purger, pending_deletions, status as purge_status
+import analytics
+from cache import cached_query
+from progress import move_lesson_bits, sync_progress_masks
+from lesson_order import append_lessons
+import metrics
+import slow_query
+
+# Password given to accounts reset from the admin panel
+DEFAULT_RESET_PASSWORD = "123456"
+
+# Sortable columns on the admin list pages; each is backed by an index
+USER_SORTS = {
+    'id': User.id,
+    'username': User.username,
+    'email': User.email,
+    'name': User.lname,
+    'is_admin': User.is_admin,
+    'last_login': User.last_login,
+    'password_changed_at': User.password_changed_at,
+}
+COURSE_SORTS = {
+    'id': Course.id,
+    'title': Course.title,
+}
+LESSON_SORTS = {
+    'id': Lesson.id,
+    'title': func.lower(Lesson.title),
+    'author': User.username,
+    'course': Course.title,
+    'date_posted': Lesson.date_posted,
+}
+
+# Windows (in days) offered on the statistics page
+STATS_WINDOWS = (7, 30, 90, 365)
 
 def admin_required(f):
     """Decorator to require admin access"""
@@ -17,16 +52,23 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@cached_query(tags=['users', 'courses', 'lessons'])
+def _site_totals():
+    return {
+        'total_users': User.query.count(),
+        'total_courses': Course.query.count(),
+        'total_lessons': Lesson.query.count(),
+        'total_admins': User.query.filter_by(is_admin=True).count(),
+    }
+
+
 @admin.route('/admin')
 @login_required
 @admin_required
 def dashboard():
     """Admin Dashboard"""
     # Get statistics
-    total_users = User.query.count()
-    total_courses = Course.query.count()
-    total_lessons = Lesson.query.count()
-    total_admins = User.query.filter_by(is_admin=True).count()
+    totals = _site_totals()
     
     # Recent activity
     recent_users = User.query.order_by(desc(User.id)).limit(5).all()
@@ -37,16 +79,15 @@ def dashboard():
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
     new_users_30_days = User.query.filter(User.id >= 1).count()  # Simplified for demo
     
-    stats = {
-        'total_users': total_users,
-        'total_courses': total_courses,
-        'total_lessons': total_lessons,
-        'total_admins': total_admins,
-        'new_users_30_days': new_users_30_days
-    }
+    stats = dict(totals, new_users_30_days=new_users_30_days)
     
     return render_template('admin/dashboard.html', 
                          stats=stats,
+                         pending_deletions=pending_deletions(),
+                         purge_status=purge_status,
+                         cache_stats=current_app.extensions['cache'].stats(),
+                         fragment_stats=current_app.extensions['fragment_cache'].stats(),
+                         view_log_status=current_app.extensions['view_log'].status,
                          recent_users=recent_users,
                          recent_lessons=recent_lessons,
                          recent_courses=recent_courses)
@@ -57,8 +98,17 @@ def dashboard():
 def manage_users():
     """Manage Users"""
     page = request.args.get('page', 1, type=int)
-    users = User.query.paginate(page=page, per_page=10, error_out=False)
-    return render_template('admin/users.html', users=users)
+    query = User.query
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(or_(lower_prefix(User.username, q), lower_prefix(User.email, q)))
+    is_admin = request.args.get('is_admin')
+    if is_admin in ('0', '1'):
+        query = query.filter(User.is_admin == (is_admin == '1'))
+    query = _date_range(query, User.created_at)
+    query, sort = _sorted(query, USER_SORTS, User.id)
+    users = query.paginate(page=page, per_page=10, error_out=False)
+    return render_template('admin/users.html', users=users, sort=sort, filters=_list_filters())
 
 @admin.route('/admin/users/<int:user_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -112,11 +162,10 @@ def delete_user(user_id):
         flash('You cannot delete your own account!', 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    # Delete user's lessons first
-    Lesson.query.filter_by(user_id=user.id).delete()
-    
-    db.session.delete(user)
+    # Hide the user now; their lessons and files are purged in the background
+    soft_delete(user)
     db.session.commit()
+    wake_purger()
     flash(f'User {user.username} has been deleted!', 'success')
     return redirect(url_for('admin.manage_users'))
 
@@ -130,7 +179,7 @@ def reset_user_password(user_id):
     # Generate new password hash
     from app import bcrypt
     from datetime import datetime
-    new_password = "123456"  # Default password
+    new_password = DEFAULT_RESET_PASSWORD
     user.password = bcrypt.generate_password_hash(new_password).decode('utf-8')
     user.password_changed_at = datetime.utcnow()
     
@@ -138,14 +187,54 @@ def reset_user_password(user_id):
     flash(f'Password for user {user.username} has been reset to: {new_password}', 'success')
     return redirect(url_for('admin.manage_users'))
 
+@admin.route('/admin/users/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_users():
+    """Bulk User Actions"""
+    action, ids = _bulk_selection()
+    # Never let an admin delete, demote or reset themselves by accident
+    ids = [user_id for user_id in ids if user_id != current_user.id]
+    if not ids or action not in ('delete', 'promote', 'demote', 'reset_password'):
+        return _bulk_response('Select users and an action first.', {}, 'admin.manage_users', 'warning')
+
+    selected = User.query.filter(User.id.in_(ids))
+    if action == 'delete':
+        # Soft delete; lessons and pictures go with the background purge
+        users = selected.update({User.deleted_at: datetime.utcnow()}, synchronize_session=False)
+        summary = {'users_deleted': users}
+    elif action in ('promote', 'demote'):
+        users = selected.update({User.is_admin: action == 'promote'}, synchronize_session=False)
+        summary = {'users_promoted' if action == 'promote' else 'users_demoted': users}
+    else:
+        from app import bcrypt
+        # One hash for the whole batch instead of one bcrypt round per user
+        hashed = bcrypt.generate_password_hash(DEFAULT_RESET_PASSWORD).decode('utf-8')
+        users = selected.update({
+            User.password: hashed,
+            User.password_changed_at: datetime.utcnow(),
+            User.last_reset_token: None
+        }, synchronize_session=False)
+        summary = {'passwords_reset': users}
+
+    db.session.commit()
+    if action == 'delete':
+        wake_purger()
+    return _bulk_response(_summarize(summary), summary, 'admin.manage_users')
+
 @admin.route('/admin/courses')
 @login_required
 @admin_required
 def manage_courses():
     """Manage Courses"""
     page = request.args.get('page', 1, type=int)
-    courses = Course.query.paginate(page=page, per_page=10, error_out=False)
-    return render_template('admin/courses.html', courses=courses)
+    query = Course.query
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(lower_prefix(Course.title, q))
+    query, sort = _sorted(query, COURSE_SORTS, Course.id)
+    courses = query.paginate(page=page, per_page=10, error_out=False)
+    return render_template('admin/courses.html', courses=courses, sort=sort, filters=_list_filters())
 
 @admin.route('/admin/courses/<int:course_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -178,11 +267,10 @@ def delete_course(course_id):
     """Delete Course"""
     course = Course.query.get_or_404(course_id)
     
-    # Delete all lessons in this course first
-    Lesson.query.filter_by(course_id=course.id).delete()
-    
-    db.session.delete(course)
+    # Hide the course now; its lessons and files are purged in the background
+    soft_delete(course)
     db.session.commit()
+    wake_purger()
     flash(f'Course {course.title} has been deleted!', 'success')
     return redirect(url_for('admin.manage_courses'))
 
@@ -192,8 +280,28 @@ def delete_course(course_id):
 def manage_lessons():
     """Manage Lessons"""
     page = request.args.get('page', 1, type=int)
-    lessons = Lesson.query.paginate(page=page, per_page=10, error_out=False)
-    return render_template('admin/lessons.html', lessons=lessons)
+    query = Lesson.query
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(lower_prefix(Lesson.title, q))
+    course_id = request.args.get('course', type=int)
+    if course_id:
+        query = query.filter(Lesson.course_id == course_id)
+    author_id = request.args.get('author', type=int)
+    if author_id:
+        query = query.filter(Lesson.user_id == author_id)
+    query = _date_range(query, Lesson.date_posted)
+    sort = request.args.get('sort')
+    if sort == 'course':
+        query = query.join(Course, Course.id == Lesson.course_id)
+    elif sort == 'author':
+        query = query.join(User, User.id == Lesson.user_id)
+    query, sort = _sorted(query, LESSON_SORTS, Lesson.id)
+    lessons = query.paginate(page=page, per_page=10, error_out=False)
+    # Course pickers: a typeahead instead of every course once there are many
+    return render_template('admin/lessons.html', lessons=lessons,
+                           filter_form=LessonFilterForm(course=course_id or None), move_form=BulkMoveForm(),
+                           sort=sort, filters=_list_filters())
 
 @admin.route('/admin/lessons/<int:lesson_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -231,43 +339,161 @@ def delete_lesson(lesson_id):
     flash(f'Lesson {lesson.title} has been deleted!', 'success')
     return redirect(url_for('admin.manage_lessons'))
 
+@admin.route('/admin/lessons/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_lessons():
+    """Bulk Lesson Actions"""
+    action, ids = _bulk_selection()
+    if not ids or action not in ('delete', 'move'):
+        return _bulk_response('Select lessons and an action first.', {}, 'admin.manage_lessons', 'warning')
+
+    selected = Lesson.query.filter(Lesson.id.in_(ids))
+    media = []
+    if action == 'delete':
+        media = [('static/lesson_thumbnails', name, Lesson.thumbnail.default.arg)
+                 for (name,) in selected.with_entities(Lesson.thumbnail)]
+        course_ids = sorted({course_id for (course_id,) in selected.with_entities(Lesson.course_id)})
+        summary = {'lessons_deleted': selected.delete(synchronize_session=False)}
+        sync_progress_masks(db.session.connection(), course_ids)
+    else:
+        course_id = str((request.get_json(silent=True) or request.form).get('course_id', ''))
+        course_id = int(course_id) if course_id.isdigit() else None
+        if not course_id or not db.session.query(Course.query.filter_by(id=course_id).exists()).scalar():
+            return _bulk_response('Choose a course to move the lessons to.', {}, 'admin.manage_lessons', 'warning')
+        moves = selected.filter(Lesson.course_id != course_id).with_entities(Lesson.id, Lesson.course_id).all()
+        moved = selected.update({Lesson.course_id: course_id}, synchronize_session=False)
+        move_lesson_bits(db.session.connection(), [lesson_id for lesson_id, _ in moves], course_id)
+        append_lessons(db.session.connection(), [lesson_id for lesson_id, _ in moves], course_id)
+        sync_progress_masks(db.session.connection(), sorted({course_id, *(old for _, old in moves)}))
+        summary = {'lessons_moved': moved}
+
+    db.session.commit()
+    _remove_media(media)
+    return _bulk_response(_summarize(summary), summary, 'admin.manage_lessons')
+
+@admin.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target (admins, or the METRICS_TOKEN bearer token)"""
+    if not current_app.config['METRICS']:
+        abort(404)
+    if not metrics.authorized():
+        abort(403)
+    return Response(metrics.scrape(), mimetype='text/plain; version=0.0.4')
+
+@admin.route('/admin/slow-queries')
+@login_required
+@admin_required
+def slow_queries():
+    """Statements over SLOW_QUERY_MS, worst total time first"""
+    if not current_app.config['SLOW_QUERY_LOG']:
+        abort(404)
+    return render_template('admin/slow_queries.html',
+                           offenders=slow_query.top_offenders(),
+                           recent=slow_query.recent(),
+                           threshold=current_app.config['SLOW_QUERY_MS'],
+                           persisted=current_app.config['SLOW_QUERY_PERSIST'])
+
 @admin.route('/admin/stats')
 @login_required
 @admin_required
 def statistics():
     """Admin Statistics"""
-    # User statistics
-    total_users = User.query.count()
-    admin_users = User.query.filter_by(is_admin=True).count()
-    regular_users = total_users - admin_users
+    # Totals are cached until a write to users, courses or lessons
+    totals = _site_totals()
     
-    # Content statistics
-    total_courses = Course.query.count()
-    total_lessons = Lesson.query.count()
-    
-    # Most active users (by lesson count)
-    active_users = db.session.query(User, func.count(Lesson.id).label('lesson_count'))\
-        .join(Lesson, User.id == Lesson.user_id)\
-        .group_by(User.id)\
-        .order_by(desc('lesson_count'))\
-        .limit(10).all()
-    
-    # Course popularity
-    popular_courses = db.session.query(Course, func.count(Lesson.id).label('lesson_count'))\
-        .join(Lesson, Course.id == Lesson.course_id)\
-        .group_by(Course.id)\
-        .order_by(desc('lesson_count'))\
-        .limit(10).all()
+    # Windowed trends and leaderboards come from the daily rollups
+    days = request.args.get('days', 30, type=int)
+    if days not in STATS_WINDOWS:
+        days = 30
+    trends = [analytics.summarize(metric, days) for metric in analytics.METRICS]
+    active_users = analytics.top_authors(days)
+    popular_courses = analytics.top_courses(days)
     
     stats = {
-        'total_users': total_users,
-        'admin_users': admin_users,
-        'regular_users': regular_users,
-        'total_courses': total_courses,
-        'total_lessons': total_lessons
+        'total_users': totals['total_users'],
+        'admin_users': totals['total_admins'],
+        'regular_users': totals['total_users'] - totals['total_admins'],
+        'total_courses': totals['total_courses'],
+        'total_lessons': totals['total_lessons']
     }
     
     return render_template('admin/statistics.html', 
                          stats=stats,
+                         days=days,
+                         windows=STATS_WINDOWS,
+                         trends=trends,
                          active_users=active_users,
                          popular_courses=popular_courses)
+
+
+# ------------------------
+# List filter helpers
+# ------------------------
+
+def _date_range(query, column):
+    """Filter on the inclusive ``date_from``/``date_to`` (YYYY-MM-DD) arguments"""
+    date_from = _parse_date(request.args.get('date_from'))
+    date_to = _parse_date(request.args.get('date_to'))
+    if date_from:
+        query = query.filter(column >= date_from)
+    if date_to:
+        query = query.filter(column < date_to + timedelta(days=1))
+    return query
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def _sorted(query, sorts, tiebreaker):
+    """Order by the requested ``sort``/``dir`` column, falling back to the id"""
+    sort = request.args.get('sort')
+    if sort not in sorts:
+        sort = 'id'
+    descending = request.args.get('dir') == 'desc'
+    column = sorts[sort]
+    if descending:
+        query = query.order_by(column.desc(), tiebreaker.desc())
+    else:
+        query = query.order_by(column.asc(), tiebreaker.asc())
+    return query, {'key': sort, 'dir': 'desc' if descending else 'asc'}
+
+
+def _list_filters():
+    """Current list arguments, minus the page, for pagination and sort links"""
+    return {key: value for key, value in request.args.items() if key != 'page' and value}
+
+
+# ------------------------
+# Bulk action helpers
+# ------------------------
+
+def _bulk_selection():
+    """Action name and selected ids from a form post or a JSON body"""
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        ids = [int(i) for i in payload.get('ids', []) if str(i).isdigit()]
+        return payload.get('action'), ids
+    return request.form.get('action'), request.form.getlist('ids', type=int)
+
+
+def _bulk_response(message, summary, endpoint, category='success'):
+    if request.is_json:
+        return jsonify(message=message, **summary)
+    flash(message, category)
+    return redirect(request.referrer or url_for(endpoint))
+
+
+def _summarize(summary):
+    return ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in summary.items()) + '.'
+
+
+def _remove_media(media):
+    """Delete uploaded files once the rows referencing them are committed away"""
+    from lessons.routes import delete_if_not_default
+    for directory, filename, default_name in media:
+        delete_if_not_default(directory, filename, default_name)
@@ -0,0 +1,212 @@
+"""Platform analytics built on daily rollup tables.
+
+``flask analytics rollup`` folds new source rows (users, lessons, password
+reset requests) into ``daily_metric`` and ``daily_lesson_count``. Logins have
+no source table and are counted into today's row as they happen, in the same
+transaction as the login. Everything the statistics page shows is read from a
+bounded window of rollup rows, so it costs the same no matter how much history
+exists.
+"""
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import desc, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+import models
+
+METRICS = ('signups', 'lessons', 'logins', 'reset_requests')
+
+analytics_cli = AppGroup('analytics', help='Rollup and analytics commands.')
+
+
+# ------------------------
+# Rollups
+# ------------------------
+
+def _as_date(value):
+    # SQLite's date() returns text, server databases return a date
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _metric_watermark(metric):
+    return db.session.query(func.max(models.DailyMetric.day)).filter_by(metric=metric).scalar()
+
+
+def _rollup_metric(metric, column, start):
+    DailyMetric = models.DailyMetric
+    day = func.date(column)
+    query = db.session.query(day, func.count()).filter(column.isnot(None))
+    stale = DailyMetric.query.filter(DailyMetric.metric == metric)
+    if start is not None:
+        query = query.filter(column >= datetime.combine(start, time.min))
+        stale = stale.filter(DailyMetric.day >= start)
+    stale.delete()
+    rows = query.group_by(day).all()
+    db.session.add_all([DailyMetric(metric=metric, day=_as_date(d), value=n) for d, n in rows])
+    return len(rows)
+
+
+def _rollup_lesson_counts(start):
+    Lesson, DailyLessonCount = models.Lesson, models.DailyLessonCount
+    day = func.date(Lesson.date_posted)
+    query = db.session.query(day, Lesson.course_id, Lesson.user_id, func.count())
+    stale = DailyLessonCount.query
+    if start is not None:
+        query = query.filter(Lesson.date_posted >= datetime.combine(start, time.min))
+        stale = stale.filter(DailyLessonCount.day >= start)
+    stale.delete()
+    rows = query.group_by(day, Lesson.course_id, Lesson.user_id).all()
+    db.session.add_all([
+        DailyLessonCount(day=_as_date(d), course_id=course_id, user_id=user_id, lessons=n)
+        for d, course_id, user_id, n in rows
+    ])
+    return len(rows)
+
+
+def rollup(full=False):
+    """Refresh rollups from the last rolled-up day onwards (or from scratch).
+
+    The last day already present is recomputed because it was probably
+    still in progress when it was last rolled up. Returns rows written
+    per rollup.
+    """
+    sources = {
+        'signups': models.User.created_at,
+        'lessons': models.Lesson.date_posted,
+        'reset_requests': models.PasswordResetRequest.created_at,
+    }
+    written = {}
+    for metric, column in sources.items():
+        start = None if full else _metric_watermark(metric)
+        written[metric] = _rollup_metric(metric, column, start)
+
+    start = None if full else db.session.query(func.max(models.DailyLessonCount.day)).scalar()
+    written['lesson_counts'] = _rollup_lesson_counts(start)
+    db.session.commit()
+    return written
+
+
+def record_event(metric, amount=1):
+    """Add an event without a source table to today's rollup row (not committed)"""
+    table = models.DailyMetric.__table__
+    today = datetime.utcnow().date()
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        # One upsert, so no other worker can create today's row in between
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        statement = insert(table).values(metric=metric, day=today, value=amount)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['metric', 'day'], set_={'value': table.c.value + amount}))
+        return
+    updated = db.session.execute(table.update().where(table.c.metric == metric, table.c.day == today)
+                                 .values(value=table.c.value + amount)).rowcount
+    if not updated:
+        db.session.execute(table.insert().values(metric=metric, day=today, value=amount))
+
+
+# ------------------------
+# Window analytics
+# ------------------------
+
+def daily_series(metric, days, end=None):
+    """Dense per-day values for the ``days`` days ending at ``end`` (inclusive)"""
+    import numpy as np  # ~100ms to import; only the statistics page needs it
+    end = end or datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    values = np.zeros(days, dtype=np.int64)
+    rows = db.session.query(models.DailyMetric.day, models.DailyMetric.value)\
+        .filter(models.DailyMetric.metric == metric,
+                models.DailyMetric.day >= start,
+                models.DailyMetric.day <= end).all()
+    for day, value in rows:
+        values[(day - start).days] = value
+    return start, values
+
+
+def moving_average(values, window):
+    """Trailing mean over ``window`` days; the first days average what exists"""
+    import numpy as np
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return values
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def growth_rate(current, previous):
+    """Relative change between two totals, None when there is no baseline"""
+    if not previous:
+        return None
+    return (current - previous) / previous
+
+
+def percentiles(values, q=(50, 90, 99)):
+    import numpy as np
+    if not len(values):
+        return {p: 0.0 for p in q}
+    return dict(zip(q, np.percentile(values, q).tolist()))
+
+
+def summarize(metric, days, end=None):
+    """Window total, growth against the previous window and daily distribution"""
+    start, series = daily_series(metric, days * 2, end)
+    previous, current = series[:days], series[days:]
+    total = int(current.sum())
+    trend = moving_average(current, min(7, days))
+    return {
+        'metric': metric,
+        'start': start + timedelta(days=days),
+        'total': total,
+        'previous_total': int(previous.sum()),
+        'growth': growth_rate(total, int(previous.sum())),
+        'moving_average': float(trend[-1]) if len(trend) else 0.0,
+        'trend': trend.round(2).tolist(),
+        'peak': int(current.max()) if len(current) else 0,
+        'percentiles': percentiles(current),
+    }
+
+
+def _window_start(days, end=None):
+    end = end or datetime.utcnow().date()
+    return end - timedelta(days=days - 1)
+
+
+def top_authors(days, limit=10):
+    """(User, lessons posted) for the most active authors in the window"""
+    User, DailyLessonCount = models.User, models.DailyLessonCount
+    return db.session.query(User, func.sum(DailyLessonCount.lessons).label('lesson_count'))\
+        .join(DailyLessonCount, DailyLessonCount.user_id == User.id)\
+        .filter(DailyLessonCount.day >= _window_start(days))\
+        .group_by(User.id)\
+        .order_by(desc('lesson_count'))\
+        .limit(limit).all()
+
+
+def top_courses(days, limit=10):
+    """(Course, lessons posted) for the busiest courses in the window"""
+    Course, DailyLessonCount = models.Course, models.DailyLessonCount
+    return db.session.query(Course, func.sum(DailyLessonCount.lessons).label('lesson_count'))\
+        .join(DailyLessonCount, DailyLessonCount.course_id == Course.id)\
+        .filter(DailyLessonCount.day >= _window_start(days))\
+        .group_by(Course.id)\
+        .order_by(desc('lesson_count'))\
+        .limit(limit).all()
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@analytics_cli.command('rollup')
+@click.option('--full', is_flag=True, help='Rebuild every rollup from the full history.')
+def rollup_command(full):
+    """Fold new users, lessons and reset requests into the daily rollups."""
+    written = rollup(full=full)
+    for name, rows in written.items():
+        click.echo(f'{name}: {rows} day rows')
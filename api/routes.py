@@ -0,0 +1,201 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import jsonify, request, abort
+from flask_login import current_user
+from sqlalchemy import tuple_
+from werkzeug.exceptions import HTTPException
+from app import db
+from models import User, Lesson, Course
+from . import api
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Public fields per resource. Lists only ever select the columns asked for,
+# and lesson content is only available from the single-lesson endpoint
+COURSE_FIELDS = {
+    'id': Course.id,
+    'title': Course.title,
+    'description': Course.description,
+    'icon': Course.icon,
+}
+LESSON_FIELDS = {
+    'id': Lesson.id,
+    'title': Lesson.title,
+    'slug': Lesson.slug,
+    'date_posted': Lesson.date_posted,
+    'thumbnail': Lesson.thumbnail,
+    'course_id': Lesson.course_id,
+    'position': Lesson.position,
+    'author_id': Lesson.user_id,
+}
+LESSON_DETAIL_FIELDS = dict(LESSON_FIELDS, content=Lesson.content)
+AUTHOR_FIELDS = {
+    'id': User.id,
+    'username': User.username,
+    'fname': User.fname,
+    'lname': User.lname,
+    'bio': User.bio,
+    'image_file': User.image_file,
+}
+
+
+# ------------------------
+# Request and response handling
+# ------------------------
+
+@api.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return jsonify(error='Authentication required.'), 401
+
+
+@api.errorhandler(HTTPException)
+def json_error(e):
+    return jsonify(error=e.description), e.code
+
+
+@api.after_request
+def conditional(response):
+    if response.status_code != 200 or not response.is_json:
+        return response
+    response.headers['Cache-Control'] = 'private, no-cache'
+    # Weak, since the compressed and plain bodies share one tag
+    # (compression.py compresses after this runs)
+    response.add_etag(weak=True)
+    response.make_conditional(request)
+    return response
+
+
+def _fields(available):
+    """Columns for the ``fields=`` query argument, all of ``available`` by default"""
+    requested = request.args.get('fields')
+    if not requested:
+        return dict(available)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return {name: available[name] for name in names}
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_cursor(values):
+    raw = json.dumps([_serialize(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(columns):
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(values) != len(columns):
+            raise ValueError
+        return [datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) else value
+                for value, column in zip(values, columns)]
+    except (ValueError, TypeError, binascii.Error):
+        abort(400, 'Invalid cursor.')
+
+
+def _limit():
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _rows(rows, fields):
+    return [{name: _serialize(row._mapping[name]) for name in fields} for row in rows]
+
+
+def _page(query, available, order_by):
+    """Keyset page of ``query`` ordered by the unique ``order_by`` columns"""
+    fields = _fields(available)
+    keys = [column.label(f'_key{i}') for i, column in enumerate(order_by)]
+    query = query.with_entities(*[column.label(name) for name, column in fields.items()], *keys)
+    after = _decode_cursor(order_by)
+    if after is not None:
+        query = query.filter(tuple_(*order_by) > tuple_(*after))
+    limit = _limit()
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([rows[-1]._mapping[key.name] for key in keys])
+    return jsonify(data=_rows(rows, fields), next_cursor=next_cursor)
+
+
+def _one(query, available):
+    fields = _fields(available)
+    row = query.with_entities(*[column.label(name) for name, column in fields.items()]).first()
+    if row is None:
+        abort(404, 'Not found.')
+    return jsonify(data=_rows([row], fields)[0])
+
+
+def _authors():
+    return User.query.filter(User.id.in_(db.session.query(Lesson.user_id)))
+
+
+# ------------------------
+# Courses
+# ------------------------
+
+@api.route("/courses")
+def courses():
+    return _page(Course.query, COURSE_FIELDS, [Course.id])
+
+
+@api.route("/courses/<int:course_id>")
+def course(course_id):
+    return _one(Course.query.filter(Course.id == course_id), COURSE_FIELDS)
+
+
+@api.route("/courses/<int:course_id>/outline")
+def course_outline(course_id):
+    """A course's lessons in reading order, without their content"""
+    if not db.session.query(Course.query.filter(Course.id == course_id).exists()).scalar():
+        abort(404, 'Not found.')
+    lessons = Lesson.query.filter(Lesson.course_id == course_id)
+    return _page(lessons, LESSON_FIELDS, [Lesson.position, Lesson.id])
+
+
+# ------------------------
+# Lessons
+# ------------------------
+
+@api.route("/lessons")
+def lessons():
+    query = Lesson.query
+    course_id = request.args.get('course_id', type=int)
+    author_id = request.args.get('author_id', type=int)
+    if course_id is not None:
+        query = query.filter(Lesson.course_id == course_id)
+    if author_id is not None:
+        query = query.filter(Lesson.user_id == author_id)
+    return _page(query, LESSON_FIELDS, [Lesson.id])
+
+
+@api.route("/lessons/<string:lesson_slug>")
+def lesson(lesson_slug):
+    return _one(Lesson.query.filter(Lesson.slug == lesson_slug).order_by(Lesson.id), LESSON_DETAIL_FIELDS)
+
+
+# ------------------------
+# Authors
+# ------------------------
+
+@api.route("/authors")
+def authors():
+    return _page(_authors(), AUTHOR_FIELDS, [User.id])
+
+
+@api.route("/authors/<int:author_id>")
+def author(author_id):
+    return _one(_authors().filter(User.id == author_id), AUTHOR_FIELDS)
@@ -1,42 +1,61 @@
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_ckeditor import CKEditor
-from flask_mail import Mail
 from config import Config
+from db_routing import RoutingSession
+from metrics import InstrumentedBcrypt
 
 # Initialize extensions (without app context first)
-db = SQLAlchemy()
-migrate = Migrate()
-bcrypt = Bcrypt()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+bcrypt = InstrumentedBcrypt()
 login_manager = LoginManager()
 ckeditor = CKEditor()
-mail = Mail()
+
+
+def get_mail():
+    """Flask-Mail for the current app, imported and set up on first use"""
+    from flask import current_app
+    if 'mail' not in current_app.extensions:
+        from flask_mail import Mail
+        Mail(current_app)
+    return current_app.extensions['mail']
+
 
 def create_app():
     # 1. Initialize app
     app = Flask(__name__, template_folder='raven/templates', static_folder='raven/static')
     app.config.from_object(Config)
+    # Request timing goes first so it covers every other hook
+    from metrics import init_metrics
+    init_metrics(app)
+    # Registered early so its after_request hook runs last of the rest
+    from compression import init_compression
+    init_compression(app)
 
     # 2. Initialize extensions with app
+    from engine_profiles import init_engine_profiles, apply_engine_profile
+    from db_routing import init_replica_binds, init_replica_routing
+    from view_log import init_analytics_bind
+    init_engine_profiles(app)
+    init_replica_binds(app)
+    init_analytics_bind(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    apply_engine_profile(app, db)
+    init_replica_routing(app, db)
+    from flask_migrate import Migrate  # pulls in alembic, so not at module level
+    Migrate(app, db)
     bcrypt.init_app(app)
     login_manager.init_app(app)
     ckeditor.init_app(app)
-    mail.init_app(app)
 
     # 3. Login manager configs
     login_manager.login_view = 'users.login'
     login_manager.login_message_category = 'info'
 
-    # 4. Import and initialize models
-    from models import init_db, create_models
-    init_db(db, login_manager)
-    User, Lesson, Course = create_models()
+    # 4. Import models (registers the tables and the user loader)
+    import models
 
     # 5. Import and register blueprints
     from main import main as main_bp
@@ -44,17 +63,72 @@ def create_app():
     from lessons import lessons as lessons_bp
     from users import users as users_bp
     from admin import admin as admin_bp
+    from api import api as api_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(courses_bp, url_prefix='/courses')
     app.register_blueprint(lessons_bp, url_prefix='/lessons')
     app.register_blueprint(users_bp, url_prefix='/users')
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+    # 6. Soft deletes and CLI commands
+    from soft_delete import init_soft_delete
+    init_soft_delete(app)
+
+    from conditional_get import init_conditional_get
+    init_conditional_get(app)
+
+    from progress import init_progress
+    from lesson_order import init_lesson_order
+    init_progress(app)
+    init_lesson_order(app)
+
+    from cache import init_cache
+    from fragment_cache import init_fragment_cache
+    init_cache(app)
+    init_fragment_cache(app)
+
+    from suggest import init_suggest
+    init_suggest(app)
+
+    from async_io import init_async_mode
+    init_async_mode(app)
+
+    from template_cache import init_template_cache
+    init_template_cache(app)
+
+    from analytics import analytics_cli
+    from view_log import init_view_log
+    app.cli.add_command(analytics_cli)
+    init_view_log(app)
+    import query_advisor  # adds `flask db advise`
+
+    from slow_query import init_slow_query_log
+    init_slow_query_log(app)
+
+    from maintenance import init_maintenance
+    init_maintenance(app)
+
+    # 7. Development instrumentation
+    from query_tracker import init_query_tracker
+    init_query_tracker(app)
 
     return app
 
-# Create the app instance
-app = create_app()
+_app = None
+
+
+def __getattr__(name):
+    # `app` is built on first use, so importing `db` or `create_app` from
+    # here (models, workers, CLI tools, tests) doesn't build the whole app
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    create_app().run(debug=True, port=5000)
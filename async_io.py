@@ -0,0 +1,209 @@
+"""Async mode for I/O-bound work (``ASYNC_MODE``).
+
+Flask runs async views by driving their event loop inside the worker, so
+they don't free the worker for other requests; what they do buy is
+overlapping I/O within one request. The modes are:
+
+``off``
+    Everything synchronous (the default); nothing here is imported.
+``mail``
+    Outgoing mail is handed to a single background event loop and sent
+    with aiosmtplib, so a reset request returns without waiting on SMTP
+    (the reply is the same whether or not the account exists anyway).
+``full``
+    ``mail``, plus views registered with ``@async_variant(endpoint)`` (so
+    far only ``main.home``) replace their sync counterpart and query
+    through an async engine (aiosqlite or asyncpg, derived from
+    ``DATABASE_URL``), running independent queries concurrently. This pays
+    off when each query waits on the network; on a local SQLite file the
+    extra thread hops make it slower (see ``benchmarks/async_mode.py``).
+
+Queued mail still in flight when the worker exits is waited for, up to
+``ASYNC_MAIL_TIMEOUT`` seconds, so it is either sent or reported.
+
+Picture uploads stay synchronous in every mode: the saved file name goes
+into the row being committed, so the write has to finish first.
+"""
+import asyncio
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+from sqlalchemy.engine import make_url
+
+ASYNC_MODES = ('off', 'mail', 'full')
+
+# Async DBAPI drivers for the sync URLs we support
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+_async_views = {}
+_engines = threading.local()
+_loop = None
+_loop_lock = threading.Lock()
+_pending = set()
+
+
+def async_variant(endpoint):
+    """Use the decorated coroutine for ``endpoint`` when ASYNC_MODE is ``full``"""
+    def register(view):
+        _async_views[endpoint] = view
+        return view
+    return register
+
+
+def async_database_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'ASYNC_MODE has no async driver for {backend!r} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def _async_engine(app):
+    # One engine per worker thread: an async engine shared between threads
+    # (each running its own event loop) can deadlock. Flask also gives every
+    # async view a fresh event loop, and pooled async connections can't move
+    # between loops, hence NullPool
+    engines = _engines.__dict__.setdefault('by_app', {})
+    engine = engines.get(id(app))
+    if engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from sqlalchemy.pool import NullPool
+        from engine_profiles import tune_engine
+        engine = create_async_engine(app.extensions['async_database_url'], poolclass=NullPool)
+        tune_engine(app, engine.sync_engine)
+        engines[id(app)] = engine
+    return engine
+
+
+def async_session():
+    """An AsyncSession on the primary database, for use inside async views"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    return AsyncSession(_async_engine(current_app._get_current_object()), expire_on_commit=False)
+
+
+# ------------------------
+# Background loop and mail
+# ------------------------
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-io', daemon=True).start()
+    return _loop
+
+
+def submit(coroutine):
+    """Run ``coroutine`` on the shared background loop; returns a concurrent Future"""
+    future = asyncio.run_coroutine_threadsafe(coroutine, _background_loop())
+    with _loop_lock:
+        _pending.add(future)
+    future.add_done_callback(_forget)
+    return future
+
+
+def _forget(future):
+    with _loop_lock:
+        _pending.discard(future)
+
+
+def drain(timeout=None):
+    """Wait up to ``timeout`` seconds for submitted work; returns how many are still running"""
+    with _loop_lock:
+        pending = list(_pending)
+    if not pending:
+        return 0
+    return len(wait(pending, timeout).not_done)
+
+
+def _drain_quietly(app):
+    # The loop's thread is a daemon, so without this anything still queued
+    # is dropped at exit without reaching on_error
+    try:
+        # Every send is capped at the timeout; the extra second covers on_error
+        left = drain(app.config['ASYNC_MAIL_TIMEOUT'] + 1)
+    except Exception:
+        return
+    if left:
+        app.logger.error(f'Exiting with {left} queued mail send(s) unfinished')
+
+
+async def _send_async(config, message, sender, recipients):
+    import aiosmtplib
+    await aiosmtplib.send(
+        message,
+        sender=sender,
+        recipients=recipients,
+        hostname=config['MAIL_SERVER'],
+        port=config['MAIL_PORT'],
+        username=config.get('MAIL_USERNAME'),
+        password=config.get('MAIL_PASSWORD'),
+        start_tls=bool(config.get('MAIL_USE_TLS')),
+        use_tls=bool(config.get('MAIL_USE_SSL')),
+        timeout=config['ASYNC_MAIL_TIMEOUT'],
+    )
+
+
+def send_mail(msg, on_error=None):
+    """Send a Flask-Mail message: inline, or queued on the async loop in async mode.
+
+    Inline sends raise; a queued send that fails calls ``on_error(exception)``
+    from the loop's thread (no app context there), or logs the error.
+    """
+    app = current_app._get_current_object()
+    if app.config['ASYNC_MODE'] == 'off':
+        from app import get_mail
+        get_mail().send(msg)
+        return
+    if app.config.get('MAIL_SUPPRESS_SEND', app.testing):
+        return
+
+    async def deliver(message, recipients):
+        # Capped as a whole (aiosmtplib's timeout is per command) and reported
+        # inside the task, so the exit drain also waits for on_error
+        timeout = config['ASYNC_MAIL_TIMEOUT']
+        try:
+            await asyncio.wait_for(_send_async(config, message, msg.sender, recipients), timeout)
+            return
+        except asyncio.TimeoutError:
+            error = TimeoutError(f'not sent within {timeout} seconds')
+        except Exception as e:
+            error = e
+        if on_error is not None:
+            on_error(error)
+        else:
+            app.logger.error(f'Failed to send mail to {", ".join(recipients)}: {error}')
+
+    from app import get_mail
+    get_mail()  # rendering the message reads the mail extension's settings
+    config = dict(app.config)
+    submit(deliver(msg.as_bytes(), list(msg.send_to)))
+
+
+def init_async_mode(app):
+    """Swap in async view variants in ``full`` mode; call after blueprints"""
+    app.config.setdefault('ASYNC_MODE', 'off')
+    app.config.setdefault('ASYNC_MAIL_TIMEOUT', 30)
+    if app.config['ASYNC_MODE'] not in ASYNC_MODES:
+        raise RuntimeError(f"Unknown ASYNC_MODE {app.config['ASYNC_MODE']!r}; choose one of {', '.join(ASYNC_MODES)}")
+    if app.config['ASYNC_MODE'] == 'off':
+        return
+    # Drain before threading's exit hooks shut down the default executor,
+    # which aiosmtplib needs for name lookups; ThreadPoolExecutor is imported
+    # above so its hook is registered first and therefore runs after ours
+    getattr(threading, '_register_atexit', atexit.register)(_drain_quietly, app)
+    if app.config['ASYNC_MODE'] != 'full':
+        return
+    from app import db
+    with app.app_context():
+        app.extensions['async_database_url'] = async_database_url(db.engine.url)
+
+    for endpoint, view in _async_views.items():
+        if endpoint in app.view_functions:
+            app.view_functions[endpoint] = view
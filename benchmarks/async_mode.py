@@ -0,0 +1,155 @@
+"""Requests per second for each ASYNC_MODE, at fixed worker counts.
+
+Each mode runs in its own interpreter against a fresh SQLite database
+seeded with users, courses and lessons. ``--workers`` threads (standing in
+for gunicorn's sync workers) share one queue of mixed traffic: home page
+reads plus password reset requests, whose mail goes to a local fake SMTP
+server that takes ``--smtp-delay`` seconds per message.
+
+    python benchmarks/async_mode.py
+    python benchmarks/async_mode.py --workers 4 8 --requests 400 --reset-share 0.3
+"""
+import argparse
+import json
+import os
+import queue
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ('off', 'mail', 'full')
+
+
+class _SlowSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept a message, slowly"""
+    delay = 0.2
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 bench ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 bench')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                time.sleep(self.delay)
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class _SMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def child(args):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(args.tmp, f'{args.mode}.db')
+    os.environ['ASYNC_MODE'] = args.mode
+    sys.path.insert(0, ROOT)
+    from app import create_app, db, bcrypt
+    import models
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, MAIL_SERVER='127.0.0.1', MAIL_PORT=args.smtp_port,
+                      MAIL_USE_TLS=False, MAIL_USE_SSL=False, MAIL_SUPPRESS_SEND=False,
+                      MAIL_DEFAULT_SENDER='bench@example.com', SERVER_NAME='localhost')
+    users = 500
+    with app.app_context():
+        db.create_all()
+        password = bcrypt.generate_password_hash('bench', rounds=4).decode()
+        db.session.add_all([models.User(fname='B', lname=str(i), username=f'bench{i}',
+                                        email=f'bench{i}@example.com', password=password)
+                            for i in range(users)])
+        db.session.add_all([models.Course(title=f'Course {i}', description='Benchmark course')
+                            for i in range(8)])
+        db.session.flush()
+        db.session.add_all([models.Lesson(title=f'Lesson {i}', slug=f'lesson-{i}', content='<p>x</p>',
+                                          user_id=1 + i % users, course_id=1 + i % 8)
+                            for i in range(200)])
+        db.session.commit()
+
+    every = max(1, round(1 / args.reset_share)) if args.reset_share else 0
+    results = {}
+    for workers in args.workers:
+        jobs = queue.Queue()
+        for i in range(args.requests):
+            if every and i % every == 0:
+                jobs.put(('POST', '/users/reset_password', {'email': f'bench{(i + workers * 1000) % users}@example.com'}))
+            else:
+                jobs.put(('GET', '/', None))
+
+        def work():
+            client = app.test_client()
+            while True:
+                try:
+                    method, url, data = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                response = client.open(url, method=method, data=data)
+                assert response.status_code < 400, (url, response.status_code)
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[workers] = args.requests / (time.perf_counter() - started)
+    print(json.dumps(results))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--reset-share', type=float, default=0.2, help='fraction of requests that are resets')
+    parser.add_argument('--smtp-delay', type=float, default=0.2, help='seconds the fake SMTP server takes per message')
+    parser.add_argument('--child', choices=MODES, dest='mode', help=argparse.SUPPRESS)
+    parser.add_argument('--smtp-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--tmp', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.mode:
+        return child(args)
+
+    _SlowSMTPHandler.delay = args.smtp_delay
+    smtp = _SMTPServer(('127.0.0.1', 0), _SlowSMTPHandler)
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    rates = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in MODES:
+            command = [sys.executable, __file__, '--child', mode, '--smtp-port', str(smtp.server_address[1]),
+                       '--tmp', tmp, '--requests', str(args.requests), '--reset-share', str(args.reset_share),
+                       '--workers', *map(str, args.workers)]
+            result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+            if result.returncode:
+                raise SystemExit(result.stderr[-3000:])
+            rates[mode] = json.loads(result.stdout.splitlines()[-1])
+    smtp.shutdown()
+
+    print(f'{args.requests} requests, {args.reset_share:.0%} password resets, SMTP {args.smtp_delay * 1000:.0f} ms/message')
+    for workers in args.workers:
+        baseline = rates['off'][str(workers)]
+        print(f'{workers} workers: ' + ', '.join(
+            f"{mode} {rates[mode][str(workers)]:.1f} req/s ({rates[mode][str(workers)] / baseline:.1f}x)" for mode in MODES))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
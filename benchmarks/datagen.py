@@ -0,0 +1,230 @@
+"""Synthetic data for benchmarks, loaded with bulk inserts.
+
+Builds a fresh SQLite database with the app's schema (stamped at the
+migration head) and fills it with users, courses, lessons and enrollments.
+Course sizes are skewed (a few big courses, a long tail of small ones),
+lesson bodies are HTML paragraphs with log-normally distributed length
+(median about 2 KB), and a fixed ``--seed`` gives the same data every time.
+Afterwards the analytics rollups are rebuilt, so the statistics pages have
+something to read.
+
+    python benchmarks/datagen.py bench.db                      # --scale small
+    python benchmarks/datagen.py bench.db --scale large        # 100k users, 10k courses, 1M lessons
+    python benchmarks/datagen.py bench.db --users 5000 --courses 300 --lessons 40000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {
+    # users, courses, lessons
+    'tiny': (200, 20, 1000),
+    'small': (2000, 200, 20000),
+    'medium': (20000, 2000, 200000),
+    'large': (100000, 10000, 1000000),
+}
+CHUNK = 20000
+PASSWORD = 'benchmark'
+
+_FIRST = ('Ada', 'Alan', 'Grace', 'Linus', 'Barbara', 'Edsger', 'Donald', 'Margaret', 'Ken', 'Radia',
+          'Dennis', 'Frances', 'John', 'Sophie', 'Guido', 'Katherine', 'Niklaus', 'Hedy', 'Tim', 'Shafi')
+_LAST = ('Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Liskov', 'Dijkstra', 'Knuth', 'Hamilton', 'Thompson',
+         'Perlman', 'Ritchie', 'Allen', 'McCarthy', 'Wilson', 'van Rossum', 'Johnson', 'Wirth', 'Lamarr')
+_ADJECTIVES = ('Practical', 'Modern', 'Applied', 'Intro to', 'Advanced', 'Hands-on', 'Essential', 'Deep')
+_TOPICS = ('Python', 'SQL', 'Statistics', 'Web Design', 'Algorithms', 'Linear Algebra', 'Networking',
+           'Cryptography', 'Compilers', 'Databases', 'Machine Learning', 'Rust', 'Writing', 'Geometry')
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+          'et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+          'ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla '
+          'pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim').split()
+
+
+def _paragraphs(rng, count=200):
+    pool = []
+    for _ in range(count):
+        words = rng.choices(_WORDS, k=rng.randint(40, 90))
+        text = ' '.join(words).capitalize() + '.'
+        if rng.random() < 0.2:
+            text = f'<strong>{text[:40]}</strong>{text[40:]}'
+        pool.append(f'<p>{text}</p>')
+    return pool
+
+
+def _content(rng, pool):
+    # Median ~4 paragraphs (~2 KB), with a long tail of much longer lessons
+    paragraphs = max(1, min(200, int(rng.lognormvariate(1.4, 0.8))))
+    body = ''.join(rng.choices(pool, k=paragraphs))
+    if rng.random() < 0.3:
+        body += '<pre><code>' + 'x = compute(x)\n' * rng.randint(3, 30) + '</code></pre>'
+    return body
+
+
+def _course_sizes(rng, courses, lessons):
+    """Lessons per course: Zipf-like weights, every course gets at least one"""
+    import numpy as np
+    generator = np.random.default_rng(rng.randrange(2 ** 32))
+    weights = 1 / np.arange(1, courses + 1) ** 0.7
+    sizes = generator.multinomial(max(0, lessons - courses), weights / weights.sum()) + 1
+    generator.shuffle(sizes)
+    return [int(size) for size in sizes[:lessons]] if lessons < courses else [int(size) for size in sizes]
+
+
+def _insert(connection, table, rows):
+    for start in range(0, len(rows), CHUNK):
+        connection.execute(table.insert(), rows[start:start + CHUNK])
+
+
+def _stream(connection, table, rows):
+    """Insert from a generator without holding every row in memory"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK:
+            connection.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+
+
+def generate(path, users, courses, lessons, enrollments=None, seed=1, rollup=True, log=print):
+    """Create ``path`` (SQLite) and fill it; returns a dict of row counts and timings"""
+    if os.path.exists(path):
+        raise SystemExit(f'{path} already exists')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(path)
+    os.environ.setdefault('PURGE_IN_BACKGROUND', 'false')
+    sys.path.insert(0, ROOT)
+    from app import create_app, db, bcrypt
+    import models
+
+    rng = random.Random(seed)
+    enrollments = users // 2 if enrollments is None else enrollments
+    app = create_app()
+    timings = {}
+    now = datetime(2026, 1, 1)
+
+    with app.app_context():
+        db.create_all()
+        from flask_migrate import stamp
+        stamp(directory=os.path.join(ROOT, 'migrations'))
+        engine = db.engine
+        with engine.begin() as connection:
+            # Bulk load settings; the engine profile's pragmas apply again on the next connection
+            connection.exec_driver_sql('PRAGMA synchronous=OFF')
+
+            started = time.perf_counter()
+            password = bcrypt.generate_password_hash(PASSWORD, rounds=4).decode()
+            user_rows = []
+            for i in range(1, users + 1):
+                created = now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+                user_rows.append({
+                    'id': i, 'fname': rng.choice(_FIRST), 'lname': rng.choice(_LAST),
+                    'username': 'admin' if i == 1 else f'user{i}', 'email': f'user{i}@example.com',
+                    'password': password, 'bio': None, 'image_file': 'default.png', 'reset_attempts': 0,
+                    'is_admin': i == 1, 'created_at': created,
+                    'last_login': created + timedelta(days=rng.randrange(30)) if rng.random() < 0.7 else None,
+                })
+            _insert(connection, models.User.__table__, user_rows)
+            timings['users'] = time.perf_counter() - started
+            log(f'{users} users in {timings["users"]:.1f}s')
+
+            started = time.perf_counter()
+            sizes = _course_sizes(rng, courses, lessons)
+            course_rows = []
+            for i, size in enumerate(sizes, start=1):
+                title = f'{rng.choice(_ADJECTIVES)} {rng.choice(_TOPICS)} {i}'
+                course_rows.append({
+                    'id': i, 'title': title[:50], 'description': f'A course about {title.lower()}.'[:150],
+                    'icon': 'default_course.jpg', 'updated_at': now, 'progress_bits': size,
+                    'progress_mask': ((1 << size) - 1).to_bytes((size + 7) // 8, 'little'),
+                })
+            _insert(connection, models.Course.__table__, course_rows)
+            timings['courses'] = time.perf_counter() - started
+            log(f'{len(course_rows)} courses in {timings["courses"]:.1f}s')
+
+            started = time.perf_counter()
+            pool = _paragraphs(rng)
+            authors = max(1, users // 10)
+            first_lesson = {}
+
+            def lesson_rows():
+                lesson_id = 0
+                for course_id, size in enumerate(sizes, start=1):
+                    first_lesson[course_id] = lesson_id + 1
+                    posted = now - timedelta(days=rng.randrange(700))
+                    author = rng.randint(1, authors)
+                    for position in range(size):
+                        lesson_id += 1
+                        posted += timedelta(hours=rng.randrange(1, 72))
+                        word = rng.choice(_WORDS)
+                        yield {
+                            'id': lesson_id, 'title': f'{word.capitalize()} {rng.choice(_WORDS)} {position + 1}',
+                            'date_posted': posted, 'updated_at': posted, 'content': _content(rng, pool),
+                            'thumbnail': 'default.jpg', 'slug': f'{word}-{lesson_id}'[:32],
+                            'user_id': author if rng.random() < 0.8 else rng.randint(1, authors),
+                            'course_id': course_id, 'position': (position + 1) * 1024, 'progress_bit': position,
+                        }
+            _stream(connection, models.Lesson.__table__, lesson_rows())
+            timings['lessons'] = time.perf_counter() - started
+            log(f'{sum(sizes)} lessons in {timings["lessons"]:.1f}s')
+
+            started = time.perf_counter()
+            pairs = set()
+            while len(pairs) < min(enrollments, users * len(sizes)):
+                pairs.add((rng.randint(1, users), rng.randint(1, len(sizes))))
+            enrollment_rows = []
+            for user_id, course_id in sorted(pairs):
+                done = rng.randint(0, sizes[course_id - 1])
+                enrollment_rows.append({
+                    'user_id': user_id, 'course_id': course_id, 'enrolled_at': now,
+                    'completed': ((1 << done) - 1).to_bytes((done + 7) // 8, 'little'),
+                    'last_lesson_id': first_lesson[course_id] + max(0, done - 1) if done else None,
+                    'last_seen_at': now,
+                })
+            _insert(connection, models.Enrollment.__table__, enrollment_rows)
+            timings['enrollments'] = time.perf_counter() - started
+            log(f'{len(enrollment_rows)} enrollments in {timings["enrollments"]:.1f}s')
+
+        if rollup:
+            import analytics
+            started = time.perf_counter()
+            analytics.rollup(full=True)
+            timings['rollup'] = time.perf_counter() - started
+            log(f'rollups in {timings["rollup"]:.1f}s')
+        with engine.connect() as connection:
+            connection.exec_driver_sql('ANALYZE')
+            # Move everything from the -wal file into the database file, so
+            # its size (and a plain copy of it) covers all the data
+            connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    return {'users': users, 'courses': len(sizes), 'lessons': sum(sizes),
+            'enrollments': len(enrollment_rows), 'seed': seed, 'timings': timings}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='SQLite file to create')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--courses', type=int)
+    parser.add_argument('--lessons', type=int)
+    parser.add_argument('--enrollments', type=int, help='default: half the number of users')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-rollup', action='store_true', help="skip rebuilding the analytics rollups")
+    args = parser.parse_args(argv)
+    users, courses, lessons = SCALES[args.scale]
+    started = time.perf_counter()
+    summary = generate(args.path, args.users or users, args.courses or courses, args.lessons or lessons,
+                       args.enrollments, args.seed, rollup=not args.no_rollup)
+    size = os.path.getsize(args.path) / 2 ** 20
+    print(f"{summary['users']} users, {summary['courses']} courses, {summary['lessons']} lessons, "
+          f"{summary['enrollments']} enrollments: {size:.1f} MB in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Cold-start budget check built on ``python -X importtime``.
+
+Runs each startup step in a fresh interpreter, sums the per-module import
+times it reports and fails (exit status 1) when the median goes over its
+budget or when a module that should load lazily shows up. Run from the
+repository root, e.g. in CI:
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --runs 10 --top 20
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+# (name, code, budget in ms, modules that must not be imported)
+STEPS = [
+    ('import app', 'import app', 1000, ('PIL', 'flask_mail', 'numpy', 'alembic', 'admin', 'models')),
+    ('create_app()', 'import app; app.create_app()', 1500, ('PIL', 'flask_mail', 'numpy')),
+]
+
+
+def measure(code):
+    """(total ms, {top-level module: cumulative ms}) for one cold run"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit(f'{code!r} failed:\n{result.stderr[-2000:]}')
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        total += int(self_us)
+        modules[name] = int(cumulative_us) / 1000
+    return total / 1000, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='cold runs per step (median is compared)')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list per step')
+    parser.add_argument('--scale', type=float, default=float(os.getenv('STARTUP_BUDGET_SCALE', 1.0)),
+                        help='multiply every budget, for slower CI machines')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name, code, budget, forbidden in STEPS:
+        runs = [measure(code) for _ in range(args.runs)]
+        median = statistics.median(total for total, _ in runs)
+        modules = runs[-1][1]
+        budget *= args.scale
+        status = 'ok' if median <= budget else 'OVER BUDGET'
+        print(f'{name}: median {median:.0f} ms over {args.runs} runs (budget {budget:.0f} ms) {status}')
+        slowest = sorted(((ms, module) for module, ms in modules.items() if '.' not in module), reverse=True)
+        for ms, module in slowest[:args.top]:
+            print(f'  {ms:8.1f} ms  {module}')
+        loaded = [module for module in forbidden if module in modules]
+        if loaded:
+            print(f'  should load lazily but was imported: {", ".join(loaded)}')
+        failed = failed or median > budget or bool(loaded)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
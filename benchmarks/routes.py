@@ -0,0 +1,265 @@
+"""Latency and throughput of the public, API and admin pages.
+
+Runs against a database made by ``benchmarks/datagen.py`` (``--db``), or
+generates a fresh one at ``--scale`` in a temporary directory. Every
+scenario is a GET of one page, as an anonymous visitor, an enrolled reader
+or the admin (user 1), and runs two ways:
+
+* ``client``: ``--iterations`` sequential requests through the Flask test
+  client, after ``--warmup`` untimed ones; p50/p95/mean latency in ms.
+* ``http``: ``--requests`` requests from ``--concurrency`` threads to a
+  local threaded HTTP server; requests per second and latency.
+
+Results go to ``--save`` as JSON. With ``--baseline``, a scenario whose p50
+got more than ``--threshold`` slower than the baseline's fails the run
+(exit status 1), so a saved run on the same machine is a regression gate.
+
+    python benchmarks/datagen.py /tmp/bench.db --scale small
+    python benchmarks/routes.py --db /tmp/bench.db --save benchmarks/results/baseline.json
+    python benchmarks/routes.py --db /tmp/bench.db --baseline benchmarks/results/baseline.json
+    python benchmarks/routes.py --only lesson course --skip-http
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def _scenarios(sample):
+    """``(name, who, url)`` for every page; ``who`` is None, 'reader' or 'admin'"""
+    course = quote(sample['course_title'])
+    lesson = quote(sample['lesson_slug'])
+    return [
+        ('home', None, '/'),
+        ('about', None, '/about'),
+        ('dashboard', 'reader', '/dashboard'),
+        ('allcourses', 'reader', '/courses/allcourses'),
+        ('allcourses_last_page', 'reader', f'/courses/allcourses?page={sample["course_pages"]}'),
+        ('course', 'reader', f'/courses/course/{course}'),
+        ('course_last_page', 'reader', f'/courses/course/{course}?page={sample["lesson_pages"]}'),
+        ('lesson', 'reader', f'/lessons/lesson/{lesson}'),
+        ('author', 'reader', f'/users/author/{sample["author_id"]}'),
+        ('typeahead', 'reader', '/courses/typeahead?q=intro'),
+        ('api_courses', 'reader', '/api/v1/courses'),
+        ('api_course_outline', 'reader', f'/api/v1/courses/{sample["course_id"]}/outline'),
+        ('api_lessons', 'reader', f'/api/v1/lessons?course_id={sample["course_id"]}'),
+        ('api_lesson', 'reader', f'/api/v1/lessons/{lesson}'),
+        ('admin_dashboard', 'admin', '/admin'),
+        ('admin_users', 'admin', '/admin/users'),
+        ('admin_users_search', 'admin', '/admin/users?q=user1'),
+        ('admin_courses', 'admin', '/admin/courses'),
+        ('admin_lessons', 'admin', '/admin/lessons'),
+        ('admin_lessons_by_course', 'admin', f'/admin/lessons?course={sample["course_id"]}'),
+        ('admin_statistics', 'admin', '/admin/stats'),
+    ]
+
+
+def _sample(db, models):
+    """Pages worth measuring: the biggest course, a lesson in its middle, an active reader"""
+    from sqlalchemy import func
+    Lesson, Course, Enrollment = models.Lesson, models.Course, models.Enrollment
+    course_id, size = (db.session.query(Lesson.course_id, func.count())
+                       .group_by(Lesson.course_id).order_by(func.count().desc()).first())
+    lesson = (Lesson.query.filter_by(course_id=course_id)
+              .order_by(Lesson.position).offset(size // 2).first())
+    reader = (db.session.query(Enrollment.user_id).group_by(Enrollment.user_id)
+              .order_by(func.count().desc()).limit(1).scalar())
+    return {
+        'course_id': course_id,
+        'course_title': db.session.get(Course, course_id).title,
+        'course_pages': max(1, math.ceil(Course.query.count() / 6)),
+        'lesson_pages': max(1, math.ceil(size / 6)),
+        'lesson_slug': lesson.slug,
+        'author_id': lesson.user_id,
+        'reader_id': reader or 1,
+        'admin_id': 1,
+    }
+
+
+def _summary(samples, elapsed=None):
+    samples = sorted(samples)
+    result = {
+        'requests': len(samples),
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+    }
+    if elapsed:
+        result['rps'] = round(len(samples) / elapsed, 1)
+    return result
+
+
+def _session_cookie(app, user_id):
+    """A signed Flask-Login session for ``user_id``, usable by any HTTP client"""
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({'_user_id': str(user_id), '_fresh': True})
+
+
+def run_client(app, scenarios, cookies, iterations, warmup):
+    results = {}
+    clients = {}
+    for who, cookie in cookies.items():
+        client = app.test_client()
+        if cookie:
+            client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+        clients[who] = client
+    for name, who, url in scenarios:
+        client = clients[who]
+        for _ in range(warmup):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise SystemExit(f'{name}: GET {url} returned {response.status_code}')
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            client.get(url)
+            samples.append(time.perf_counter() - started)
+        results[name] = _summary(samples)
+        print(f'client {name:26} p50 {results[name]["p50_ms"]:8.2f} ms  p95 {results[name]["p95_ms"]:8.2f} ms')
+    return results
+
+
+def run_http(app, scenarios, cookies, requests, concurrency):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    local = threading.local()
+
+    def fetch(url, cookie):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        headers = {'Cookie': f'{app.config["SESSION_COOKIE_NAME"]}={cookie}'} if cookie else {}
+        started = time.perf_counter()
+        try:
+            connection.request('GET', url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            local.connection = None
+            raise
+        if response.will_close:
+            connection.close()
+            local.connection = None
+        if response.status != 200:
+            raise RuntimeError(f'GET {url} returned {response.status}')
+        return time.perf_counter() - started
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(concurrency) as pool:
+            for name, who, url in scenarios:
+                list(pool.map(lambda _: fetch(url, cookies[who]), range(concurrency)))  # warm up
+                started = time.perf_counter()
+                samples = list(pool.map(lambda _: fetch(url, cookies[who]), range(requests)))
+                results[name] = _summary(samples, time.perf_counter() - started)
+                print(f'http   {name:26} {results[name]["rps"]:8.1f} req/s  p50 {results[name]["p50_ms"]:8.2f} ms')
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Scenarios whose p50 grew more than ``threshold`` (a fraction) over the baseline"""
+    regressions = []
+    for mode, scenarios in results['results'].items():
+        for name, current in scenarios.items():
+            before = baseline.get('results', {}).get(mode, {}).get(name)
+            if before and current['p50_ms'] > before['p50_ms'] * (1 + threshold):
+                regressions.append((mode, name, before['p50_ms'], current['p50_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='database made by datagen.py (default: generate one)')
+    parser.add_argument('--scale', default='tiny', help='datagen scale when generating (default: tiny)')
+    parser.add_argument('--only', nargs='*', help='run scenarios whose name contains any of these')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=200, help='HTTP requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--save', default=os.path.join(RESULTS, 'latest.json'))
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50 slowdown (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix='raven-bench-')
+    if args.db is None:
+        import datagen
+        from datagen import SCALES
+        args.db = os.path.join(scratch, 'bench.db')
+        datagen.generate(args.db, *SCALES[args.scale], log=lambda line: None)
+    # View events, metrics and the cache go to the scratch directory. The data
+    # set itself only gets the reader's "continue" pointer moved by the lesson
+    # scenarios (progress.py's seen log), which doesn't change any page's size
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.db)
+    os.environ['ANALYTICS_DATABASE_URL'] = 'sqlite:///' + os.path.join(scratch, 'analytics.db')
+    os.environ['METRICS_DIR'] = os.path.join(scratch, 'metrics')
+    os.environ['CACHE_DIR'] = os.path.join(scratch, 'cache')
+    sys.path.insert(0, ROOT)
+    from app import create_app, db
+    import models
+
+    app = create_app()
+    with app.app_context():
+        sample = _sample(db, models)
+        counts = {name: model.query.count() for name, model in
+                  (('users', models.User), ('courses', models.Course), ('lessons', models.Lesson))}
+    scenarios = [scenario for scenario in _scenarios(sample)
+                 if not args.only or any(part in scenario[0] for part in args.only)]
+    cookies = {None: None, 'reader': _session_cookie(app, sample['reader_id']),
+               'admin': _session_cookie(app, sample['admin_id'])}
+
+    results = {
+        'meta': {
+            'created': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'data': counts,
+            'iterations': args.iterations,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': {'client': run_client(app, scenarios, cookies, args.iterations, args.warmup)},
+    }
+    if not args.skip_http:
+        results['results']['http'] = run_http(app, scenarios, cookies, args.requests, args.concurrency)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+    with open(args.save, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'saved {args.save}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for mode, name, before, after in regressions:
+            print(f'REGRESSION {mode} {name}: p50 {before:.2f} ms -> {after:.2f} ms')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Memory footprint and latency of the title suggestion index.
+
+Builds a ``suggest.TitleIndex`` over ``--titles`` synthetic course and
+lesson titles (no database) and reports the memory it holds (measured
+with tracemalloc, so the titles passed in are not counted), build time,
+lookup latency for random 1-6 character prefixes, and the cost of adding
+and removing one title on the full index.
+
+    python benchmarks/suggest_index.py
+    python benchmarks/suggest_index.py --titles 1000000 --lookups 20000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _titles(count, seed):
+    from datagen import _ADJECTIVES, _TOPICS, _WORDS
+    rng = random.Random(seed)
+    courses = count // 100
+    for i in range(courses):
+        yield 'course', i + 1, f'{rng.choice(_ADJECTIVES)} {rng.choice(_TOPICS)} {i + 1}'
+    for i in range(count - courses):
+        words = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 6)))
+        yield 'lesson', i + 1, f'{words.capitalize()}: part {rng.randint(1, 40)}'
+
+
+def _ms(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples) * 1000, 4),
+        'p99_ms': round(samples[int(len(samples) * 0.99)] * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, ROOT)
+    from suggest import Suggestion, TitleIndex
+
+    items = [Suggestion(kind, id, title, f'slug-{id}' if kind == 'lesson' else None, 1 if kind == 'lesson' else None)
+             for kind, id, title in _titles(args.titles, args.seed)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    index = TitleIndex.build(items)
+    build_seconds = time.perf_counter() - started
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    rng = random.Random(args.seed)
+    words = [title.split()[rng.randrange(len(title.split()))] for title in
+             (item.title for item in rng.sample(items, min(len(items), args.lookups)))]
+    prefixes = [word[:rng.randint(1, 6)] for word in words]
+    lookups, hits = [], 0
+    for prefix in prefixes:
+        started = time.perf_counter()
+        hits += bool(index.search(prefix, 10))
+        lookups.append(time.perf_counter() - started)
+
+    updates = []
+    for i in range(200):
+        item = Suggestion('lesson', 10 ** 9 + i, f'{rng.choice(words)} added title {i}', 'new', 1)
+        started = time.perf_counter()
+        index.add(item)
+        index.remove(item.kind, item.id)
+        updates.append(time.perf_counter() - started)
+
+    report = {
+        'titles': len(items),
+        'entries': sum(len(entries) for entries in index.entries),
+        'build_seconds': round(build_seconds, 3),
+        'memory_mb': round(held / 2 ** 20, 2),
+        'bytes_per_title': round(held / len(items), 1),
+        'entries_mb': round(sum(entries.itemsize * len(entries) for entries in index.entries) / 2 ** 20, 2),
+        'lookup': dict(_ms(lookups), count=len(lookups), with_results=hits),
+        'add_and_remove': _ms(updates),
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Cold template latency with and without the bytecode cache.
+
+Each measurement runs in a fresh interpreter, like a newly forked worker:
+it times loading every template under ``raven/templates`` and the first
+render of ``about.html`` (which pulls in ``base.html``). The bytecode run
+uses a cache filled by ``flask templates compile`` beforehand. Exits
+non-zero when the cache isn't at least ``--min-speedup`` times faster.
+
+    python benchmarks/template_render.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, time
+from app import create_app
+from template_cache import app_templates
+from flask import render_template
+app = create_app()
+started = time.perf_counter()
+for name in app_templates(app):
+    app.jinja_env.get_template(name)
+load = time.perf_counter() - started
+app.jinja_env.cache.clear()
+with app.test_request_context('/about'):
+    started = time.perf_counter()
+    render_template('about.html')
+    render = time.perf_counter() - started
+print(json.dumps({'load': load * 1000, 'render': render * 1000}))
+"""
+
+
+def _run(code, **env):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, **env))
+    if result.returncode:
+        raise SystemExit(result.stderr[-2000:])
+    return result.stdout
+
+
+def measure(runs, **env):
+    samples = [json.loads(_run(_PROBE, **env).splitlines()[-1]) for _ in range(runs)]
+    return {key: statistics.median(sample[key] for sample in samples) for key in ('load', 'render')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--min-speedup', type=float, default=1.5,
+                        help='required source/bytecode ratio for loading all templates')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        source = measure(args.runs, TEMPLATE_BYTECODE_CACHE='false')
+        _run('from app import create_app\n'
+             'from template_cache import compile_command\n'
+             'create_app().test_cli_runner().invoke(compile_command)',
+             TEMPLATE_CACHE_DIR=cache_dir)
+        cached = measure(args.runs, TEMPLATE_BYTECODE_CACHE='true', TEMPLATE_CACHE_DIR=cache_dir)
+
+    for key, label in (('load', 'load all templates'), ('render', 'first render of about.html')):
+        print(f'{label}: source {source[key]:.1f} ms, bytecode {cached[key]:.1f} ms '
+              f'({source[key] / cached[key]:.1f}x)')
+    return 0 if source['load'] / cached['load'] >= args.min_speedup else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
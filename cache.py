@@ -0,0 +1,521 @@
+"""Application cache with tag-based invalidation.
+
+``CACHE_BACKEND`` picks where values live:
+
+``memory``      a TTL-bounded LRU in each worker process (the default)
+``filesystem``  pickles under ``CACHE_DIR``, shared by workers on one host
+``redis``       any server speaking the Redis protocol at ``CACHE_REDIS_URL``
+
+Memoize a query function with ``@cached_query``; its arguments are part of
+the key, and ``tags`` (a list, or a callable taking the same arguments)
+name what the result depends on::
+
+    @cached_query(tags=lambda course_id: [f'course:{course_id}'])
+    def lesson_count(course_id):
+        return Lesson.query.filter_by(course_id=course_id).count()
+
+Cache plain values (numbers, tuples, dicts, ``Row`` objects), never ORM
+instances: cached values are pickled and come back detached.
+
+When a transaction that inserted, changed or deleted a ``User``, ``Course``
+or ``Lesson`` commits, whether through the unit of work or a set-based
+``Query.update()``/``.delete()``, the tags those rows feed are published on
+``invalidation_bus``. The cache subscribes and stores a fresh random
+version for each tag; an entry remembers the versions it was filled under
+and is a miss once any of them changes. Tags are:
+
+``users`` / ``courses`` / ``lessons``   any row of that model
+``author:<id>``   that user or any lesson they wrote
+``course:<id>``   that course or any lesson in it
+``lesson:<id>``   that lesson
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+import models
+
+cache_cli = AppGroup('cache', help='Application cache commands.')
+
+_MISSING = object()
+_TAG_PREFIX = '_tag:'
+
+
+# ------------------------
+# Backends
+# ------------------------
+
+class MemoryBackend:
+    """Per-process LRU; entries expire after their TTL"""
+    name = 'memory'
+
+    def __init__(self, max_entries=5000, **options):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, data, ttl=None):
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def add(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                return False
+            self._entries[key] = (data, None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+class FileSystemBackend:
+    """One pickle file per key, written atomically; oldest files go first when full"""
+    name = 'filesystem'
+
+    def __init__(self, directory, max_entries=5000, **options):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at, data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return None
+        return data
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def _write_temp(self, data, ttl):
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + ttl if ttl else None, data), f, pickle.HIGHEST_PROTOCOL)
+        return temp
+
+    def set(self, key, data, ttl=None):
+        os.replace(self._write_temp(data, ttl), self._path(key))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def add(self, key, data):
+        temp = self._write_temp(data, None)
+        try:
+            os.link(temp, self._path(key))  # fails if the key exists
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(temp)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _files(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.name.endswith('.cache')]
+
+    def _prune(self):
+        files = self._files()
+        excess = len(files) - self.max_entries
+        if excess <= 0:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:excess]:
+            try:
+                os.remove(entry.path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for entry in self._files():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {'entries': len(self._files()), 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+class RedisBackend:
+    """Keys under ``CACHE_KEY_PREFIX`` on a Redis-protocol server; it handles eviction"""
+    name = 'redis'
+
+    def __init__(self, url, prefix='academy:', **options):
+        import redis  # only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def get_many(self, keys):
+        return self.client.mget([self.prefix + key for key in keys]) if keys else []
+
+    def set(self, key, data, ttl=None):
+        self.client.set(self.prefix + key, data, ex=ttl or None)
+
+    def add(self, key, data):
+        return bool(self.client.set(self.prefix + key, data, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*', count=500))
+        for start in range(0, len(keys), 500):
+            self.client.delete(*keys[start:start + 500])
+
+    def stats(self):
+        info = self.client.info('stats')
+        return {
+            'entries': sum(1 for _ in self.client.scan_iter(match=self.prefix + '*', count=500)),
+            'max_entries': None,
+            'evictions': info.get('evicted_keys', 0),
+        }
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'filesystem': FileSystemBackend,
+    'redis': RedisBackend,
+}
+
+
+# ------------------------
+# Cache
+# ------------------------
+
+class Cache:
+    """Tagged get/set over a backend, with this worker's hit and miss counts"""
+
+    def __init__(self, backend, default_ttl=None):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.hits = self.misses = 0
+
+    def _tag_versions(self, tags):
+        if not tags:
+            return {}
+        keys = [_TAG_PREFIX + tag for tag in tags]
+        versions = self.backend.get_many(keys)
+        for i, version in enumerate(versions):
+            if version is None:
+                # First use, or the version was evicted: anything stored
+                # under an older version must not match, so start afresh
+                self.backend.add(keys[i], uuid.uuid4().bytes)
+                versions[i] = self.backend.get(keys[i])
+        return dict(zip(tags, versions))
+
+    def get(self, key, default=None):
+        data = self.backend.get(key)
+        if data is not None:
+            try:
+                versions, value = pickle.loads(data)
+            except Exception:
+                versions, value = None, _MISSING
+            if value is not _MISSING and self._tag_versions(list(versions)) == versions:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def set(self, key, value, tags=(), ttl=None, versions=None):
+        if versions is None:
+            versions = self._tag_versions(list(tags))
+        data = pickle.dumps((versions, value), pickle.HIGHEST_PROTOCOL)
+        self.backend.set(key, data, ttl if ttl is not None else self.default_ttl)
+
+    def get_or_set(self, key, create, tags=(), ttl=None):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        # Versions are read before computing, so a commit landing meanwhile
+        # leaves this entry already stale
+        versions = self._tag_versions(list(tags))
+        value = create()
+        self.set(key, value, ttl=ttl, versions=versions)
+        return value
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.set(_TAG_PREFIX + tag, uuid.uuid4().bytes)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            self.backend.stats(),
+            backend=self.backend.name,
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=self.hits / lookups if lookups else None,
+        )
+
+
+def get_cache():
+    return current_app.extensions['cache']
+
+
+def cached_query(tags=(), ttl=None):
+    """Memoize a function's return value per arguments, invalidated by ``tags``"""
+    def decorator(fn):
+        name = f'{fn.__module__}.{fn.__qualname__}'
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            from db_routing import use_primary
+            key = f'query:{name}:{args!r}:{sorted(kwargs.items())!r}'
+            resolved = tags(*args, **kwargs) if callable(tags) else tags
+
+            def fill():
+                # A lagging replica could refill the cache with what a
+                # commit just invalidated
+                with use_primary():
+                    return fn(*args, **kwargs)
+            return get_cache().get_or_set(key, fill, resolved, ttl)
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+# ------------------------
+# Invalidation bus
+# ------------------------
+
+class InvalidationBus:
+    """Fans out the tags of each committed transaction to subscribers"""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def publish(self, tags):
+        for callback in self._subscribers:
+            callback(tags)
+
+
+invalidation_bus = InvalidationBus()
+
+
+def _old_value(state, name):
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else None
+
+
+def _tags_for(session, obj):
+    state = inspect(obj)
+    if isinstance(obj, models.Course):
+        return {'courses', f'course:{obj.id}'}
+    if isinstance(obj, models.Lesson):
+        tags = {'lessons', f'lesson:{obj.id}', f'course:{obj.course_id}', f'author:{obj.user_id}'}
+        # A lesson moved to another course or author leaves the old one too
+        for name, prefix in (('course_id', 'course'), ('user_id', 'author')):
+            old = _old_value(state, name)
+            if old is not None:
+                tags.add(f'{prefix}:{old}')
+        return tags
+    if isinstance(obj, models.User):
+        tags = {'users', f'author:{obj.id}'}
+        if state.attrs.deleted_at.history.has_changes():
+            # Soft-deleting an author hides their lessons everywhere
+            lessons = models.Lesson.__table__
+            course_ids = session.execute(
+                select(lessons.c.course_id).where(lessons.c.user_id == obj.id).distinct()
+            ).scalars()
+            tags.add('lessons')
+            tags.update(f'course:{course_id}' for course_id in course_ids)
+        return tags
+    return set()
+
+
+def _set_values(statement):
+    """``{column name: new value}`` of an UPDATE's literal SET clauses"""
+    values = {}
+    for column, value in (getattr(statement, '_values', None) or {}).items():
+        name = column if isinstance(column, str) else column.key
+        values[name] = getattr(value, 'value', None)
+    return values
+
+
+def _bulk_tags(session, model, statement, parameters):
+    """Tags for the rows a set-based UPDATE or DELETE on ``model`` is about to touch"""
+    table = model.__table__
+    if isinstance(parameters, (list, tuple)):
+        # Bulk UPDATE by primary key: one parameter set per row
+        criteria = table.c.id.in_([row['id'] for row in parameters if 'id' in row])
+    else:
+        criteria = statement.whereclause
+    query = select(*(table.c[name] for name in ('id', 'course_id', 'user_id') if name in table.c))
+    if criteria is not None:
+        query = query.where(criteria)
+    # Straight on the connection, so the soft-delete filter can't hide rows
+    rows = session.connection().execute(query).all()
+    values = _set_values(statement) if not statement.is_delete else {}
+
+    if model is models.Course:
+        return {'courses'} | {f'course:{row.id}' for row in rows}
+    if model is models.Lesson:
+        tags = {'lessons'}
+        for row in rows:
+            tags |= {f'lesson:{row.id}', f'course:{row.course_id}', f'author:{row.user_id}'}
+        for name, prefix in (('course_id', 'course'), ('user_id', 'author')):
+            if values.get(name) is not None:
+                tags.add(f'{prefix}:{values[name]}')
+        return tags
+    tags = {'users'} | {f'author:{row.id}' for row in rows}
+    if rows and (statement.is_delete or 'deleted_at' in values):
+        lessons = models.Lesson.__table__
+        course_ids = session.connection().execute(
+            select(lessons.c.course_id).where(lessons.c.user_id.in_([row.id for row in rows])).distinct()
+        ).scalars()
+        tags.add('lessons')
+        tags.update(f'course:{course_id}' for course_id in course_ids)
+    return tags
+
+
+def _collect_bulk_tags(execute_state):
+    # Query.update()/.delete() and update()/delete() statements skip the
+    # flush, so after_flush never sees the rows they change
+    if not (execute_state.is_update or execute_state.is_delete):
+        return
+    mapper = execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    if model not in (models.User, models.Course, models.Lesson):
+        return
+    session = execute_state.session
+    tags = session.info.setdefault('cache_tags', set())
+    tags |= _bulk_tags(session, model, execute_state.statement, execute_state.parameters)
+
+
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault('cache_tags', set())
+    for obj in session.new | session.deleted:
+        tags |= _tags_for(session, obj)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tags |= _tags_for(session, obj)
+
+
+def _publish_committed(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags and has_app_context():
+        invalidation_bus.publish(tags)
+
+
+def _forget_tags(session, previous_transaction=None):
+    session.info.pop('cache_tags', None)
+
+
+def _invalidate_app_cache(tags):
+    if 'cache' in current_app.extensions:
+        current_app.extensions['cache'].invalidate(*tags)
+
+
+def init_cache(app):
+    app.config.setdefault('CACHE_BACKEND', 'memory')
+    app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+    app.config.setdefault('CACHE_MAX_ENTRIES', 5000)
+    app.config.setdefault('CACHE_DIR', None)
+    app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config.setdefault('CACHE_KEY_PREFIX', 'academy:')
+    name = app.config['CACHE_BACKEND']
+    if name not in BACKENDS:
+        raise RuntimeError(f"Unknown CACHE_BACKEND {name!r}; choose one of {', '.join(BACKENDS)}")
+    backend = BACKENDS[name](
+        max_entries=app.config['CACHE_MAX_ENTRIES'],
+        directory=app.config['CACHE_DIR'] or os.path.join(app.instance_path, 'cache'),
+        url=app.config['CACHE_REDIS_URL'],
+        prefix=app.config['CACHE_KEY_PREFIX'],
+    )
+    app.extensions['cache'] = Cache(backend, app.config['CACHE_DEFAULT_TTL'])
+
+    invalidation_bus.subscribe(_invalidate_app_cache)
+    for name, listener in (('after_flush', _collect_tags), ('do_orm_execute', _collect_bulk_tags),
+                           ('after_commit', _publish_committed), ('after_rollback', _forget_tags)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+    app.cli.add_command(cache_cli)
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@cache_cli.command('clear')
+def clear_command():
+    """Drop every cached value (e.g. after a deploy that changes cached shapes)."""
+    get_cache().clear()
+    click.echo(f"Cleared the {current_app.config['CACHE_BACKEND']} cache.")
+
+
+@cache_cli.command('stats')
+def stats_command():
+    """Show the cache's size and eviction counts."""
+    for key, value in get_cache().stats().items():
+        click.echo(f'{key}: {value}')
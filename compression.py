@@ -0,0 +1,153 @@
+"""gzip/brotli response compression.
+
+Every response whose mimetype is in ``COMPRESS_MIMETYPES`` gets
+``Vary: Accept-Encoding``. It is compressed with the first coding in
+``COMPRESS_ALGORITHMS`` the client accepts (brotli only when the ``Brotli``
+package is installed) if it is at least ``COMPRESS_MIN_SIZE`` bytes.
+Streamed responses are compressed chunk by chunk and flushed as they go,
+so the client still sees output early. Static files are compressed once
+per file version and kept in a small in-memory cache.
+
+Levels come from ``COMPRESS_LEVELS`` and can be overridden per endpoint,
+either in ``COMPRESS_ENDPOINT_LEVELS`` or with ``@compression_level`` on the
+view::
+
+    @compression_level(gzip=9, br=8)   # smaller, more CPU
+    @compression_level(gzip=1, br=1)   # big, rarely cached pages
+"""
+import gzip
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app, request
+
+_static_cache = OrderedDict()
+_static_cache_lock = Lock()
+
+
+def compression_level(**levels):
+    """Override ``COMPRESS_LEVELS`` (``gzip=``, ``br=``) for one view"""
+    def decorator(view):
+        view.compression_levels = levels
+        return view
+    return decorator
+
+
+def _brotli():
+    return current_app.extensions.get('brotli')
+
+
+def _choose_encoding(app):
+    accepted = request.accept_encodings
+    for coding in app.config['COMPRESS_ALGORITHMS']:
+        if coding == 'br' and _brotli() is None:
+            continue
+        if accepted[coding]:
+            return coding
+    return None
+
+
+def _levels(app):
+    levels = dict(app.config['COMPRESS_LEVELS'])
+    levels.update(app.config['COMPRESS_ENDPOINT_LEVELS'].get(request.endpoint, {}))
+    view = app.view_functions.get(request.endpoint)
+    levels.update(getattr(view, 'compression_levels', {}))
+    return levels
+
+
+def _compress(data, coding, level):
+    if coding == 'br':
+        return _brotli().compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _compress_stream(chunks, coding, level, brotli):
+    # Runs after the request has ended, so everything comes in as arguments
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+        compress, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _cached_static(app, response, coding, level):
+    key = (request.path, response.get_etag()[0], coding, level)
+    with _static_cache_lock:
+        if key in _static_cache:
+            _static_cache.move_to_end(key)
+            return _static_cache[key]
+    body = _compress(response.get_data(), coding, level)
+    with _static_cache_lock:
+        _static_cache[key] = body
+        while len(_static_cache) > app.config['COMPRESS_STATIC_CACHE_SIZE']:
+            _static_cache.popitem(last=False)
+    return body
+
+
+def compress_response(response):
+    app = current_app
+    if (not app.config['COMPRESS'] or response.mimetype not in app.config['COMPRESS_MIMETYPES']
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = _choose_encoding(app)
+    if coding is None:
+        return response
+    level = _levels(app)[coding]
+
+    if response.is_streamed and not response.direct_passthrough:
+        response.response = _compress_stream(response.response, coding, level, _brotli())
+        response.headers.pop('Content-Length', None)
+    else:
+        if response.content_length is not None and response.content_length < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.direct_passthrough = False
+        if request.endpoint == 'static' and response.get_etag()[0]:
+            body = _cached_static(app, response, coding, level)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            body = _compress(data, coding, level)
+        response.set_data(body)
+
+    response.headers['Content-Encoding'] = coding
+    # The compressed bytes differ from the original, so a strong tag no
+    # longer identifies them; weak tags still revalidate (304) as before
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS', True)
+    app.config.setdefault('COMPRESS_ALGORITHMS', ('br', 'gzip'))
+    app.config.setdefault('COMPRESS_LEVELS', {'gzip': 6, 'br': 4})
+    app.config.setdefault('COMPRESS_ENDPOINT_LEVELS', {})
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_STATIC_CACHE_SIZE', 256)
+    app.config.setdefault('COMPRESS_MIMETYPES', (
+        'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+        'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+    ))
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    app.extensions['brotli'] = brotli
+    app.after_request(compress_response)
@@ -0,0 +1,125 @@
+"""Conditional GET for the course and lesson pages.
+
+``Course.updated_at`` and ``Lesson.updated_at`` are stamped by a
+``before_flush`` hook whenever the ORM inserts or changes one of those rows.
+A page decorated with ``@conditional(version_func)`` first asks
+``version_func`` for the handful of values its HTML depends on (cheap,
+indexed lookups), and answers ``304 Not Modified`` when the browser's
+``If-None-Match``/``If-Modified-Since`` still match, before the view runs
+its real queries or renders anything.
+
+The ETag also covers the viewer's role (admins get an extra menu) and a
+salt that changes with the templates, so a deploy invalidates old copies.
+"""
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app import db
+import models
+
+
+# ------------------------
+# updated_at maintenance
+# ------------------------
+
+def _touch_updated_at(session, flush_context, instances):
+    now = datetime.utcnow()
+    for obj in session.new:
+        if isinstance(obj, (models.Course, models.Lesson)) and obj.updated_at is None:
+            obj.updated_at = now
+    for obj in session.dirty:
+        if (isinstance(obj, (models.Course, models.Lesson))
+                and session.is_modified(obj, include_collections=False)):
+            obj.updated_at = now
+
+
+# ------------------------
+# Validators
+# ------------------------
+
+def _templates_salt(app):
+    newest = 0
+    for root, _, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        for name in files:
+            newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+    return str(int(newest))
+
+
+def latest(*stamps):
+    """The newest of ``stamps``, ignoring missing ones, for ``Last-Modified``"""
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+def course_lessons_version(course_id):
+    """Count and newest ``updated_at`` of a course's visible lessons"""
+    Lesson = models.Lesson
+    return (
+        db.session.query(func.count(Lesson.id), func.max(Lesson.updated_at))
+        .filter(Lesson.course_id == course_id)
+        .one()
+    )
+
+
+def _etag(parts):
+    role = 'admin' if current_user.is_authenticated and current_user.is_admin else 'user'
+    raw = repr((current_app.config['ETAG_SALT'], role, *parts)).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+def conditional(version_func):
+    """Answer 304 from ``version_func(**view_args)`` before running the view.
+
+    ``version_func`` returns ``(parts, last_modified)``, where ``parts`` is a
+    tuple of everything the page renders from, or ``None`` to just run the
+    view (e.g. so it can 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message is part of the page; never reuse it
+            if not current_app.config['CONDITIONAL_GET'] or session.get('_flashes'):
+                return view(*args, **kwargs)
+            version = version_func(**kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+            parts, last_modified = version
+            etag = _etag(parts)
+
+            probe = make_response('')
+            _set_validators(probe, etag, last_modified)
+            probe.make_conditional(request)
+            if probe.status_code == 304:
+                return probe
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def _set_validators(response, etag, last_modified):
+    # Weak, as compression.py would make it on a compressed 200, so the 304
+    # and both kinds of 200 carry the same validator
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Always revalidate; the copy belongs to this browser only
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+
+def init_conditional_get(app):
+    app.config.setdefault('CONDITIONAL_GET', True)
+    if not app.config.get('ETAG_SALT'):
+        app.config['ETAG_SALT'] = _templates_salt(app)
+    if not event.contains(Session, 'before_flush', _touch_updated_at):
+        event.listen(Session, 'before_flush', _touch_updated_at)
@@ -7,6 +7,48 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'a89bd3ef4d39e3d714ad203ede60870626d2f050e298241907523af47c35ccbda9e4ee1b5678d68b1cbfaa0ae269e9d5a2ad4e1e1e53125c877ab516332f3c78')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///site.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Engine tuning, see engine_profiles.py. SQLite gets its pragmas on every
+    # new connection; server databases (Postgres, MySQL) get the pool settings
+    DB_PROFILE = os.getenv('DB_PROFILE', 'production')
+    ENGINE_PROFILES = {
+        'production': {
+            'sqlite_pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -64000,  # KiB
+                'busy_timeout': 5000,  # ms
+                'foreign_keys': 'ON',
+            },
+            'pool': {
+                'pool_size': 10,
+                'max_overflow': 20,
+                'pool_pre_ping': True,
+                'pool_recycle': 1800,
+            },
+        },
+        'development': {
+            'sqlite_pragmas': {
+                'journal_mode': 'WAL',
+                'busy_timeout': 5000,
+                'foreign_keys': 'ON',
+            },
+            'pool': {
+                'pool_size': 5,
+                'pool_pre_ping': True,
+            },
+        },
+        # Driver defaults, as before profiles existed
+        'none': {},
+    }
+
+    # Read replicas, see db_routing.py. Comma-separated URLs; reads from
+    # catalogue pages go to a replica unless the user wrote in the last
+    # REPLICA_STICKY_SECONDS
+    DATABASE_REPLICA_URLS = [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+    REPLICA_BLUEPRINTS = ('main', 'courses', 'lessons', 'api')
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
     MAIL_SERVER = 'smtp.googlemail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
@@ -14,3 +56,103 @@ class Config:
     MAIL_USERNAME = os.getenv('EMAIL_USER')
     MAIL_PASSWORD = os.getenv('EMAIL_PASS')
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER')
+
+    # Compiled templates are cached on disk and shared by all workers (see
+    # template_cache.py). Templates are only re-read from source on change
+    # when TEMPLATES_AUTO_RELOAD=true, or in debug mode when it is unset
+    TEMPLATE_BYTECODE_CACHE = os.getenv('TEMPLATE_BYTECODE_CACHE', 'true').lower() == 'true'
+    TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR')
+    TEMPLATES_AUTO_RELOAD = {'true': True, 'false': False}.get(os.getenv('TEMPLATES_AUTO_RELOAD', '').lower())
+
+    # Course and lesson pages answer 304 when unchanged (conditional_get.py);
+    # the ETag salt defaults to the newest template's mtime
+    CONDITIONAL_GET = os.getenv('CONDITIONAL_GET', 'true').lower() == 'true'
+    ETAG_SALT = os.getenv('ETAG_SALT')
+
+    # gzip/brotli responses (compression.py); static files are compressed
+    # once per version and cached, so they get the highest levels
+    COMPRESS = os.getenv('COMPRESS', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVELS = {'gzip': 6, 'br': 4}
+    COMPRESS_ENDPOINT_LEVELS = {'static': {'gzip': 9, 'br': 11}}
+
+    # Application cache (cache.py): 'memory' (per worker), 'filesystem'
+    # (CACHE_DIR, default instance/cache) or 'redis' (CACHE_REDIS_URL)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 5000))
+    CACHE_DIR = os.getenv('CACHE_DIR')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # {% cache %} template fragments (fragment_cache.py), stored in the
+    # application cache
+    FRAGMENT_CACHE = os.getenv('FRAGMENT_CACHE', 'true').lower() == 'true'
+    FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', 300))
+
+    # Lesson forms switch from a <select> of every course to a typeahead
+    # above this many courses
+    COURSE_TYPEAHEAD_THRESHOLD = int(os.getenv('COURSE_TYPEAHEAD_THRESHOLD', 200))
+
+    # Async mode (async_io.py): 'mail' sends mail from a background event
+    # loop, 'full' also swaps in async views that query through
+    # aiosqlite/asyncpg (worth it on networked databases only)
+    ASYNC_MODE = os.getenv('ASYNC_MODE', 'off').lower()
+
+    # /courses/suggest (suggest.py) answers from an in-memory title index per
+    # worker; its own commits update it at once, other workers' show up with
+    # the rebuild every SUGGEST_REBUILD_SECONDS
+    SUGGEST_REBUILD_SECONDS = float(os.getenv('SUGGEST_REBUILD_SECONDS', 600))
+
+    # The lesson a reader last opened ("Continue", progress.py) is buffered
+    # per worker and written in one batch every PROGRESS_SEEN_FLUSH_SECONDS
+    PROGRESS_SEEN_FLUSH_SECONDS = float(os.getenv('PROGRESS_SEEN_FLUSH_SECONDS', 2))
+
+    # Lesson views (view_log.py) are buffered per worker and appended in
+    # batches to their own SQLite file, then folded into per-lesson and
+    # per-course counts every ANALYTICS_COMPACT_SECONDS
+    ANALYTICS_DATABASE_URL = os.getenv('ANALYTICS_DATABASE_URL', 'sqlite:///analytics.db')
+    ANALYTICS_VIEWS = os.getenv('ANALYTICS_VIEWS', 'true').lower() == 'true'
+    ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', 500))
+    ANALYTICS_FLUSH_SECONDS = float(os.getenv('ANALYTICS_FLUSH_SECONDS', 2))
+    ANALYTICS_COMPACT_SECONDS = float(os.getenv('ANALYTICS_COMPACT_SECONDS', 60))
+
+    # Prometheus metrics at /metrics (metrics.py), for admins or a scraper
+    # sending "Authorization: Bearer $METRICS_TOKEN". Workers share samples
+    # through files in METRICS_DIR (default instance/metrics)
+    METRICS = os.getenv('METRICS', 'true').lower() == 'true'
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+
+    # Slow-query log (slow_query.py): statements over SLOW_QUERY_MS with the
+    # route or template line that ran them, shown at /admin/slow-queries.
+    # SLOW_QUERY_PERSIST also keeps them in the analytics database so the
+    # page covers every worker
+    SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'true').lower() == 'true'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+    SLOW_QUERY_BUFFER = int(os.getenv('SLOW_QUERY_BUFFER', 500))
+    SLOW_QUERY_PERSIST = os.getenv('SLOW_QUERY_PERSIST', 'false').lower() == 'true'
+    SLOW_QUERY_KEEP = int(os.getenv('SLOW_QUERY_KEEP', 10000))
+
+    # Soft-deleted courses/users are purged by a background thread in small
+    # transactions; set PURGE_IN_BACKGROUND=false to rely on `flask purge run`
+    PURGE_IN_BACKGROUND = os.getenv('PURGE_IN_BACKGROUND', 'true').lower() == 'true'
+    PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 500))
+    PURGE_PAUSE_SECONDS = float(os.getenv('PURGE_PAUSE_SECONDS', 0.05))
+
+    # Housekeeping jobs (maintenance.py): run `flask maintenance run` from
+    # cron, or set MAINTENANCE_SCHEDULER=true to let every worker check for
+    # due jobs each MAINTENANCE_TICK_SECONDS (a lease makes each run once).
+    # Intervals per job in seconds, e.g. {'refresh_stats': 300}
+    MAINTENANCE_SCHEDULER = os.getenv('MAINTENANCE_SCHEDULER', 'false').lower() == 'true'
+    MAINTENANCE_TICK_SECONDS = float(os.getenv('MAINTENANCE_TICK_SECONDS', 60))
+    MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', 500))
+    MAINTENANCE_INTERVALS = {}
+    RESET_REQUEST_RETENTION_DAYS = int(os.getenv('RESET_REQUEST_RETENTION_DAYS', 30))
+
+    # Query tracker (development / CI): flags statements repeated within one
+    # request and per-endpoint query budgets, e.g. {'main.home': 8}
+    QUERY_TRACKER_ENABLED = os.getenv('QUERY_TRACKER', 'false').lower() == 'true'
+    QUERY_TRACKER_RAISE = os.getenv('QUERY_TRACKER_RAISE', 'false').lower() == 'true'
+    QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+    QUERY_BUDGETS = {}
@@ -1,7 +1,14 @@
+from flask import current_app, url_for
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
-from wtforms import StringField, TextAreaField, SubmitField
+from markupsafe import Markup, escape
+from sqlalchemy import func
+from wtforms import StringField, TextAreaField, SubmitField, SelectField, ValidationError
 from wtforms.validators import DataRequired, Length
+from wtforms.widgets import Select, html_params
+from app import db
+from cache import cached_query
+from models import Course, lower_prefix
 
 
 # New Course Form
@@ -10,3 +17,84 @@ class NewCourseForm(FlaskForm):
     description = TextAreaField("Course Description", validators=[DataRequired(), Length(max=150)])
     icon = FileField("Icon", validators=[FileAllowed(["jpg", "png", "jpeg", "svg"], "Images only!")])
     submit = SubmitField("Create")
+
+
+# ------------------------
+# Course picker
+# ------------------------
+
+@cached_query(tags=['courses'])
+def course_count():
+    return Course.query.count()
+
+
+@cached_query(tags=['courses'])
+def course_choices():
+    """``(id, title)`` of every course, by title"""
+    return [tuple(row) for row in db.session.query(Course.id, Course.title).order_by(Course.title)]
+
+
+@cached_query(tags=['courses'])
+def search_courses(prefix, limit):
+    """Courses whose title starts with ``prefix`` (any case), as a range scan on ix_course_lower_title"""
+    query = db.session.query(Course.id, Course.title)
+    if prefix:
+        query = query.filter(lower_prefix(Course.title, prefix))
+    return [tuple(row) for row in query.order_by(func.lower(Course.title)).limit(limit)]
+
+
+class CourseWidget(Select):
+    """A ``<select>``, or a typeahead text box backed by ``courses.typeahead``"""
+
+    def __call__(self, field, **kwargs):
+        if not field.typeahead:
+            return super().__call__(field, **kwargs)
+        title = ''
+        if field.data is not None:
+            title = db.session.query(Course.title).filter(Course.id == field.data).scalar() or ''
+        kwargs.setdefault('id', field.id)
+        if 'class' in kwargs:
+            kwargs['class'] = kwargs['class'].replace('form-select', 'form-control')
+        list_id = f'{field.id}_options'
+        search = html_params(
+            type='text', value=title, list=list_id, autocomplete='off',
+            placeholder='Start typing a course title',
+            data_course_typeahead=url_for('courses.typeahead'), data_target=f'{field.id}_value',
+            **kwargs
+        )
+        hidden = html_params(type='hidden', name=field.name, id=f'{field.id}_value',
+                             value='' if field.data is None else field.data)
+        script = url_for('static', filename='js/course_typeahead.js')
+        return Markup(f'<input {hidden}><input {search}><datalist id="{escape(list_id)}"></datalist>'
+                      f'<script src="{escape(script)}" defer></script>')
+
+
+class CourseField(SelectField):
+    """Course ``SelectField`` with cached choices.
+
+    Above ``COURSE_TYPEAHEAD_THRESHOLD`` courses it renders as a typeahead
+    instead of listing them all. Either way the submitted id is checked
+    with one primary-key lookup rather than against the list. ``blank``
+    labels an extra empty first option (e.g. "All" for a filter).
+    """
+    widget = CourseWidget()
+
+    def __init__(self, label=None, validators=None, blank=None, **kwargs):
+        super().__init__(label, validators, coerce=int, **kwargs)
+        self.blank = blank
+
+    @property
+    def typeahead(self):
+        return course_count() > current_app.config['COURSE_TYPEAHEAD_THRESHOLD']
+
+    def iter_choices(self):
+        if self.blank is not None:
+            yield ('', self.blank, self.data is None, {})
+        yield from self._choices_generator(course_choices())
+
+    def pre_validate(self, form):
+        exists = self.data is not None and db.session.query(
+            Course.query.filter(Course.id == self.data).exists()
+        ).scalar()
+        if not exists:
+            raise ValidationError(self.gettext("Not a valid choice."))
@@ -1,11 +1,16 @@
 import os
 import secrets
-from PIL import Image
-from flask import render_template, url_for, flash, redirect, request, abort
-from .forms import NewCourseForm
+from flask import render_template, url_for, flash, redirect, request, abort, current_app, jsonify
+from .forms import NewCourseForm, course_count, search_courses
 from app import db
-from models import User, Lesson, Course
+from models import User, Lesson, Course, Enrollment
 from flask_login import login_required, current_user
+from conditional_get import conditional, course_lessons_version, latest
+from progress import count_done, enroll, enrollment_for
+from lesson_order import ReorderError, move_lesson, order_in_course
+from metrics import observe_upload
+from suggest import suggest_titles
+from view_log import course_views
 from . import courses
 
 # ------------------------
@@ -46,8 +51,23 @@ def new_course():
 # Course details route
 # ------------------------
 
+def _course_version(course_title):
+    row = db.session.query(Course.id, Course.updated_at, Course.progress_mask).filter(Course.title == course_title).first()
+    if row is None:
+        return None
+    count, lessons_updated = course_lessons_version(row.id)
+    enrollment = (
+        db.session.query(Enrollment.completed, Enrollment.last_lesson_id)
+        .filter_by(user_id=current_user.id, course_id=row.id)
+        .first()
+    )
+    parts = (*row, count, lessons_updated, enrollment and tuple(enrollment), course_views(row.id))
+    return parts, latest(row.updated_at, lessons_updated)
+
+
 @courses.route("/course/<string:course_title>")
 @login_required
+@conditional(_course_version)
 def course(course_title):
     course_obj = Course.query.filter_by(title=course_title).first()
     if not course_obj:
@@ -56,17 +76,57 @@ def course(course_title):
     lessons = (
         Lesson.query
         .filter_by(course_id=course_obj.id)
-        .order_by(Lesson.date_posted.asc(), Lesson.id.asc())
+        .order_by(*order_in_course())
         .paginate(page=page, per_page=6)
     )
+    enrollment = enrollment_for(current_user.id, course_obj.id)
+    progress = continue_lesson = None
+    if enrollment is not None:
+        progress = count_done(enrollment.completed, course_obj.progress_mask)
+        if enrollment.last_lesson_id is not None:
+            continue_lesson = Lesson.query.filter_by(id=enrollment.last_lesson_id, course_id=course_obj.id).first()
     return render_template(
         "course.html",
         title=course_obj.title,
         course=course_obj,
-        lessons=lessons
+        lessons=lessons,
+        enrollment=enrollment,
+        progress=progress,
+        continue_lesson=continue_lesson
     )
 
 
+@courses.route("/course/<int:course_id>/reorder", methods=["POST"])
+@login_required
+def reorder_lessons(course_id):
+    """Move one lesson: JSON ``{"lesson_id": .., "after_id": ..}`` or ``"before_id"``"""
+    if not current_user.is_admin:
+        abort(403)
+    payload = request.get_json(silent=True) or {}
+    lesson = Lesson.query.filter_by(id=payload.get("lesson_id"), course_id=course_id).first_or_404()
+    after = before = None
+    if payload.get("after_id") is not None:
+        after = Lesson.query.get_or_404(payload["after_id"])
+    elif payload.get("before_id") is not None:
+        before = Lesson.query.get_or_404(payload["before_id"])
+    try:
+        move_lesson(lesson, after=after, before=before)
+    except ReorderError as e:
+        return jsonify(error=str(e)), 400
+    db.session.commit()
+    return jsonify(lesson_id=lesson.id, position=lesson.position)
+
+
+@courses.route("/course/<string:course_title>/enroll", methods=["POST"])
+@login_required
+def enroll_course(course_title):
+    course_obj = Course.query.filter_by(title=course_title).first_or_404()
+    enroll(current_user.id, course_obj.id)
+    db.session.commit()
+    flash(f"You are enrolled in {course_obj.title}.", "success")
+    return redirect(url_for("courses.course", course_title=course_obj.title))
+
+
 # ------------------------
 # Courses route
 # ------------------------
@@ -75,8 +135,42 @@ def course(course_title):
 @login_required
 def allcourses():
     page = request.args.get("page", 1, type=int)
-    allcourses = Course.query.paginate(page=page, per_page=6)
-    return render_template("all_courses.html", title="All Courses", courses=allcourses)
+    per_page = 6
+    # The cards are a cached fragment, so the page's courses are left for the
+    # template to load on a miss and the page count uses the cached total
+    pages = -(-course_count() // per_page)
+    if page < 1 or (page > pages and page != 1):
+        abort(404)
+    on_page = Course.query.order_by(Course.id).limit(per_page).offset((page - 1) * per_page)
+    return render_template("all_courses.html", title="All Courses", courses=on_page, page=page, pages=pages)
+
+
+# ------------------------
+# Course typeahead
+# ------------------------
+
+@courses.route("/typeahead")
+@login_required
+def typeahead():
+    """Courses whose title starts with ``q``, for CourseField"""
+    prefix = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 20, type=int), 50))
+    return jsonify(data=[{"id": id, "title": title} for id, title in search_courses(prefix, limit)])
+
+
+@courses.route("/suggest")
+@login_required
+def suggest():
+    """Courses and lessons with a title word starting with ``q``, from the in-memory index"""
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    data = []
+    for item in suggest_titles(request.args.get("q", ""), limit):
+        if item.kind == "course":
+            url = url_for("courses.course", course_title=item.title)
+        else:
+            url = url_for("lessons.lesson", lesson_slug=item.slug)
+        data.append({"type": item.kind, "id": item.id, "title": item.title, "url": url})
+    return jsonify(data=data)
 
 
 # ------------------------
@@ -84,8 +178,9 @@ def allcourses():
 # ------------------------
 
 # Save uploaded images with random names and optional resizing
+@observe_upload
 def save_picture(form_picture, path, output_size=None):
-    from app import app
+    app = current_app
     
     random_hex = secrets.token_hex(8)
     _, f_ext = os.path.splitext(form_picture.filename)
@@ -95,6 +190,7 @@ def save_picture(form_picture, path, output_size=None):
     if f_ext.lower() == ".svg":
         form_picture.save(picture_path)
     else:
+        from PIL import Image  # slow to import, only needed for uploads
         i = Image.open(form_picture)
         if output_size:
             # Maintain aspect by fitting inside the box
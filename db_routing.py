@@ -0,0 +1,132 @@
+"""Read-replica routing for ``db.session``.
+
+``DATABASE_REPLICA_URLS`` adds one bind per replica (``replica_0``,
+``replica_1`` ...). SELECTs issued while serving a GET/HEAD/OPTIONS request
+for one of ``REPLICA_BLUEPRINTS`` go to a random replica; everything else
+uses the primary:
+
+* writes, flushes and ``SELECT ... FOR UPDATE``,
+* any read after the session has written (read-your-own-writes within
+  the request),
+* every request within ``REPLICA_STICKY_SECONDS`` of a request that wrote,
+  so a user sees their own changes even while the replicas lag,
+* CLI commands and background threads.
+
+``flask replicas sync`` copies a SQLite primary onto SQLite replicas, which
+is enough to try the routing locally with two files.
+"""
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import click
+from flask import current_app, g, has_app_context, request, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+
+REPLICA_PREFIX = 'replica_'
+_STICKY_KEY = '_primary_until'
+
+replicas_cli = AppGroup('replicas', help='Read replica commands.')
+
+
+def _is_plain_read(clause):
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+
+class RoutingSession(Session):
+    """Sends eligible SELECTs to a replica bind, everything else to the primary"""
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self.wrote_primary = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        # Only the default bind has replicas
+        if bind is not None or engine is not engines.get(None):
+            return engine
+        if self._flushing or (clause is not None and not _is_plain_read(clause)):
+            self.wrote_primary = True
+            return engine
+        if clause is None or self.wrote_primary or not (has_app_context() and g.get('_read_replica')):
+            return engine
+        return engines[random.choice(g._read_replica)]
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary for the rest of the block, e.g. right before a write"""
+    previous = g.get('_read_replica')
+    g._read_replica = None
+    try:
+        yield
+    finally:
+        g._read_replica = previous
+
+
+def replica_binds(app):
+    return sorted(key for key in app.config['SQLALCHEMY_BINDS'] if key and key.startswith(REPLICA_PREFIX))
+
+
+def init_replica_binds(app):
+    """Add a bind per replica URL; call before ``db.init_app``"""
+    from engine_profiles import engine_options
+    app.config.setdefault('DATABASE_REPLICA_URLS', [])
+    app.config.setdefault('REPLICA_BLUEPRINTS', ('main', 'courses', 'lessons', 'api'))
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for i, url in enumerate(app.config['DATABASE_REPLICA_URLS']):
+        binds[f'{REPLICA_PREFIX}{i}'] = {'url': url, **engine_options(app, url)}
+
+
+def init_replica_routing(app, db):
+    app.cli.add_command(replicas_cli)
+    replicas = replica_binds(app)
+    if not replicas:
+        return
+
+    @app.before_request
+    def choose_replica():
+        sticky = session.get(_STICKY_KEY, 0) > time.time()
+        if (request.method in ('GET', 'HEAD', 'OPTIONS') and not sticky
+                and request.blueprint in app.config['REPLICA_BLUEPRINTS']):
+            g._read_replica = replicas
+
+    @app.after_request
+    def stick_to_primary(response):
+        if db.session.registry.has() and db.session().wrote_primary:
+            session[_STICKY_KEY] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@replicas_cli.command('sync')
+def sync_command():
+    """Copy a SQLite primary database onto each SQLite replica."""
+    from app import db
+    primary = db.engines[None]
+    if primary.dialect.name != 'sqlite':
+        raise click.ClickException('Only SQLite replicas can be synced here; use the database\'s own replication.')
+    replicas = replica_binds(current_app)
+    if not replicas:
+        raise click.ClickException('No replicas configured; set DATABASE_REPLICA_URLS.')
+
+    source = primary.raw_connection()
+    try:
+        for key in replicas:
+            path = db.engines[key].url.database
+            db.engines[key].dispose()
+            target = sqlite3.connect(path)
+            try:
+                source.driver_connection.backup(target)
+            finally:
+                target.close()
+            click.echo(f'{key}: copied to {path}')
+    finally:
+        source.close()
@@ -0,0 +1,106 @@
+"""Named database engine profiles.
+
+``Config.DB_PROFILE`` picks an entry from ``Config.ENGINE_PROFILES``. For
+SQLite the profile's pragmas run on every new DBAPI connection (WAL lets
+readers carry on while one request writes, and ``busy_timeout`` makes a
+writer wait for the lock instead of failing with "database is locked").
+For server databases the profile supplies the connection pool settings.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Pragmas that only matter for file databases
+_FILE_ONLY_PRAGMAS = {'journal_mode', 'mmap_size'}
+
+
+def _profile(app):
+    name = app.config['DB_PROFILE']
+    try:
+        return name, app.config['ENGINE_PROFILES'][name]
+    except KeyError:
+        raise RuntimeError(f"Unknown DB_PROFILE {name!r}; choose one of {sorted(app.config['ENGINE_PROFILES'])}")
+
+
+def _is_memory(url):
+    return url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+
+
+def _sqlite_pragmas(profile, url):
+    pragmas = dict(profile.get('sqlite_pragmas', {}))
+    if _is_memory(url):
+        for name in _FILE_ONLY_PRAGMAS:
+            pragmas.pop(name, None)
+    return pragmas
+
+
+def engine_options(app, uri=None):
+    """Engine keyword arguments for ``uri`` (the primary database by default)"""
+    _, profile = _profile(app)
+    url = make_url(uri or app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return dict(profile.get('pool', {}))
+
+
+def _set_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+
+def _effective_settings(engine):
+    if engine.dialect.name != 'sqlite':
+        pool = engine.pool
+        return {
+            'pool': type(pool).__name__,
+            'pool_size': getattr(pool, 'size', lambda: None)(),
+            'pool_recycle': pool._recycle,
+            'pool_pre_ping': pool._pre_ping,
+        }
+    with engine.connect() as connection:
+        return {
+            name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            for name in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout', 'foreign_keys')
+        }
+
+
+def init_engine_profiles(app):
+    """Apply the active profile to every engine ``db`` created for ``app``.
+
+    Call before ``db.init_app`` so pool options reach ``create_engine``, then
+    ``apply_engine_profile`` once the engines exist.
+    """
+    app.config.setdefault('DB_PROFILE', 'production')
+    _profile(app)
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(app).items():
+        options.setdefault(key, value)
+
+
+def tune_engine(app, engine):
+    """Run the active profile's SQLite pragmas on each new connection of ``engine``"""
+    _, profile = _profile(app)
+    if engine.dialect.name == 'sqlite':
+        pragmas = _sqlite_pragmas(profile, engine.url)
+        if pragmas:
+            event.listen(engine, 'connect', _set_pragmas(pragmas))
+
+
+def apply_engine_profile(app, db):
+    name, _ = _profile(app)
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            tune_engine(app, engine)
+            # Startup check: show what the database actually accepted, at
+            # WARNING so it shows under Flask's default log level
+            label = bind or 'default'
+            try:
+                settings = _effective_settings(engine)
+            except Exception as e:
+                app.logger.warning(f'Engine profile {name!r} ({label}): could not read settings: {e}')
+                continue
+            app.logger.warning(f'Engine profile {name!r} ({label}): ' +
+                               ', '.join(f'{key}={value}' for key, value in settings.items()))
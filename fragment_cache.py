@@ -0,0 +1,84 @@
+"""Template fragment caching with tag-based invalidation.
+
+Wrap an expensive block in ``{% cache %}`` with a key (one or more
+expressions) and the tags its content depends on::
+
+    {% cache 'outline', lesson.id, tags=['course:' ~ lesson.course_id] %}
+      ...
+    {% endcache %}
+
+Rendered blocks are stored in the application cache (cache.py), so they
+share its backend, size limit and tags: a commit that changes a course,
+lesson or user invalidates the blocks tagged with it, in every worker when
+the backend is shared. ``FRAGMENT_CACHE_TTL`` bounds how long a block lives
+regardless. Queries that only feed a cached block should reach the
+template unevaluated, so a hit skips them.
+"""
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import get_cache
+
+
+class FragmentCache:
+    """Fragment lookups through the application cache, with hit/miss counters"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = self.misses = 0
+
+    def get_or_render(self, key, tags, render):
+        rendered = []
+
+        def create():
+            rendered.append(True)
+            return render()
+        html = get_cache().get_or_set('fragment:' + repr(key), create, tags, self.ttl)
+        if rendered:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return html
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+        }
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache key[, key...][, tags=[...]] %}...{% endcache %}``"""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        tags = nodes.List([])
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.test('name:tags') and parser.stream.look().test('assign'):
+                parser.stream.skip(2)
+                tags = parser.parse_expression()
+                break
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_cached', [nodes.List(key), tags])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, tags, caller):
+        if not current_app.config['FRAGMENT_CACHE']:
+            return caller()
+        cache = current_app.extensions['fragment_cache']
+        return Markup(cache.get_or_render(tuple(key), list(tags), lambda: str(caller())))
+
+
+def init_fragment_cache(app):
+    """Call after ``init_cache``"""
+    app.config.setdefault('FRAGMENT_CACHE', True)
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+    app.extensions['fragment_cache'] = FragmentCache(app.config['FRAGMENT_CACHE_TTL'])
+    app.jinja_env.add_extension(FragmentCacheExtension)
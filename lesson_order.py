@@ -0,0 +1,125 @@
+"""Explicit lesson order within a course, numbered with gaps.
+
+``Lesson.position`` orders a course's lessons (ties, which only concurrent
+inserts can cause, fall back to ``id``). Positions start ``POSITION_GAP``
+apart: a new or moved-in lesson goes ``POSITION_GAP`` after the current
+last one, and moving a lesson gives it the midpoint of its new neighbours,
+so a move writes that one row. Only when repeated moves into the same spot
+have used up the gap is the course renumbered, in one ``UPDATE`` that
+spaces every lesson ``POSITION_GAP`` apart again in their current order.
+"""
+from itertools import chain
+
+from sqlalchemy import bindparam, event, func, inspect, select, tuple_, update
+from sqlalchemy.orm import Session
+
+import models
+
+POSITION_GAP = 1024
+
+
+class ReorderError(ValueError):
+    """A lesson can't go where it was asked to"""
+
+
+def order_in_course():
+    """``ORDER BY`` for a course's lessons"""
+    return models.Lesson.position.asc(), models.Lesson.id.asc()
+
+
+def _end_position(connection, course_id):
+    lesson = models.Lesson.__table__
+    last = connection.scalar(select(func.max(lesson.c.position)).where(lesson.c.course_id == course_id))
+    return POSITION_GAP if last is None else last + POSITION_GAP
+
+
+def renumber(connection, course_id):
+    """Space a course's lessons ``POSITION_GAP`` apart, keeping their order"""
+    lesson = models.Lesson.__table__
+    ranked = (
+        select(lesson.c.id, func.row_number().over(order_by=(lesson.c.position, lesson.c.id)).label('rank'))
+        .where(lesson.c.course_id == course_id)
+        .subquery()
+    )
+    connection.execute(
+        update(lesson).where(lesson.c.id == ranked.c.id).values(position=ranked.c.rank * POSITION_GAP)
+    )
+
+
+def append_lessons(connection, lesson_ids, course_id):
+    """Put lessons moved into a course without the ORM (bulk moves) at its end"""
+    if not lesson_ids:
+        return
+    lesson = models.Lesson.__table__
+    end = _end_position(connection, course_id)
+    connection.execute(
+        update(lesson).where(lesson.c.id == bindparam('lesson')).values(position=bindparam('spot')),
+        [{'lesson': lesson_id, 'spot': end + i * POSITION_GAP} for i, lesson_id in enumerate(lesson_ids)],
+    )
+
+
+def _neighbours(session, lesson, after, before):
+    """Positions of the lessons ``lesson`` should sit between (None past either end)"""
+    Lesson = models.Lesson
+    others = session.query(Lesson.position, Lesson.id).filter(
+        Lesson.course_id == lesson.course_id, Lesson.id != lesson.id)
+    key = tuple_(Lesson.position, Lesson.id)
+    if after is not None:
+        following = others.filter(key > tuple_(after.position, after.id)).order_by(*order_in_course()).first()
+        return after.position, following and following.position
+    preceding = others.filter(key < tuple_(before.position, before.id))\
+        .order_by(Lesson.position.desc(), Lesson.id.desc()).first()
+    return preceding and preceding.position, before.position
+
+
+def move_lesson(lesson, after=None, before=None):
+    """Put ``lesson`` right after ``after`` or right before ``before`` (not committed).
+
+    Changes only ``lesson.position``, unless the gap between the new
+    neighbours is used up and the course has to be renumbered first.
+    """
+    for neighbour in (after, before):
+        if neighbour is not None and (neighbour.course_id != lesson.course_id or neighbour.id == lesson.id):
+            raise ReorderError('Neighbour must be another lesson in the same course')
+    if (after is None) == (before is None):
+        raise ReorderError('Give exactly one of after/before')
+    session = inspect(lesson).session
+    low, high = _neighbours(session, lesson, after, before)
+    if low is not None and high is not None and high - low < 2:
+        session.flush()
+        renumber(session.connection(), lesson.course_id)
+        for renumbered in (lesson, after, before):
+            if renumbered is not None:
+                session.expire(renumbered, ['position'])
+        low, high = _neighbours(session, lesson, after, before)
+    if low is None:
+        lesson.position = high - POSITION_GAP
+    elif high is None:
+        lesson.position = low + POSITION_GAP
+    else:
+        lesson.position = (low + high) // 2
+
+
+def _place_new_lessons(session, flush_context, instances):
+    # New lessons, and lessons moved to another course, go at the end
+    ends = {}
+    for lesson in chain(session.new, session.dirty):
+        if not isinstance(lesson, models.Lesson):
+            continue
+        attrs = inspect(lesson).attrs
+        if lesson not in session.new and not (attrs.course_id.history.has_changes() or attrs.course_name.history.added):
+            continue
+        if lesson in session.new and lesson.position is not None:
+            continue
+        course = lesson.course_name if attrs.course_name.history.added else None
+        course_id = course.id if course is not None else lesson.course_id
+        key = course_id if course_id is not None else id(course)
+        if key not in ends:
+            ends[key] = POSITION_GAP if course_id is None else _end_position(session.connection(), course_id)
+        lesson.position = ends[key]
+        ends[key] += POSITION_GAP
+
+
+def init_lesson_order(app):
+    if not event.contains(Session, 'before_flush', _place_new_lessons):
+        event.listen(Session, 'before_flush', _place_new_lessons)
@@ -1,13 +1,14 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
-from wtforms import StringField, SubmitField, SelectField
+from wtforms import StringField, SubmitField
 from wtforms.validators import DataRequired, Length
 from flask_ckeditor import CKEditorField
+from courses.forms import CourseField
 
 
 # New Lesson Form 
 class NewLessonForm(FlaskForm):
-    course = SelectField("Course", coerce=int, validators=[DataRequired()])
+    course = CourseField("Course", validators=[DataRequired()])
     title = StringField("Lesson Title", validators=[DataRequired(), Length(max=100)])
     slug = StringField(
         "Lesson Slug",
@@ -1,11 +1,18 @@
 import os
 import secrets
-from PIL import Image
-from flask import render_template, url_for, flash, redirect, request, abort
+from flask import render_template, url_for, flash, redirect, request, abort, current_app, g
 from .forms import NewLessonForm
 from app import db
-from models import User, Lesson, Course
+from models import User, Lesson, Course, Enrollment
 from flask_login import login_required, current_user
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+from conditional_get import conditional, course_lessons_version, latest
+from compression import compression_level
+from view_log import lesson_views, record_lesson_view
+from progress import enroll, has_bit, mark_seen, set_completed
+from lesson_order import order_in_course
+from metrics import observe_upload
 from . import lessons
 
 # ------------------------
@@ -16,7 +23,6 @@ from . import lessons
 @login_required
 def new_lesson():
     new_lesson_form = NewLessonForm()
-    new_lesson_form.course.choices = [(c.id, c.title) for c in Course.query.all()]  
 
     if new_lesson_form.validate_on_submit():
         thumbnail_file = None
@@ -49,36 +55,92 @@ def new_lesson():
 # Lesson details route
 # ------------------------
 
+def _lesson_row(lesson_slug):
+    # Looked up once per request, for both the validator and the view counter
+    rows = g.setdefault('lesson_rows', {})
+    if lesson_slug not in rows:
+        rows[lesson_slug] = (
+            db.session.query(Lesson.id, Lesson.updated_at, Lesson.course_id, Course.updated_at.label('course_updated'),
+                             User.username, User.image_file, Lesson.progress_bit,
+                             Enrollment.id.label('enrollment_id'), Enrollment.completed, Enrollment.last_lesson_id)
+            .join(Course, Lesson.course_id == Course.id)
+            .join(User, Lesson.user_id == User.id)
+            .outerjoin(Enrollment, (Enrollment.course_id == Lesson.course_id) & (Enrollment.user_id == current_user.id))
+            .filter(Lesson.slug == lesson_slug)
+            .order_by(Lesson.id)
+            .first()
+        )
+    return rows[lesson_slug]
+
+
+def _lesson_version(lesson_slug):
+    # Everything lesson.html shows: the lesson, its course, its author, the
+    # reader's progress, the titles/order of the course's other lessons and
+    # the view count
+    row = _lesson_row(lesson_slug)
+    if row is None:
+        return None
+    count, lessons_updated = course_lessons_version(row.course_id)
+    return tuple(row) + (count, lessons_updated, lesson_views(row.id)), latest(row.updated_at, row.course_updated, lessons_updated)
+
+
+@lessons.after_request
+def count_lesson_view(response):
+    # A 304 is a read too, so views are counted here rather than in the view
+    if request.endpoint == 'lessons.lesson' and response.status_code in (200, 304):
+        row = _lesson_row(request.view_args['lesson_slug'])
+        if row is not None:
+            record_lesson_view(row.id, row.course_id, current_user.get_id())
+    return response
+
+
 @lessons.route("/lesson/<string:lesson_slug>")
 @login_required
+@conditional(_lesson_version)
+@compression_level(gzip=9, br=6)  # long content, read on slow mobile links
 def lesson(lesson_slug):
-    lesson_obj = Lesson.query.filter_by(slug=lesson_slug).first()
+    lesson_obj = Lesson.query.filter_by(slug=lesson_slug).order_by(Lesson.id).first()
     if not lesson_obj:
         abort(404)
-    # Fetch all lessons for the same course in a stable order
-    course_lessons = (
-        Lesson.query
-        .filter_by(course_id=lesson_obj.course_id)
-        .order_by(Lesson.date_posted.asc(), Lesson.id.asc())
-        .all()
+    # The course's lessons in a stable order. The outline is a cached
+    # fragment, so the full list is left for the template to run on a miss
+    # and the neighbours are looked up directly
+    in_course = Lesson.query.filter_by(course_id=lesson_obj.course_id).options(
+        load_only(Lesson.id, Lesson.slug, Lesson.title)
     )
+    position = tuple_(Lesson.position, Lesson.id)
+    here = tuple_(lesson_obj.position, lesson_obj.id)
+    course_lessons = in_course.order_by(*order_in_course())
+    prev_lesson = in_course.filter(position < here).order_by(Lesson.position.desc(), Lesson.id.desc()).first()
+    next_lesson = in_course.filter(position > here).order_by(*order_in_course()).first()
 
-    # Determine current index and neighbors
-    current_index = next((idx for idx, l in enumerate(course_lessons) if l.id == lesson_obj.id), None)
-    prev_lesson = course_lessons[current_index - 1] if current_index is not None and current_index > 0 else None
-    next_lesson = course_lessons[current_index + 1] if current_index is not None and current_index < len(course_lessons) - 1 else None
+    row = _lesson_row(lesson_slug)
+    if row.enrollment_id is not None and row.last_lesson_id != lesson_obj.id:
+        # Buffered; a page view doesn't take the database's write lock
+        mark_seen(row.enrollment_id, lesson_obj.id)
 
     return render_template(
         "lesson.html",
         title=lesson_obj.title,
         lesson=lesson_obj,
         course_lessons=course_lessons,
-        current_index=current_index,
         prev_lesson=prev_lesson,
-        next_lesson=next_lesson
+        next_lesson=next_lesson,
+        completed=has_bit(row.completed, lesson_obj.progress_bit)
     )
 
 
+@lessons.route("/lesson/<string:lesson_slug>/complete", methods=["POST"])
+@login_required
+def complete_lesson(lesson_slug):
+    lesson_obj = Lesson.query.filter_by(slug=lesson_slug).order_by(Lesson.id).first_or_404()
+    # Marking a lesson done enrolls the reader in its course
+    enrollment = enroll(current_user.id, lesson_obj.course_id)
+    set_completed(enrollment, lesson_obj, request.form.get("done", "1") == "1")
+    db.session.commit()
+    return redirect(url_for("lessons.lesson", lesson_slug=lesson_obj.slug))
+
+
 # ------------------------
 # user lessons route
 # ------------------------
@@ -109,7 +171,6 @@ def edit_lesson(lesson_id):
     if lesson.author.id != current_user.id:
         abort(403)
     form = NewLessonForm()
-    form.course.choices = [(c.id, c.title) for c in Course.query.all()]
 
     if request.method == 'GET':
         form.course.data = lesson.course_id
@@ -153,8 +214,9 @@ def delete_lesson(lesson_id):
 # ------------------------
 
 # Save uploaded images with random names and optional resizing
+@observe_upload
 def save_picture(form_picture, path, output_size=None):
-    from app import app
+    app = current_app
     
     random_hex = secrets.token_hex(8)
     _, f_ext = os.path.splitext(form_picture.filename)
@@ -164,6 +226,7 @@ def save_picture(form_picture, path, output_size=None):
     if f_ext.lower() == ".svg":
         form_picture.save(picture_path)
     else:
+        from PIL import Image  # slow to import, only needed for uploads
         i = Image.open(form_picture)
         if output_size:
             # Maintain aspect by fitting inside the box
@@ -174,7 +237,7 @@ def save_picture(form_picture, path, output_size=None):
 
 # Delete old files if they're not the default ones
 def delete_if_not_default(directory: str, filename: str, default_name: str) -> None:
-    from app import app
+    app = current_app
     
     if not filename or filename == default_name:
         return
@@ -1,27 +1,38 @@
+import asyncio
 from flask import render_template, url_for, redirect, request
-from sqlalchemy import or_
+from sqlalchemy import or_, select
+from sqlalchemy.orm import joinedload
 from app import db
 from models import User, Lesson, Course
-from flask_login import login_required
+from flask_login import login_required, current_user
+from async_io import async_variant, async_session
+from courses.forms import course_count
+from progress import course_progress
+from lesson_order import order_in_course
 from . import main
 
 # ------------------------
 # Home route
 # ------------------------
 
+def _home_courses():
+    # Show up to 5 courses on home. The cards are a cached fragment, so the
+    # query is left for the template to run on a miss
+    return Course.query.order_by(Course.id.asc()).limit(5)
+
+
 @main.route("/")
 @main.route("/home")
 def home():
-    # Show up to 5 courses on home
-    total_courses = Course.query.count()
-    courses = Course.query.order_by(Course.id.asc()).limit(5).all()
-    # One representative lesson per course (earliest lesson)
+    total_courses = course_count()
+    courses = _home_courses()
+    # One representative lesson per course (its first lesson)
     lessons_unique = []
-    for c in courses:
+    for (course_id,) in courses.with_entities(Course.id):
         first_lesson = (
             Lesson.query
-            .filter_by(course_id=c.id)
-            .order_by(Lesson.date_posted.asc(), Lesson.id.asc())
+            .filter_by(course_id=course_id)
+            .order_by(*order_in_course())
             .first()
         )
         if first_lesson:
@@ -29,6 +40,29 @@ def home():
     return render_template('home.html', courses=courses, lessons=lessons_unique, css='home.css', total_courses=total_courses)
 
 
+@async_variant('main.home')
+async def home_async():
+    """home() for ASYNC_MODE=full: the per-course lesson lookups run concurrently"""
+    async def first_lesson(course_id):
+        async with async_session() as session:
+            return await session.scalar(
+                select(Lesson)
+                .options(joinedload(Lesson.author), joinedload(Lesson.course_name))
+                .filter_by(course_id=course_id)
+                .order_by(*order_in_course())
+                .limit(1)
+            )
+
+    total_courses = course_count()
+    courses = _home_courses()
+    async with async_session() as session:
+        course_ids = (await session.scalars(select(Course.id).order_by(Course.id.asc()).limit(5))).all()
+    # One session per lookup, since a session can only run one statement at a time
+    lessons = await asyncio.gather(*(first_lesson(course_id) for course_id in course_ids))
+    lessons_unique = [lesson for lesson in lessons if lesson]
+    return render_template('home.html', courses=courses, lessons=lessons_unique, css='home.css', total_courses=total_courses)
+
+
 # ------------------------
 # About route
 # ------------------------
@@ -45,4 +79,5 @@ def about():
 @main.route("/dashboard", methods=['GET'])
 @login_required
 def dashboard():
-    return render_template('dashboard.html', title="Dashboard", active_tab=None)
+    return render_template('dashboard.html', title="Dashboard", active_tab=None,
+                           course_progress=course_progress(current_user.id))
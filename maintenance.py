@@ -0,0 +1,335 @@
+"""Scheduled housekeeping: ``flask maintenance run`` or an in-process scheduler.
+
+Jobs run in order, each at most once per ``MAINTENANCE_INTERVALS[name]``
+seconds:
+
+* ``expire_reset_tokens`` clears ``User.last_reset_token`` once the reset
+  request it came from has expired.
+* ``prune_reset_requests`` deletes reset requests that expired more than
+  ``RESET_REQUEST_RETENTION_DAYS`` ago (their days are already rolled up).
+* ``optimize_database`` runs ``ANALYZE`` (sampled, ``PRAGMA analysis_limit``)
+  and ``PRAGMA optimize`` on the SQLite databases, and hands free pages
+  back to the filesystem with ``PRAGMA incremental_vacuum`` where
+  ``auto_vacuum`` is ``INCREMENTAL``.
+* ``refresh_stats`` brings the daily rollups up to date and compacts the
+  lesson view log.
+
+Every job has a ``maintenance_job`` row. A worker only runs a job after
+taking its lease, a single conditional ``UPDATE`` that succeeds only when
+the lease has lapsed and the job is due, so scheduler threads in every
+worker (and a cron entry) run each job once. Row-by-row work goes in
+chunks of ``MAINTENANCE_BATCH_SIZE``, each its own transaction, with
+``MAINTENANCE_PAUSE_SECONDS`` between them, so requests get SQLite's write
+lock in between. Durations go to ``raven_maintenance_job_seconds``.
+"""
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+import models
+from metrics import MAINTENANCE_SECONDS, flush_metrics
+
+maintenance_cli = AppGroup('maintenance', help='Scheduled housekeeping jobs.')
+
+Job = namedtuple('Job', 'name run help')
+JOBS = OrderedDict()
+
+DEFAULT_INTERVALS = {
+    'expire_reset_tokens': 3600,
+    'prune_reset_requests': 24 * 3600,
+    'optimize_database': 24 * 3600,
+    'refresh_stats': 15 * 60,
+}
+
+_state_lock = threading.Lock()
+_worker = None
+
+
+def job(name):
+    def register(run):
+        JOBS[name] = Job(name, run, run.__doc__.strip().splitlines()[0])
+        return run
+    return register
+
+
+def _in_chunks(ids_query, apply):
+    """``apply(connection, ids)`` to successive chunks of ``ids_query``; returns rows done"""
+    config = current_app.config
+    batch_size, pause = config['MAINTENANCE_BATCH_SIZE'], config['MAINTENANCE_PAUSE_SECONDS']
+    done = 0
+    while True:
+        with db.engine.begin() as connection:
+            ids = connection.scalars(ids_query.limit(batch_size)).all()
+            if ids:
+                done += apply(connection, ids)
+        if len(ids) < batch_size:
+            return done
+        time.sleep(pause)
+
+
+# ------------------------
+# Jobs
+# ------------------------
+
+@job('expire_reset_tokens')
+def expire_reset_tokens():
+    """Clear reset tokens whose request has expired."""
+    user, requests = models.User.__table__, models.PasswordResetRequest.__table__
+    now = datetime.utcnow()
+    # A token without a request row predates it being logged, or its row was
+    # pruned long after it expired
+    live = select(requests.c.id).where(requests.c.token == user.c.last_reset_token, requests.c.expires_at > now)
+    stale = [user.c.last_reset_token.isnot(None), ~live.exists()]
+
+    def clear(connection, ids):
+        # Re-checked here in case the user asked for a new token meanwhile
+        return connection.execute(
+            update(user).where(user.c.id.in_(ids), *stale).values(last_reset_token=None)).rowcount
+
+    return {'tokens': _in_chunks(select(user.c.id).where(*stale).order_by(user.c.id), clear)}
+
+
+@job('prune_reset_requests')
+def prune_reset_requests():
+    """Delete long-expired password reset requests."""
+    requests = models.PasswordResetRequest.__table__
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['RESET_REQUEST_RETENTION_DAYS'])
+
+    def delete(connection, ids):
+        return connection.execute(requests.delete().where(requests.c.id.in_(ids))).rowcount
+
+    expired = select(requests.c.id).where(requests.c.expires_at < cutoff).order_by(requests.c.id)
+    return {'requests': _in_chunks(expired, delete)}
+
+
+def _optimize_sqlite(engine):
+    config = current_app.config
+    freed = 0
+    with engine.connect() as connection:
+        connection.exec_driver_sql(f'PRAGMA analysis_limit={int(config["MAINTENANCE_ANALYSIS_LIMIT"])}')
+        connection.exec_driver_sql('ANALYZE')
+        connection.exec_driver_sql('PRAGMA optimize')
+        incremental = connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2
+        while incremental:
+            free = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+            if not free:
+                break
+            pages = min(free, config['MAINTENANCE_VACUUM_PAGES'])
+            # pysqlite's execute() steps a statement once, which frees one
+            # page; executescript() steps it to completion
+            connection.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({pages})')
+            freed += pages
+            time.sleep(config['MAINTENANCE_PAUSE_SECONDS'])
+        connection.commit()
+    return freed if incremental else None
+
+
+@job('optimize_database')
+def optimize_database():
+    """Refresh SQLite planner statistics and release free pages."""
+    result = {}
+    for name, engine in (('main', db.engine), ('analytics', db.engines.get('analytics'))):
+        if engine is None or engine.dialect.name != 'sqlite':
+            continue
+        freed = _optimize_sqlite(engine)
+        result[name] = 'analyzed' if freed is None else f'analyzed, {freed} pages freed'
+    return result
+
+
+@job('refresh_stats')
+def refresh_stats():
+    """Update the daily rollups and fold lesson views into their counts."""
+    import analytics
+    result = {f'{metric} days': rows for metric, rows in analytics.rollup().items()}
+    view_log = current_app.extensions.get('view_log')
+    if view_log is not None:
+        view_log.flush()
+        result['views folded'] = view_log.compact()
+    return result
+
+
+# ------------------------
+# Leases and runs
+# ------------------------
+
+def _owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'[:100]
+
+
+def _ensure_rows():
+    table = models.MaintenanceJob.__table__
+    with db.engine.connect() as connection:
+        existing = set(connection.scalars(select(table.c.name)))
+    for name in JOBS:
+        if name in existing:
+            continue
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(table).values(name=name))
+        except IntegrityError:
+            pass  # another worker added it first
+
+
+def _acquire(name, owner, interval=None):
+    """Take the job's lease if it has lapsed (and the job is due); True if taken"""
+    table = models.MaintenanceJob.__table__
+    now = datetime.utcnow()
+    conditions = [table.c.name == name, or_(table.c.locked_until.is_(None), table.c.locked_until < now)]
+    if interval is not None:
+        conditions.append(or_(table.c.last_started.is_(None),
+                              table.c.last_started <= now - timedelta(seconds=interval)))
+    lease = timedelta(seconds=current_app.config['MAINTENANCE_LOCK_SECONDS'])
+    with db.engine.begin() as connection:
+        taken = connection.execute(update(table).where(*conditions).values(
+            locked_by=owner, locked_until=now + lease, last_started=now)).rowcount
+    return taken == 1
+
+
+def _release(name, owner, seconds, result=None, error=None):
+    table = models.MaintenanceJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(update(table).where(table.c.name == name, table.c.locked_by == owner).values(
+            locked_by=None, locked_until=None, last_finished=datetime.utcnow(), last_seconds=seconds,
+            last_result=result and result[:200], last_error=error))
+
+
+def _describe(result):
+    if isinstance(result, dict):
+        return ', '.join(f'{key}: {value}' for key, value in result.items()) or 'nothing to do'
+    return str(result)
+
+
+def run_job(name, force=False):
+    """Run one job if this worker gets its lease.
+
+    Returns ``(outcome, seconds, description)``; outcome is ``'ok'``,
+    ``'error'`` or ``'skipped'`` (not due, or running elsewhere). With
+    ``force`` the interval is ignored but a running lease is still honoured.
+    """
+    app = current_app._get_current_object()
+    interval = None if force else app.config['MAINTENANCE_INTERVALS'][name]
+    owner = _owner()
+    if not _acquire(name, owner, interval):
+        return 'skipped', 0.0, None
+    started = time.perf_counter()
+    try:
+        description = _describe(JOBS[name].run())
+    except Exception as e:
+        db.session.rollback()
+        seconds = time.perf_counter() - started
+        MAINTENANCE_SECONDS.observe(seconds, job=name, outcome='error')
+        _release(name, owner, seconds, error=str(e))
+        app.logger.error(f'Maintenance job {name} failed: {e}')
+        return 'error', seconds, str(e)
+    seconds = time.perf_counter() - started
+    MAINTENANCE_SECONDS.observe(seconds, job=name, outcome='ok')
+    _release(name, owner, seconds, result=description)
+    return 'ok', seconds, description
+
+
+def run_due(names=None, force=False):
+    """Run every due job (or just ``names``); returns ``[(name, outcome, seconds, description)]``"""
+    _ensure_rows()
+    runs = []
+    for name in names or JOBS:
+        runs.append((name, *run_job(name, force)))
+    if current_app.config.get('METRICS'):
+        try:
+            flush_metrics(current_app)
+        except OSError:
+            pass
+    return runs
+
+
+def job_status():
+    """Every job's row, in run order"""
+    rows = {row.name: row for row in models.MaintenanceJob.query.all()}
+    return [(job, rows.get(name)) for name, job in JOBS.items()]
+
+
+# ------------------------
+# Scheduler thread
+# ------------------------
+
+def _run_scheduler(app):
+    while True:
+        with app.app_context():
+            try:
+                run_due()
+            except Exception as e:
+                app.logger.error(f'Maintenance scheduler failed: {e}')
+            finally:
+                db.session.remove()
+        time.sleep(app.config['MAINTENANCE_TICK_SECONDS'])
+
+
+def start_scheduler(app):
+    """Start this worker's scheduler thread unless it is already running"""
+    global _worker
+    with _state_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_scheduler, args=(app,), name='maintenance', daemon=True)
+            _worker.start()
+
+
+def init_maintenance(app):
+    app.config.setdefault('MAINTENANCE_SCHEDULER', False)
+    app.config.setdefault('MAINTENANCE_TICK_SECONDS', 60.0)
+    app.config.setdefault('MAINTENANCE_LOCK_SECONDS', 1800)
+    app.config.setdefault('MAINTENANCE_BATCH_SIZE', 500)
+    app.config.setdefault('MAINTENANCE_PAUSE_SECONDS', 0.05)
+    app.config.setdefault('MAINTENANCE_VACUUM_PAGES', 1000)
+    app.config.setdefault('MAINTENANCE_ANALYSIS_LIMIT', 1000)
+    app.config.setdefault('RESET_REQUEST_RETENTION_DAYS', 30)
+    app.config['MAINTENANCE_INTERVALS'] = {**DEFAULT_INTERVALS, **app.config.get('MAINTENANCE_INTERVALS', {})}
+    app.cli.add_command(maintenance_cli)
+
+    if app.config['MAINTENANCE_SCHEDULER']:
+        # Started by the first request rather than here, so CLI commands
+        # (`flask db upgrade` included) never start it
+        @app.before_request
+        def ensure_maintenance_scheduler():
+            if _worker is None or not _worker.is_alive():
+                start_scheduler(app)
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@maintenance_cli.command('run')
+@click.argument('names', nargs=-1, type=click.Choice(list(JOBS)))
+@click.option('--force', is_flag=True, help='Run even if not due yet.')
+def run_command(names, force):
+    """Run the due maintenance jobs (or just NAMES)."""
+    failed = False
+    for name, outcome, seconds, description in run_due(names or None, force=force or bool(names)):
+        if outcome == 'skipped':
+            click.echo(f'{name}: not due or running elsewhere')
+        else:
+            click.echo(f'{name}: {outcome} in {seconds:.2f}s ({description})')
+            failed = failed or outcome == 'error'
+    if failed:
+        raise SystemExit(1)
+
+
+@maintenance_cli.command('status')
+def status_command():
+    """Show when each maintenance job last ran."""
+    for job, row in job_status():
+        if row is None or row.last_finished is None:
+            click.echo(f'{job.name}: never run')
+            continue
+        state = f'running on {row.locked_by}' if row.locked_by else (
+            f'failed: {row.last_error}' if row.last_error else row.last_result)
+        click.echo(f'{job.name}: {row.last_finished:%Y-%m-%d %H:%M} ({row.last_seconds:.2f}s) {state}')
@@ -0,0 +1,306 @@
+"""Prometheus-style metrics, served at ``/metrics``.
+
+Histograms cover request duration per endpoint, SQL statements and SQL
+time per request, template render time, upload processing time, bcrypt
+time and maintenance job duration. Each worker process keeps its own
+samples in memory and writes them to ``METRICS_DIR/<pid>-<id>.json`` at
+most every ``METRICS_FLUSH_SECONDS`` (and on exit). A scrape writes the
+serving worker's file and then adds up every file in the directory, so
+preforked workers report as one application. Files of workers that have
+exited are kept so their counts never go backwards; clear the directory
+when deploying.
+
+``/metrics`` is for admins, or for a scraper sending
+``Authorization: Bearer <METRICS_TOKEN>``.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from flask_bcrypt import Bcrypt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SECONDS_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+JOB_BUCKETS = (.1, .5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class Histogram:
+    """Bucket counts, sum and count per combination of label values"""
+
+    def __init__(self, name, help, labels, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.samples = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with _lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def dump(self):
+        return {
+            'help': self.help,
+            'labels': self.labels,
+            'buckets': self.buckets,
+            'samples': [[list(key), counts[:], total, count] for key, (counts, total, count) in self.samples.items()],
+        }
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+_lock = threading.Lock()
+
+REQUEST_SECONDS = Histogram('raven_request_duration_seconds', 'Time to handle a request.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_STATEMENTS = Histogram('raven_request_sql_statements', 'SQL statements run by one request.',
+                               ('endpoint',), STATEMENT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('raven_request_sql_seconds', 'Time one request spent in SQL statements.',
+                                ('endpoint',))
+RENDER_SECONDS = Histogram('raven_template_render_seconds', 'Time to render a template.', ('template',))
+UPLOAD_SECONDS = Histogram('raven_upload_processing_seconds', 'Time to resize and store an uploaded image.',
+                           ('folder',))
+BCRYPT_SECONDS = Histogram('raven_bcrypt_seconds', 'Time spent hashing or checking a password.', ('operation',))
+MAINTENANCE_SECONDS = Histogram('raven_maintenance_job_seconds', 'Time one run of a maintenance job took.',
+                                ('job', 'outcome'), JOB_BUCKETS)
+
+METRICS = (REQUEST_SECONDS, REQUEST_STATEMENTS, REQUEST_SQL_SECONDS, RENDER_SECONDS, UPLOAD_SECONDS, BCRYPT_SECONDS,
+           MAINTENANCE_SECONDS)
+
+
+# ------------------------
+# Instrumentation
+# ------------------------
+
+def observe_upload(save):
+    """Time a ``save_picture(form_picture, path, ...)`` helper by target folder"""
+    @wraps(save)
+    def wrapper(form_picture, path, *args, **kwargs):
+        with UPLOAD_SECONDS.time(folder=os.path.basename(path)):
+            return save(form_picture, path, *args, **kwargs)
+    return wrapper
+
+
+class InstrumentedBcrypt(Bcrypt):
+    """Flask-Bcrypt that reports its time to ``raven_bcrypt_seconds``"""
+
+    def generate_password_hash(self, password, rounds=None, prefix=None):
+        with BCRYPT_SECONDS.time(operation='hash'):
+            return super().generate_password_hash(password, rounds, prefix)
+
+    def check_password_hash(self, pw_hash, password):
+        with BCRYPT_SECONDS.time(operation='check'):
+            return super().check_password_hash(pw_hash, password)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_sql' in g:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None and has_request_context() and 'metrics_sql' in g:
+        g.metrics_sql[0] += 1
+        g.metrics_sql[1] += time.perf_counter() - started
+
+
+def _render_started(app, template, context, **extra):
+    if has_request_context():
+        g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+
+def _render_finished(app, template, context, **extra):
+    renders = g.get('metrics_renders') if has_request_context() else None
+    if renders:
+        RENDER_SECONDS.observe(time.perf_counter() - renders.pop(), template=template.name)
+
+
+# ------------------------
+# Per-process files
+# ------------------------
+
+class _ProcessFile:
+    """This worker's metrics file; a forked worker starts a fresh one"""
+
+    def __init__(self):
+        self.pid = None
+        self.path = None
+        self.flushed = 0.0
+
+    def write(self, directory):
+        if self.pid != os.getpid():
+            # Samples copied from the parent at fork belong to its file
+            if self.pid is not None:
+                with _lock:
+                    for metric in METRICS:
+                        metric.samples.clear()
+            self.pid = os.getpid()
+            self.path = os.path.join(directory, f'{self.pid}-{uuid.uuid4().hex[:8]}.json')
+        with _lock:
+            data = {metric.name: metric.dump() for metric in METRICS}
+        temp = f'{self.path}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp, self.path)
+        self.flushed = time.monotonic()
+
+
+_process_file = _ProcessFile()
+
+
+def flush_metrics(app, force=False):
+    if force or time.monotonic() - _process_file.flushed >= app.config['METRICS_FLUSH_SECONDS']:
+        _process_file.write(app.config['METRICS_DIR'])
+
+
+def collect(directory):
+    """Every worker's samples added up: ``{name: dump}``"""
+    merged = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # a worker is replacing it right now; next scrape gets it
+        for metric_name, dump in data.items():
+            target = merged.setdefault(metric_name, dict(dump, samples={}))
+            for key, counts, total, count in dump['samples']:
+                sample = target['samples'].setdefault(tuple(key), [[0] * len(counts), 0.0, 0])
+                sample[0] = [a + b for a, b in zip(sample[0], counts)]
+                sample[1] += total
+                sample[2] += count
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render_text(merged):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name in sorted(merged):
+        dump = merged[name]
+        lines.append(f'# HELP {name} {dump["help"]}')
+        lines.append(f'# TYPE {name} histogram')
+        for key in sorted(dump['samples']):
+            counts, total, count = dump['samples'][key]
+            cumulative = 0
+            for bound, bucket in zip(dump['buckets'], counts):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{_labels(dump["labels"], key, [("le", repr(float(bound)))])} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(dump["labels"], key, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_labels(dump["labels"], key)} {total!r}')
+            lines.append(f'{name}_count{_labels(dump["labels"], key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def scrape():
+    """Text for ``/metrics``: every worker's current samples"""
+    app = current_app
+    flush_metrics(app, force=True)
+    return render_text(collect(app.config['METRICS_DIR']))
+
+
+def authorized():
+    """Admins, or a scraper with the ``METRICS_TOKEN`` bearer token"""
+    from flask_login import current_user
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    return current_user.is_authenticated and current_user.is_admin
+
+
+def init_metrics(app):
+    """Call first in ``create_app`` so request timing wraps every other hook"""
+    app.config.setdefault('METRICS', True)
+    app.config.setdefault('METRICS_FLUSH_SECONDS', 5.0)
+    app.config.setdefault('METRICS_TOKEN', None)
+    if not app.config['METRICS']:
+        return
+    if not app.config.get('METRICS_DIR'):
+        app.config['METRICS_DIR'] = os.path.join(app.instance_path, 'metrics')
+    os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    atexit.register(_flush_quietly, app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+
+    @app.after_request
+    def note_response_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request_metrics(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        endpoint = _endpoint()
+        status = 500 if exc is not None else g.pop('metrics_status', 500)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method, status=status)
+        statements, seconds = g.pop('metrics_sql')
+        REQUEST_STATEMENTS.observe(statements, endpoint=endpoint)
+        REQUEST_SQL_SECONDS.observe(seconds, endpoint=endpoint)
+        try:
+            flush_metrics(app)
+        except OSError as e:
+            app.logger.warning(f'Could not write metrics: {e}')
+
+
+def _flush_quietly(app):
+    try:
+        flush_metrics(app, force=True)
+    except OSError:
+        pass
@@ -97,6 +97,12 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            # Batch migrations copy and drop tables, which foreign key
+            # enforcement from the engine profile would refuse
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            # End the implicit transaction so alembic starts (and commits) its own
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
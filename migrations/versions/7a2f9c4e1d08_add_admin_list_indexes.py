@@ -0,0 +1,53 @@
+"""add indexes for admin list search, filters and sorting
+
+Revision ID: 7a2f9c4e1d08
+Revises: c41d7e2a9b3f
+Create Date: 2026-10-19 10:41:52.907316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a2f9c4e1d08'
+down_revision = 'c41d7e2a9b3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_is_admin'), ['is_admin'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_last_login'), ['last_login'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_lname'), ['lname'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_password_changed_at'), ['password_changed_at'], unique=False)
+
+    with op.batch_alter_table('lesson', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_lesson_date_posted'), ['date_posted'], unique=False)
+        batch_op.create_index('ix_lesson_course_id_date_posted', ['course_id', 'date_posted', 'id'], unique=False)
+        batch_op.create_index('ix_lesson_user_id_date_posted', ['user_id', 'date_posted', 'id'], unique=False)
+
+    # Expression indexes for case-insensitive prefix search
+    op.create_index('ix_user_lower_username', 'user', [sa.text('lower(username)')], unique=False)
+    op.create_index('ix_user_lower_email', 'user', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_course_lower_title', 'course', [sa.text('lower(title)')], unique=False)
+    op.create_index('ix_lesson_lower_title', 'lesson', [sa.text('lower(title)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lesson_lower_title', table_name='lesson')
+    op.drop_index('ix_course_lower_title', table_name='course')
+    op.drop_index('ix_user_lower_email', table_name='user')
+    op.drop_index('ix_user_lower_username', table_name='user')
+
+    with op.batch_alter_table('lesson', schema=None) as batch_op:
+        batch_op.drop_index('ix_lesson_user_id_date_posted')
+        batch_op.drop_index('ix_lesson_course_id_date_posted')
+        batch_op.drop_index(batch_op.f('ix_lesson_date_posted'))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_password_changed_at'))
+        batch_op.drop_index(batch_op.f('ix_user_lname'))
+        batch_op.drop_index(batch_op.f('ix_user_last_login'))
+        batch_op.drop_index(batch_op.f('ix_user_is_admin'))
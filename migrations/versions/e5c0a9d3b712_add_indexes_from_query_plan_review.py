@@ -0,0 +1,34 @@
+"""add indexes from query plan review
+
+Revision ID: e5c0a9d3b712
+Revises: b83e5d1f6a27
+Create Date: 2026-10-19 11:32:40.118653
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c0a9d3b712'
+down_revision = 'b83e5d1f6a27'
+branch_labels = None
+depends_on = None
+
+
+# Suggested by `flask db advise`. The (course_id, date_posted, id) and
+# (user_id, date_posted, id) lesson indexes already came with 7a2f9c4e1d08.
+def upgrade():
+    with op.batch_alter_table('lesson', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_lesson_slug'), ['slug'], unique=False)
+
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.create_index('ix_course_deleted_at_title', ['deleted_at', 'title'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.drop_index('ix_course_deleted_at_title')
+
+    with op.batch_alter_table('lesson', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_lesson_slug'))
@@ -1,141 +1,280 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_login import UserMixin
 from itsdangerous import URLSafeTimedSerializer as Serializer
 from flask import current_app
 
-# This will be set by the app
-db = None
-login_manager = None
+from app import db, login_manager
 
-def init_db(database, login_mgr):
-    global db, login_manager
-    db = database
-    login_manager = login_mgr
-    
-    # Set up the user loader after login_manager is initialized
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
-
-# Define models only after db is initialized
-def create_models():
-    global User, Lesson, Course
+
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
+
+
+class User(db.Model, UserMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    fname = db.Column(db.String(25), nullable=False)
+    lname = db.Column(db.String(25), nullable=False, index=True)
+    username = db.Column(db.String(25), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(60), nullable=False)
+    bio = db.Column(db.Text, nullable= True)
+    image_file = db.Column(db.String(20), nullable=False, default='default.png')
+    last_reset_token = db.Column(db.String(100), nullable=True)
+    reset_attempts = db.Column(db.Integer, default=0)
+    last_reset_attempt = db.Column(db.DateTime, nullable=True)
+    is_admin = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    password_changed_at = db.Column(db.DateTime, nullable=True, index=True)
+    last_login = db.Column(db.DateTime, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+    lesson = db.relationship('Lesson', backref='author', lazy=True)
     
-    class User(db.Model, UserMixin):
-        id = db.Column(db.Integer, primary_key=True)
-        fname = db.Column(db.String(25), nullable=False)
-        lname = db.Column(db.String(25), nullable=False)
-        username = db.Column(db.String(25), unique=True, nullable=False)
-        email = db.Column(db.String(120), unique=True, nullable=False)
-        password = db.Column(db.String(60), nullable=False)
-        bio = db.Column(db.Text, nullable= True)
-        image_file = db.Column(db.String(20), nullable=False, default='default.png')
-        last_reset_token = db.Column(db.String(100), nullable=True)
-        reset_attempts = db.Column(db.Integer, default=0)
-        last_reset_attempt = db.Column(db.DateTime, nullable=True)
-        is_admin = db.Column(db.Boolean, default=False, nullable=False)
-        password_changed_at = db.Column(db.DateTime, nullable=True)
-        last_login = db.Column(db.DateTime, nullable=True)
-        lesson = db.relationship('Lesson', backref='author', lazy=True)
+    def get_reset_token(self):
+        s = Serializer(current_app.config['SECRET_KEY'])
+        import time
+        import secrets
+        token = s.dumps({
+            'user_id': self.id, 
+            'timestamp': time.time(),
+            'random': secrets.token_hex(8)
+        }, salt='pw-reset')
+        # Store the token to prevent reuse
+        self.last_reset_token = token
+        issued_at = datetime.utcnow()
+        db.session.add(PasswordResetRequest(
+            user_id=self.id,
+            token=token,
+            created_at=issued_at,
+            expires_at=issued_at + timedelta(seconds=3600)
+        ))
+        db.session.commit()
+        return token
+    @staticmethod
+    def verify_reset_token(token, age=3600):
+        s = Serializer(current_app.config['SECRET_KEY'])
+        try:
+            data = s.loads(token, salt='pw-reset', max_age=age)
+        except:
+            return None
+        user_id = data.get('user_id') if isinstance(data, dict) else data
+        user = User.query.get(user_id)
         
-        def get_reset_token(self):
-            s = Serializer(current_app.config['SECRET_KEY'])
-            import time
-            import secrets
-            token = s.dumps({
-                'user_id': self.id, 
-                'timestamp': time.time(),
-                'random': secrets.token_hex(8)
-            }, salt='pw-reset')
-            # Store the token to prevent reuse
-            self.last_reset_token = token
-            db.session.commit()
-            return token
-        @staticmethod
-        def verify_reset_token(token, age=3600):
-            s = Serializer(current_app.config['SECRET_KEY'])
-            try:
-                data = s.loads(token, salt='pw-reset', max_age=age)
-            except:
-                return None
-            user_id = data.get('user_id') if isinstance(data, dict) else data
-            user = User.query.get(user_id)
-            
-            # Check if token matches the last issued token (prevents reuse)
-            if user and user.last_reset_token != token:
-                return None
-                
-            return user
-
-        def can_request_reset(self):
-            """Check if user can request password reset (rate limiting)"""
-            from datetime import datetime, timedelta
+        # Check if token matches the last issued token (prevents reuse)
+        if user and user.last_reset_token != token:
+            return None
             
-            # Handle None values from database
-            if self.reset_attempts is None:
-                self.reset_attempts = 0
-                
-            # If no previous attempts, allow
-            if not self.last_reset_attempt:
-                return True, None
-                
-            # If last attempt was more than 5 minutes ago, reset counter
-            if self.last_reset_attempt < datetime.utcnow() - timedelta(minutes=5):
-                self.reset_attempts = 0
-                db.session.commit()
-                return True, None
-                
-            # If less than 3 attempts in last 5 minutes, allow
-            if self.reset_attempts < 3:
-                return True, None
-                
-            # Calculate time until next attempt allowed
-            next_attempt_time = self.last_reset_attempt + timedelta(minutes=5)
-            remaining_time = next_attempt_time - datetime.utcnow()
-            remaining_minutes = int(remaining_time.total_seconds() / 60) + 1
-            
-            return False, remaining_minutes
+        return user
 
-        def increment_reset_attempt(self):
-            """Increment reset attempt counter"""
-            from datetime import datetime
+    def can_request_reset(self):
+        """Check if user can request password reset (rate limiting)"""
+        from datetime import datetime, timedelta
+        
+        # Handle None values from database
+        if self.reset_attempts is None:
+            self.reset_attempts = 0
+            
+        # If no previous attempts, allow
+        if not self.last_reset_attempt:
+            return True, None
             
-            # Handle None values from database
-            if self.reset_attempts is None:
-                self.reset_attempts = 0
-            self.reset_attempts += 1
-            self.last_reset_attempt = datetime.utcnow()
+        # If last attempt was more than 5 minutes ago, reset counter
+        if self.last_reset_attempt < datetime.utcnow() - timedelta(minutes=5):
+            self.reset_attempts = 0
             db.session.commit()
+            return True, None
+            
+        # If less than 3 attempts in last 5 minutes, allow
+        if self.reset_attempts < 3:
+            return True, None
+            
+        # Calculate time until next attempt allowed
+        next_attempt_time = self.last_reset_attempt + timedelta(minutes=5)
+        remaining_time = next_attempt_time - datetime.utcnow()
+        remaining_minutes = int(remaining_time.total_seconds() / 60) + 1
+        
+        return False, remaining_minutes
 
-        def __repr__(self):
-            return f"User('{self.fname}', '{self.lname}', '{self.username}', '{self.email}', '{self.image_file}')"
-
-    class Lesson(db.Model):
-        id = db.Column(db.Integer, primary_key=True)
-        title = db.Column(db.String(100), nullable=False)
-        date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-        content = db.Column(db.Text, nullable=False)
-        thumbnail = db.Column(db.String(20), nullable=False, default='default.jpg')
-        slug = db.Column(db.String(32), nullable=False)
-        user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-        course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
-
-        def __repr__(self):
-            return f"Lesson('{self.title}', '{self.date_posted}')"
-
-    class Course(db.Model):
-        id = db.Column(db.Integer, primary_key=True)
-        title = db.Column(db.String(50), unique=True, nullable=False)
-        description = db.Column(db.String(150), nullable=False)
-        icon = db.Column(db.String(20), nullable=False, default="default_course.jpg")
-        lessons = db.relationship("Lesson", backref="course_name", lazy=True)
-
-        def __repr__(self):
-            return f"Course('{self.title}')"
-    
-    return User, Lesson, Course
+    def increment_reset_attempt(self):
+        """Increment reset attempt counter"""
+        from datetime import datetime
+        
+        # Handle None values from database
+        if self.reset_attempts is None:
+            self.reset_attempts = 0
+        self.reset_attempts += 1
+        self.last_reset_attempt = datetime.utcnow()
+        db.session.commit()
+
+    def __repr__(self):
+        return f"User('{self.fname}', '{self.lname}', '{self.username}', '{self.email}', '{self.image_file}')"
+
+class Lesson(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    content = db.Column(db.Text, nullable=False)
+    thumbnail = db.Column(db.String(20), nullable=False, default='default.jpg')
+    slug = db.Column(db.String(32), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    # Stamped on every ORM change (conditional_get.py) for page validators
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+    # This lesson's bit in its course's progress bitsets (progress.py)
+    progress_bit = db.Column(db.Integer, nullable=False, default=0)
+    # Order within the course, numbered with gaps (lesson_order.py)
+    position = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"Lesson('{self.title}', '{self.date_posted}')"
+
+class Course(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(50), unique=True, nullable=False)
+    description = db.Column(db.String(150), nullable=False)
+    icon = db.Column(db.String(20), nullable=False, default="default_course.jpg")
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+    # Bits handed out to lessons so far, and the bits of its current lessons
+    progress_bits = db.Column(db.Integer, nullable=False, default=0)
+    progress_mask = db.Column(db.LargeBinary, nullable=True)
+    lessons = db.relationship("Lesson", backref="course_name", lazy=True)
+
+    def __repr__(self):
+        return f"Course('{self.title}')"
+
+# Case-insensitive lookups and per-course/per-author listings
+db.Index('ix_user_lower_username', db.func.lower(User.username))
+db.Index('ix_user_lower_email', db.func.lower(User.email))
+db.Index('ix_course_lower_title', db.func.lower(Course.title))
+db.Index('ix_lesson_lower_title', db.func.lower(Lesson.title))
+db.Index('ix_lesson_course_id_date_posted', Lesson.course_id, Lesson.date_posted, Lesson.id)
+db.Index('ix_lesson_course_id_position', Lesson.course_id, Lesson.position, Lesson.id)
+db.Index('ix_lesson_user_id_date_posted', Lesson.user_id, Lesson.date_posted, Lesson.id)
+# Live courses in title order (the soft-delete filter adds deleted_at IS NULL)
+db.Index('ix_course_deleted_at_title', Course.deleted_at, Course.title)
+
+
+def lower_prefix(column, prefix):
+    """``column`` starts with ``prefix`` in any case, as a range on its ``lower()`` index.
+
+    The prefix goes through the database's ``lower()`` too, so both sides fold
+    the same way (SQLite folds only ASCII letters).
+    """
+    lowered = db.func.lower(column)
+    start = db.func.lower(db.literal(prefix), type_=db.String)
+    return db.and_(lowered >= start, lowered < start.concat(chr(0x10FFFF)))
+
+
+class Enrollment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
+    enrolled_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Completed lessons as a little-endian bitset of their progress_bit
+    completed = db.Column(db.LargeBinary, nullable=False, default=b'')
+    # Where to continue; no foreign key so deleting the lesson isn't blocked
+    last_lesson_id = db.Column(db.Integer, nullable=True)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.UniqueConstraint('user_id', 'course_id', name='uq_enrollment_user_id_course_id'),)
+
+    def has_completed(self, lesson):
+        from progress import has_bit
+        return has_bit(self.completed, lesson.progress_bit)
+
+    def __repr__(self):
+        return f"Enrollment({self.user_id}, {self.course_id})"
+
+class PasswordResetRequest(db.Model):
+    __tablename__ = 'password_reset_request'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    token = db.Column(db.String(200), unique=True, nullable=False)
+    used = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"PasswordResetRequest('{self.user_id}', '{self.created_at}')"
+
+# Daily rollups, filled by `flask analytics rollup` (see analytics.py)
+class DailyMetric(db.Model):
+    __tablename__ = 'daily_metric'
+    metric = db.Column(db.String(32), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DailyMetric('{self.metric}', '{self.day}', {self.value})"
+
+class DailyLessonCount(db.Model):
+    __tablename__ = 'daily_lesson_count'
+    day = db.Column(db.Date, primary_key=True)
+    course_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    lessons = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DailyLessonCount('{self.day}', {self.course_id}, {self.user_id}, {self.lessons})"
+
+# One row per maintenance job: its lease and last run (see maintenance.py)
+class MaintenanceJob(db.Model):
+    __tablename__ = 'maintenance_job'
+    name = db.Column(db.String(50), primary_key=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_started = db.Column(db.DateTime, nullable=True)
+    last_finished = db.Column(db.DateTime, nullable=True)
+    last_seconds = db.Column(db.Float, nullable=True)
+    last_result = db.Column(db.String(200), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f"MaintenanceJob('{self.name}', '{self.last_finished}')"
+
+# Lesson views live in the separate `analytics` database; see view_log.py
+class LessonView(db.Model):
+    __bind_key__ = 'analytics'
+    __tablename__ = 'lesson_view'
+    id = db.Column(db.Integer, primary_key=True)
+    lesson_id = db.Column(db.Integer, nullable=False)
+    course_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    viewed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"LessonView({self.lesson_id}, {self.user_id}, '{self.viewed_at}')"
+
+class LessonViewCount(db.Model):
+    __bind_key__ = 'analytics'
+    __tablename__ = 'lesson_view_count'
+    lesson_id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, nullable=False, index=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"LessonViewCount({self.lesson_id}, {self.views})"
+
+class CourseViewCount(db.Model):
+    __bind_key__ = 'analytics'
+    __tablename__ = 'course_view_count'
+    course_id = db.Column(db.Integer, primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"CourseViewCount({self.course_id}, {self.views})"
+
+# Persisted slow statements (SLOW_QUERY_PERSIST); see slow_query.py
+class SlowQueryEntry(db.Model):
+    __bind_key__ = 'analytics'
+    __tablename__ = 'slow_query'
+    id = db.Column(db.Integer, primary_key=True)
+    sql = db.Column(db.Text, nullable=False)
+    params = db.Column(db.String(200), nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    origin = db.Column(db.String(200), nullable=False)
+    happened_at = db.Column(db.DateTime, nullable=False)
 
-# Initialize models as None initially
-User = None
-Lesson = None
-Course = None
\ No newline at end of file
+    def __repr__(self):
+        return f"SlowQueryEntry('{self.origin}', {self.duration_ms:.1f}ms)"
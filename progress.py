@@ -0,0 +1,248 @@
+"""Course enrollment and per-lesson progress as bitsets.
+
+Every lesson holds a ``progress_bit`` within its course, handed out from
+the course's ``progress_bits`` counter when the lesson is created or moved
+there. The counter only grows, so a bit never passes to another lesson and
+reordering lessons changes nothing. An enrollment keeps the bits of the
+lessons its user completed in ``completed``, and the course keeps the bits
+of its current lessons in ``progress_mask``; both are little-endian
+bitsets, one byte per eight lessons.
+
+"X of Y complete" is ``popcount(completed & mask)`` of ``popcount(mask)``,
+and "continue where you left off" is the enrollment's ``last_lesson_id``,
+so one joined row answers both and the dashboard lists every course a user
+takes with a single query. Deleting a lesson only clears its bit from the
+course mask.
+
+Opening a lesson moves ``last_lesson_id`` on every page a reader turns, so
+those writes are not committed by the view: ``mark_seen`` keeps the newest
+one per enrollment in memory and a background thread writes them in one
+batch every ``PROGRESS_SEEN_FLUSH_SECONDS``. "Continue" lags by up to that
+interval, and pointers still buffered when a worker dies are lost.
+"""
+import atexit
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import bindparam, event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app import db
+import models
+
+CourseProgress = namedtuple('CourseProgress', 'course_id title done total lesson_slug lesson_title')
+
+
+# ------------------------
+# Bitsets
+# ------------------------
+
+def _to_int(bits):
+    return int.from_bytes(bits or b'', 'little')
+
+
+def _to_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def has_bit(bits, bit):
+    return bool(_to_int(bits) >> bit & 1)
+
+
+def with_bit(bits, bit, on=True):
+    value = _to_int(bits)
+    return _to_bytes(value | 1 << bit if on else value & ~(1 << bit))
+
+
+def count_done(completed, mask):
+    """``(done, total)`` for a completed bitset against a course mask"""
+    mask = _to_int(mask)
+    return (_to_int(completed) & mask).bit_count(), mask.bit_count()
+
+
+# ------------------------
+# Course bit maintenance
+# ------------------------
+
+def allocate_bits(connection, course_id, count=1):
+    """Reserve ``count`` new bits in a course; returns the first"""
+    course = models.Course.__table__
+    connection.execute(course.update().where(course.c.id == course_id)
+                       .values(progress_bits=course.c.progress_bits + count))
+    return connection.scalar(select(course.c.progress_bits).where(course.c.id == course_id)) - count
+
+
+def sync_progress_masks(connection, course_ids):
+    """Rebuild the course masks from the bits their lessons hold now"""
+    course, lesson = models.Course.__table__, models.Lesson.__table__
+    for course_id in course_ids:
+        mask = 0
+        for bit in connection.scalars(select(lesson.c.progress_bit).where(lesson.c.course_id == course_id)):
+            mask |= 1 << bit
+        connection.execute(course.update().where(course.c.id == course_id).values(progress_mask=_to_bytes(mask)))
+
+
+def move_lesson_bits(connection, lesson_ids, course_id):
+    """Give lessons moved into a course without the ORM (bulk moves) fresh bits"""
+    if not lesson_ids:
+        return
+    lesson = models.Lesson.__table__
+    first = allocate_bits(connection, course_id, len(lesson_ids))
+    connection.execute(
+        lesson.update().where(lesson.c.id == bindparam('lesson')).values(progress_bit=bindparam('bit')),
+        [{'lesson': lesson_id, 'bit': first + i} for i, lesson_id in enumerate(lesson_ids)],
+    )
+
+
+def _joins_course(session, lesson):
+    if lesson in session.new:
+        return True
+    attrs = inspect(lesson).attrs
+    return attrs.course_id.history.has_changes() or bool(attrs.course_name.history.added)
+
+
+def _assign_bits(session, flush_context, instances):
+    for lesson in chain(session.new, session.dirty):
+        if not isinstance(lesson, models.Lesson) or not _joins_course(session, lesson):
+            continue
+        added = inspect(lesson).attrs.course_name.history.added
+        course = added[0] if added else None
+        if course is not None and course.id is None:
+            # The course is being created in this flush too
+            lesson.progress_bit = course.progress_bits or 0
+            course.progress_bits = lesson.progress_bit + 1
+        else:
+            course_id = course.id if course is not None else lesson.course_id
+            lesson.progress_bit = allocate_bits(session.connection(), course_id)
+
+
+def _sync_masks(session, flush_context):
+    course_ids = set()
+    for lesson in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(lesson, models.Lesson):
+            continue
+        history = inspect(lesson).attrs.course_id.history
+        if lesson in session.dirty and not history.has_changes():
+            continue
+        course_ids.update(course_id for course_id in chain(*history) if course_id is not None)
+    if course_ids:
+        sync_progress_masks(session.connection(), sorted(course_ids))
+
+
+# ------------------------
+# Enrollments
+# ------------------------
+
+def enrollment_for(user_id, course_id):
+    return models.Enrollment.query.filter_by(user_id=user_id, course_id=course_id).first()
+
+
+def enroll(user_id, course_id):
+    """The user's enrollment in a course, created if needed (not committed)"""
+    enrollment = enrollment_for(user_id, course_id)
+    if enrollment is None:
+        enrollment = models.Enrollment(user_id=user_id, course_id=course_id, completed=b'')
+        db.session.add(enrollment)
+    return enrollment
+
+
+def set_completed(enrollment, lesson, done=True):
+    enrollment.completed = with_bit(enrollment.completed, lesson.progress_bit, done)
+    enrollment.last_lesson_id = lesson.id
+    enrollment.last_seen_at = datetime.utcnow()
+
+
+def mark_seen(enrollment_id, lesson_id):
+    """Remember the lesson to continue from; written by the seen log, not this session"""
+    current_app.extensions['seen_log'].record(enrollment_id, lesson_id)
+
+
+def course_progress(user_id):
+    """Progress in every course the user is enrolled in, most recent first"""
+    Enrollment, Course, Lesson = models.Enrollment, models.Course, models.Lesson
+    rows = (
+        db.session.query(Enrollment.course_id, Course.title, Enrollment.completed, Course.progress_mask,
+                         Lesson.slug, Lesson.title)
+        .join(Course, Enrollment.course_id == Course.id)
+        .outerjoin(Lesson, (Lesson.id == Enrollment.last_lesson_id) & (Lesson.course_id == Enrollment.course_id))
+        .filter(Enrollment.user_id == user_id)
+        .order_by(Enrollment.last_seen_at.desc(), Enrollment.enrolled_at.desc())
+    )
+    return [CourseProgress(course_id, title, *count_done(completed, mask), slug, lesson_title)
+            for course_id, title, completed, mask, slug, lesson_title in rows]
+
+
+# ------------------------
+# Seen log
+# ------------------------
+
+class SeenLog:
+    """Keeps the newest lesson seen per enrollment and writes them in batches"""
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_seconds = app.config['PROGRESS_SEEN_FLUSH_SECONDS']
+        self.pending = {}  # enrollment id -> (lesson id, seen at)
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def record(self, enrollment_id, lesson_id):
+        with self.lock:
+            self.pending[enrollment_id] = (lesson_id, datetime.utcnow())
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='seen-log', daemon=True)
+                self.worker.start()
+
+    def flush(self):
+        """Write everything buffered so far; returns how many enrollments went"""
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return 0
+        enrollment = models.Enrollment.__table__
+        # A later set_completed() or another worker's flush may have moved
+        # the pointer on already; only a newer visit replaces it
+        statement = enrollment.update().where(
+            enrollment.c.id == bindparam('enrollment'),
+            or_(enrollment.c.last_seen_at.is_(None), enrollment.c.last_seen_at < bindparam('seen')),
+        ).values(last_lesson_id=bindparam('lesson'), last_seen_at=bindparam('seen'))
+        rows = [{'enrollment': enrollment_id, 'lesson': lesson_id, 'seen': seen}
+                for enrollment_id, (lesson_id, seen) in batch.items()]
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                connection.execute(statement, rows)
+        except Exception:
+            # Keep them for the next attempt unless a newer visit came in
+            with self.lock:
+                for enrollment_id, seen in batch.items():
+                    self.pending.setdefault(enrollment_id, seen)
+            raise
+        return len(rows)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f'Seen log flush failed: {e}')
+
+
+def _flush_quietly(seen_log):
+    try:
+        seen_log.flush()
+    except Exception:
+        pass
+
+
+def init_progress(app):
+    app.config.setdefault('PROGRESS_SEEN_FLUSH_SECONDS', 2.0)
+    app.extensions['seen_log'] = seen_log = SeenLog(app)
+    atexit.register(_flush_quietly, seen_log)
+    if not event.contains(Session, 'before_flush', _assign_bits):
+        event.listen(Session, 'before_flush', _assign_bits)
+        event.listen(Session, 'after_flush', _sync_masks)
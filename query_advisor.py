@@ -0,0 +1,271 @@
+"""``flask db advise``: record every route's SQL and review its query plans.
+
+Each GET route is requested through the test client (signed in as the
+first admin, with sample URL arguments taken from the database) against
+throwaway copies of every bind, so views that write on GET leave the real
+databases alone. Statements are captured per bind and ``EXPLAIN QUERY
+PLAN`` is run on each distinct one with that bind's engine. Full table
+scans and temporary B-trees are flagged, and a composite index is
+suggested from the statement's equality, range and ORDER BY columns when
+no existing index already covers them.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask_migrate.cli import db as db_cli
+from sqlalchemy import create_engine, event, inspect
+
+from app import db
+from query_tracker import normalize_sql
+import models
+
+_COLUMN = r'"?(\w+)"?\."?(\w+)"?'
+_EQUALITY = re.compile(_COLUMN + r'\s*(?:=\s*\?|IS NULL|IN\s*\()', re.IGNORECASE)
+_RANGE = re.compile(_COLUMN + r'\s*(?:>=|<=|>|<|LIKE)\s*\?', re.IGNORECASE)
+_ORDER_BY = re.compile(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|\)|$)', re.IGNORECASE | re.DOTALL)
+_WHERE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+# URL arguments filled from the first matching row
+_SAMPLE_ARGS = {
+    'course_title': lambda: models.Course.query.with_entities(models.Course.title).first(),
+    'course_id': lambda: models.Course.query.with_entities(models.Course.id).first(),
+    'lesson_slug': lambda: models.Lesson.query.with_entities(models.Lesson.slug).first(),
+    'lesson_id': lambda: models.Lesson.query.with_entities(models.Lesson.id).first(),
+    'author_id': lambda: models.User.query.with_entities(models.User.id).first(),
+    'user_id': lambda: models.User.query.with_entities(models.User.id).first(),
+}
+
+# Routes that change state even on GET
+_SKIP_ENDPOINTS = {'static', 'users.logout'}
+
+
+@contextmanager
+def _capture_statements(engines, sink):
+    """Append ``(bind, sql, params)`` for each statement run on any of ``engines``"""
+    listeners = []
+    for key, engine in engines.items():
+        def capture(conn, cursor, statement, parameters, context, executemany, key=key):
+            if not executemany:
+                sink.append((key, statement, parameters))
+        event.listen(engine, 'before_cursor_execute', capture)
+        listeners.append((engine, capture))
+    try:
+        yield sink
+    finally:
+        for engine, capture in listeners:
+            event.remove(engine, 'before_cursor_execute', capture)
+
+
+@contextmanager
+def _scratch_databases(directory):
+    """Point every bind at a copy of its SQLite database for the duration"""
+    engines = db.engines
+    originals = dict(engines)
+    db.session.remove()
+    try:
+        for key, engine in originals.items():
+            path = os.path.join(directory, f'{key or "default"}.db')
+            source = engine.raw_connection()
+            target = sqlite3.connect(path)
+            try:
+                source.driver_connection.backup(target)
+            finally:
+                target.close()
+                source.close()
+            engines[key] = create_engine(f'sqlite:///{path}')
+        yield engines
+    finally:
+        db.session.remove()
+        for key, engine in originals.items():
+            if engines[key] is not engine:
+                engines[key].dispose()
+                engines[key] = engine
+
+
+def _sample_args(rule):
+    values = {}
+    for argument in rule.arguments:
+        sampler = _SAMPLE_ARGS.get(argument)
+        row = sampler() if sampler else None
+        if row is None:
+            return None
+        values[argument] = row[0]
+    return values
+
+
+def record_route_statements(app):
+    """Request every GET route and return {endpoint: [(bind, sql, params), ...]}"""
+    admin = models.User.query.filter_by(is_admin=True).first()
+    client = app.test_client()
+    if admin:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin.id)
+            session['_fresh'] = True
+
+    urls = OrderedDict()
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.endpoint):
+        if 'GET' not in rule.methods or rule.endpoint in _SKIP_ENDPOINTS or rule.endpoint.endswith('.static'):
+            continue
+        args = _sample_args(rule)
+        if args is None:
+            continue
+        with app.test_request_context():
+            from flask import url_for
+            urls[rule.endpoint] = url_for(rule.endpoint, **args)
+
+    recorded = OrderedDict()
+    with tempfile.TemporaryDirectory(prefix='advise-') as directory, _scratch_databases(directory) as engines:
+        for endpoint, url in urls.items():
+            statements = []
+            with _capture_statements(engines, statements):
+                try:
+                    client.get(url)
+                except Exception as e:
+                    current_app.logger.warning(f'advise: {endpoint} failed with {e!r}; plans cover the statements before the error')
+            recorded[endpoint] = statements
+        # Buffered "continue" pointers belong to the copies too
+        app.extensions['seen_log'].flush()
+    return recorded
+
+
+def _existing_indexes(inspector, table):
+    # Expression indexes can't be reflected and never match plain columns anyway
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return _reflect_indexes(inspector, table)
+
+
+def _reflect_indexes(inspector, table):
+    primary_key = tuple(inspector.get_pk_constraint(table)['constrained_columns'])
+    indexes = [tuple(ix['column_names']) for ix in inspector.get_indexes(table) if None not in ix['column_names']]
+    indexes += [tuple(uq['column_names']) for uq in inspector.get_unique_constraints(table)]
+    # SQLite stores the rowid after the indexed columns, so each index is
+    # also ordered by the integer primary key
+    indexes += [index + primary_key for index in indexes]
+    indexes.append(primary_key)
+    return indexes
+
+
+def suggest_index(sql, table, existing):
+    """Composite index for ``table``: equality columns, then ORDER BY or range columns"""
+    where = _WHERE.search(sql)
+    where = where.group(1) if where else ''
+    equality = [col for tbl, col in _EQUALITY.findall(where) if tbl == table]
+    ranges = [col for tbl, col in _RANGE.findall(where) if tbl == table]
+    order = _ORDER_BY.search(sql)
+    order_columns = re.findall(_COLUMN, order.group(1)) if order else []
+    ordering = list(dict.fromkeys(col for tbl, col in order_columns if tbl == table))
+
+    columns = list(dict.fromkeys(equality))
+    if ordering and len(ordering) == len(order_columns):
+        columns += [col for col in ordering if col not in columns]
+    else:
+        columns += [col for col in ranges if col not in columns][:1]
+    if not columns:
+        return None
+    if any(index[:len(columns)] == tuple(columns) for index in existing):
+        return None
+    return f"CREATE INDEX ix_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})"
+
+
+def explain(connection, sql, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def advise(app):
+    """Plan review for every route; returns {endpoint: [finding, ...]}"""
+    # Let view errors reach record_route_statements instead of the error
+    # log, and keep view events and purges away from the scratch copies
+    overrides = {'PROPAGATE_EXCEPTIONS': True, 'ANALYTICS_VIEWS': False, 'PURGE_IN_BACKGROUND': False}
+    saved = {name: app.config.get(name) for name in overrides}
+    app.config.update(overrides)
+    try:
+        recorded = record_route_statements(app)
+    finally:
+        app.config.update(saved)
+    inspectors = {bind: inspect(engine) for bind, engine in db.engines.items()}
+    table_names = {bind: set(inspector.get_table_names()) for bind, inspector in inspectors.items()}
+    connections = {}
+    report = OrderedDict()
+    try:
+        for endpoint, statements in recorded.items():
+            findings = []
+            seen = set()
+            for bind, sql, parameters in statements:
+                key = normalize_sql(sql)
+                if key in seen or not key.upper().startswith('SELECT'):
+                    continue
+                seen.add(key)
+                if bind not in connections:
+                    connections[bind] = db.engines[bind].connect()
+                inspector, tables = inspectors[bind], table_names[bind]
+                plan = explain(connections[bind], sql, parameters)
+                problems = []
+                suggestions = []
+                for detail in plan:
+                    scan = _SCAN.match(detail)
+                    if scan and scan.group(1) in tables:
+                        problems.append(f'full scan of {scan.group(1)}')
+                        suggestion = suggest_index(sql, scan.group(1), _existing_indexes(inspector, scan.group(1)))
+                        if suggestion:
+                            suggestions.append(suggestion)
+                    elif 'TEMP B-TREE' in detail:
+                        problems.append(detail.lower())
+                        search = [d.split()[1] for d in plan if d.startswith(('SEARCH ', 'SCAN '))]
+                        for table in search[:1]:
+                            if table in tables:
+                                suggestion = suggest_index(sql, table, _existing_indexes(inspector, table))
+                                if suggestion:
+                                    suggestions.append(suggestion)
+                if problems:
+                    findings.append({
+                        'sql': key,
+                        'plan': plan,
+                        'problems': problems,
+                        'suggestions': list(dict.fromkeys(suggestions)),
+                    })
+            report[endpoint] = {'statements': len(statements), 'findings': findings}
+    finally:
+        for connection in connections.values():
+            connection.close()
+    return report
+
+
+@db_cli.command('advise')
+@click.option('--sql-only', is_flag=True, help='Only print the suggested CREATE INDEX statements.')
+def advise_command(sql_only):
+    """Explain every route's queries and suggest missing indexes."""
+    app = current_app._get_current_object()
+    if any(engine.dialect.name != 'sqlite' for engine in db.engines.values()):
+        raise click.ClickException('flask db advise reads SQLite query plans; point every database URL at a SQLite copy.')
+
+    report = advise(app)
+    suggestions = []
+    for endpoint, result in report.items():
+        for finding in result['findings']:
+            suggestions.extend(finding['suggestions'])
+        if sql_only:
+            continue
+        click.echo(f"{endpoint}: {result['statements']} statements, {len(result['findings'])} flagged")
+        for finding in result['findings']:
+            click.echo(f"  {finding['sql'][:160]}")
+            for problem in finding['problems']:
+                click.secho(f'    ! {problem}', fg='yellow')
+            for suggestion in finding['suggestions']:
+                click.secho(f'    + {suggestion}', fg='green')
+
+    suggestions = list(dict.fromkeys(suggestions))
+    if sql_only:
+        for suggestion in suggestions:
+            click.echo(suggestion + ';')
+    else:
+        click.echo(f'\n{len(suggestions)} index suggestion(s).')
@@ -0,0 +1,165 @@
+"""Per-request SQL statement tracking.
+
+Every statement sent to the database is grouped by its normalized SQL so
+repeated lazy loads (the classic N+1 pattern) show up in the log, or fail
+the request outright in development and CI.
+"""
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_local = threading.local()
+_budgets_lock = threading.Lock()
+_budgets_active = 0
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request or block runs more statements than allowed"""
+
+
+class RepeatedQueryError(AssertionError):
+    """Raised when the same statement repeats too often in one request"""
+
+
+def normalize_sql(statement):
+    """Strip literals and IN-list lengths so equivalent statements group together"""
+    sql = _STRING.sub('?', statement)
+    sql = _NUMBER.sub('?', sql)
+    sql = _POSTCOMPILE.sub('(?)', sql)
+    sql = _IN_LIST.sub('(?)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryLog:
+    """Counts statements, grouped by normalized SQL"""
+
+    def __init__(self):
+        self.total = 0
+        self.statements = Counter()
+
+    def record(self, statement):
+        key = normalize_sql(statement)
+        self.total += 1
+        self.statements[key] += 1
+        return key, self.statements[key]
+
+    def repeated(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def _budget_logs():
+    if not hasattr(_local, 'logs'):
+        _local.logs = []
+    return _local.logs
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail if the wrapped block runs more than ``max_queries`` statements.
+
+    Meant for tests::
+
+        with query_budget(6):
+            client.get('/lessons/lesson/intro')
+    """
+    log = QueryLog()
+    logs = _budget_logs()
+    logs.append(log)
+    _count_budget(1)
+    try:
+        yield log
+    finally:
+        logs.remove(log)
+        _count_budget(-1)
+    if log.total > max_queries:
+        raise QueryBudgetExceeded(_describe(
+            f'{log.total} queries exceeded the budget of {max_queries}', log))
+
+
+def _describe(headline, log, limit=5):
+    lines = [headline]
+    for sql, count in log.statements.most_common(limit):
+        lines.append(f'  {count}x {sql[:200]}')
+    return '\n'.join(lines)
+
+
+def _count_budget(change):
+    """Listen on every engine only while some ``query_budget`` block is open"""
+    global _budgets_active
+    with _budgets_lock:
+        _budgets_active += change
+        listening = event.contains(Engine, 'before_cursor_execute', _record_budgets)
+        if _budgets_active and not listening:
+            event.listen(Engine, 'before_cursor_execute', _record_budgets)
+        elif not _budgets_active and listening:
+            event.remove(Engine, 'before_cursor_execute', _record_budgets)
+
+
+def _record_budgets(conn, cursor, statement, parameters, context, executemany):
+    for log in _budget_logs():
+        log.record(statement)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    log = g.get('_query_log')
+    if log is None:
+        return
+    sql, count = log.record(statement)
+    if count == current_app.config['QUERY_REPEAT_THRESHOLD'] and current_app.config['QUERY_TRACKER_RAISE']:
+        # Raise here rather than after the request so the traceback points
+        # at the template line or view that triggered the lazy load
+        raise RepeatedQueryError(f'Statement repeated {count} times in {request.endpoint}: {sql[:200]}')
+
+
+def init_query_tracker(app):
+    """When enabled, attach the tracker to the app's engines and each request"""
+    app.config.setdefault('QUERY_TRACKER_ENABLED', False)
+    app.config.setdefault('QUERY_TRACKER_RAISE', False)
+    app.config.setdefault('QUERY_REPEAT_THRESHOLD', 5)
+    app.config.setdefault('QUERY_BUDGETS', {})
+
+    if not app.config['QUERY_TRACKER_ENABLED']:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+
+    @app.before_request
+    def start_query_log():
+        g._query_log = QueryLog()
+
+    @app.after_request
+    def report_query_log(response):
+        log = g.pop('_query_log', None)
+        if log is None:
+            return response
+        response.headers['X-Query-Count'] = str(log.total)
+
+        raise_errors = app.config['QUERY_TRACKER_RAISE']
+        for sql, count in log.repeated(app.config['QUERY_REPEAT_THRESHOLD']):
+            app.logger.warning(f'Possible N+1 in {request.endpoint}: {count}x {sql[:200]}')
+
+        budget = app.config['QUERY_BUDGETS'].get(request.endpoint)
+        if budget is not None and log.total > budget:
+            message = _describe(f'{request.endpoint} ran {log.total} queries, budget is {budget}', log)
+            if raise_errors:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
@@ -0,0 +1,45 @@
+// Course typeahead for CourseField: suggests titles from courses.typeahead
+// and keeps the hidden course id in step with the chosen title.
+(function () {
+  function attach(input) {
+    var hidden = document.getElementById(input.dataset.target);
+    var list = document.getElementById(input.getAttribute('list'));
+    var ids = {};
+    var timer = null;
+
+    function fill(courses) {
+      list.innerHTML = '';
+      ids = {};
+      courses.forEach(function (course) {
+        var option = document.createElement('option');
+        option.value = course.title;
+        list.appendChild(option);
+        ids[course.title] = course.id;
+      });
+      sync();
+    }
+
+    function sync() {
+      // An id only for a title picked from the suggestions
+      hidden.value = ids.hasOwnProperty(input.value) ? ids[input.value] : '';
+    }
+
+    input.addEventListener('input', function () {
+      sync();
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var url = input.dataset.courseTypeahead + '?q=' + encodeURIComponent(input.value);
+        fetch(url, {credentials: 'same-origin'})
+          .then(function (response) { return response.json(); })
+          .then(function (body) { fill(body.data); });
+      }, 200);
+    });
+  }
+
+  document.querySelectorAll('[data-course-typeahead]').forEach(function (input) {
+    if (!input.dataset.typeaheadReady) {
+      input.dataset.typeaheadReady = '1';
+      attach(input);
+    }
+  });
+})();
@@ -0,0 +1,59 @@
+// Drag-and-drop lesson order on the course page (admins). Each drop sends
+// the moved lesson and its new neighbour to courses.reorder_lessons.
+(function () {
+  function attach(list) {
+    var dragged = null;
+
+    list.querySelectorAll('[data-lesson-id]').forEach(function (item) {
+      item.setAttribute('draggable', 'true');
+      item.addEventListener('dragstart', function (event) {
+        dragged = item;
+        event.dataTransfer.effectAllowed = 'move';
+        item.classList.add('opacity-50');
+      });
+      item.addEventListener('dragend', function () {
+        item.classList.remove('opacity-50');
+      });
+      item.addEventListener('dragover', function (event) {
+        if (!dragged || dragged === item) {
+          return;
+        }
+        event.preventDefault();
+        var box = item.getBoundingClientRect();
+        var below = event.clientY > box.top + box.height / 2;
+        list.insertBefore(dragged, below ? item.nextElementSibling : item);
+      });
+    });
+
+    list.addEventListener('drop', function (event) {
+      if (!dragged) {
+        return;
+      }
+      event.preventDefault();
+      var previous = dragged.previousElementSibling;
+      var next = dragged.nextElementSibling;
+      var body = {lesson_id: Number(dragged.dataset.lessonId)};
+      if (previous && previous.dataset.lessonId) {
+        body.after_id = Number(previous.dataset.lessonId);
+      } else if (next && next.dataset.lessonId) {
+        body.before_id = Number(next.dataset.lessonId);
+      } else {
+        dragged = null;
+        return;
+      }
+      dragged = null;
+      fetch(list.dataset.lessonReorder, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(body)
+      }).then(function (response) {
+        if (!response.ok) {
+          window.location.reload();
+        }
+      });
+    });
+  }
+
+  document.querySelectorAll('[data-lesson-reorder]').forEach(attach);
+})();
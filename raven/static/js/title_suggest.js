@@ -0,0 +1,57 @@
+// Course and lesson search box: lists matches from courses.suggest as links
+// below the input while typing.
+(function () {
+  function attach(input) {
+    var list = input.nextElementSibling;
+    var timer = null;
+    var latest = 0;
+
+    function fill(items) {
+      list.innerHTML = '';
+      items.forEach(function (item) {
+        var link = document.createElement('a');
+        link.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+        link.href = item.url;
+        link.textContent = item.title;
+        var kind = document.createElement('small');
+        kind.className = 'text-muted ms-2';
+        kind.textContent = item.type;
+        link.appendChild(kind);
+        list.appendChild(link);
+      });
+    }
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      if (!input.value.trim()) {
+        fill([]);
+        return;
+      }
+      timer = setTimeout(function () {
+        var request = ++latest;
+        var url = input.dataset.titleSuggest + '?q=' + encodeURIComponent(input.value);
+        fetch(url, {credentials: 'same-origin'})
+          .then(function (response) { return response.json(); })
+          .then(function (body) {
+            // Ignore answers that arrive after a newer request's
+            if (request === latest) {
+              fill(body.data);
+            }
+          });
+      }, 100);
+    });
+
+    input.addEventListener('keydown', function (event) {
+      if (event.key === 'Escape') {
+        fill([]);
+      }
+    });
+  }
+
+  document.querySelectorAll('[data-title-suggest]').forEach(function (input) {
+    if (!input.dataset.suggestReady) {
+      input.dataset.suggestReady = '1';
+      attach(input);
+    }
+  });
+})();
@@ -0,0 +1,227 @@
+"""Slow-query log: statements slower than ``SLOW_QUERY_MS``, with their origin.
+
+Each slow statement is kept with its normalized SQL, the shape of its bound
+parameters (types and lengths, never the values), its duration, the
+request endpoint and the line that caused it: the innermost Jinja template
+or ``*/routes.py`` frame on the stack, so a lazy load in a template points
+at the template line. The stack is only walked for statements over the
+threshold.
+
+Entries go into a ring buffer of ``SLOW_QUERY_BUFFER`` per worker. With
+``SLOW_QUERY_PERSIST`` they are also written to the ``analytics`` bind
+(see view_log.py) at the end of each request, trimmed to the newest
+``SLOW_QUERY_KEEP`` rows, so the admin page sees every worker's.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.engine import Engine
+
+from app import db
+from query_tracker import normalize_sql
+import models
+
+SlowQuery = namedtuple('SlowQuery', 'sql params duration_ms endpoint origin happened_at')
+Offender = namedtuple('Offender', 'sql origin calls total_ms max_ms endpoints params')
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_SKIP = (os.path.join(_ROOT, 'benchmarks'), os.path.join(_ROOT, 'migrations'))
+
+_local = threading.local()
+
+
+def param_shape(parameters, executemany=False):
+    """``(int, str[12], None)`` for the bound values; ``N x (...)`` for executemany"""
+    if executemany:
+        rows = list(parameters or ())
+        return f'{len(rows)} x {param_shape(rows[0])}' if rows else '[]'
+    if isinstance(parameters, dict):
+        values = parameters.values()
+    elif isinstance(parameters, (list, tuple)):
+        values = parameters
+    else:
+        return type(parameters).__name__
+    return '(' + ', '.join(_value_shape(value) for value in values) + ')'
+
+
+def _value_shape(value):
+    if value is None:
+        return 'None'
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def find_origin(frame):
+    """``path:line`` of the innermost template or ``routes.py`` frame"""
+    fallback = None
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return f'{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}'
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and not filename.startswith(_SKIP):
+            if filename.endswith(os.sep + 'routes.py'):
+                return f'{os.path.relpath(filename, _ROOT)}:{frame.f_lineno}'
+            if fallback is None and filename != __file__:
+                fallback = f'{os.path.relpath(filename, _ROOT)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return fallback or '?'
+
+
+class SlowQueryLog:
+    """This worker's recent slow statements, plus those waiting to be persisted"""
+
+    def __init__(self, app):
+        self.threshold = app.config['SLOW_QUERY_MS'] / 1000
+        self.persist = app.config['SLOW_QUERY_PERSIST']
+        self.keep = app.config['SLOW_QUERY_KEEP']
+        self.entries = deque(maxlen=app.config['SLOW_QUERY_BUFFER'])
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def record(self, statement, parameters, executemany, duration, frame):
+        entry = SlowQuery(
+            sql=normalize_sql(statement),
+            params=param_shape(parameters, executemany)[:200],
+            duration_ms=duration * 1000,
+            endpoint=(request.endpoint or 'unmatched') if has_request_context() else '-',
+            origin=find_origin(frame)[:200],
+            happened_at=datetime.utcnow(),
+        )
+        with self.lock:
+            self.entries.append(entry)
+            if self.persist:
+                self.pending.append(entry._asdict())
+        return entry
+
+    def flush(self):
+        """Write pending entries to the analytics bind and trim old rows"""
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        table = models.SlowQueryEntry.__table__
+        _local.writing = True
+        try:
+            with db.engines['analytics'].begin() as connection:
+                connection.execute(insert(table), batch)
+                newest = connection.scalar(select(func.max(table.c.id)))
+                connection.execute(table.delete().where(table.c.id <= newest - self.keep))
+        finally:
+            _local.writing = False
+        return len(batch)
+
+    def offenders(self, limit=25):
+        """Top statements by total time, from this worker's buffer"""
+        with self.lock:
+            entries = list(self.entries)
+        return _rank(entries, limit)
+
+
+def _rank(entries, limit):
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault((entry.sql, entry.origin), [0, 0.0, 0.0, set(), entry.params])
+        group[0] += 1
+        group[1] += entry.duration_ms
+        group[2] = max(group[2], entry.duration_ms)
+        group[3].add(entry.endpoint)
+    ranked = sorted(groups.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+    return [Offender(sql, origin, calls, total, longest, sorted(endpoints), params)
+            for (sql, origin), (calls, total, longest, endpoints, params) in ranked]
+
+
+def persisted_offenders(limit=25):
+    """Top statements by total time across every worker's persisted entries"""
+    table = models.SlowQueryEntry.__table__
+    total = func.sum(table.c.duration_ms)
+    query = (
+        select(table.c.sql, table.c.origin, func.count(), total, func.max(table.c.duration_ms),
+               func.group_concat(table.c.endpoint.distinct()), func.max(table.c.params))
+        .group_by(table.c.sql, table.c.origin)
+        .order_by(total.desc())
+        .limit(limit)
+    )
+    with db.engines['analytics'].connect() as connection:
+        rows = connection.execute(query).all()
+    return [Offender(sql, origin, calls, total_ms, max_ms, sorted((endpoints or '').split(',')), params)
+            for sql, origin, calls, total_ms, max_ms, endpoints, params in rows]
+
+
+def top_offenders(limit=25):
+    """Every worker's offenders when they are persisted, else this worker's"""
+    log = get_slow_query_log()
+    if log.persist:
+        log.flush()
+        return persisted_offenders(limit)
+    return log.offenders(limit)
+
+
+def recent(limit=50):
+    """This worker's newest slow statements, newest first"""
+    log = get_slow_query_log()
+    with log.lock:
+        return list(log.entries)[-limit:][::-1]
+
+
+def get_slow_query_log():
+    return current_app.extensions['slow_query_log']
+
+
+# ------------------------
+# Engine hooks
+# ------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._slow_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_slow_query_started', None)
+    if started is None or getattr(_local, 'writing', False) or not has_app_context():
+        return
+    log = current_app.extensions.get('slow_query_log')
+    duration = time.perf_counter() - started
+    if log is not None and duration >= log.threshold:
+        log.record(statement, parameters, executemany, duration, sys._getframe(1))
+
+
+def init_slow_query_log(app):
+    """Call after ``init_view_log`` (persisted entries use the analytics bind)"""
+    app.config.setdefault('SLOW_QUERY_LOG', True)
+    app.config.setdefault('SLOW_QUERY_MS', 100.0)
+    app.config.setdefault('SLOW_QUERY_BUFFER', 500)
+    app.config.setdefault('SLOW_QUERY_PERSIST', False)
+    app.config.setdefault('SLOW_QUERY_KEEP', 10000)
+    if not app.config['SLOW_QUERY_LOG']:
+        return
+    app.extensions['slow_query_log'] = log = SlowQueryLog(app)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if log.persist:
+        atexit.register(_flush_quietly, log)
+
+        @app.teardown_request
+        def persist_slow_queries(exc):
+            try:
+                log.flush()
+            except Exception as e:
+                app.logger.warning(f'Could not persist slow queries: {e}')
+
+
+def _flush_quietly(log):
+    try:
+        log.flush()
+    except Exception:
+        pass
@@ -0,0 +1,212 @@
+"""Soft deletes for courses and users, and the background purger.
+
+Deleting a course or user only stamps ``deleted_at``; a global ORM filter
+hides the row, and lessons under it, from every query at once. The purger
+then removes the lessons, reset requests, parent row and uploaded files in
+small transactions, so no request ever holds SQLite's write lock for long.
+
+Code that must see deleted rows opts in per query::
+
+    Course.query.execution_options(include_deleted=True)
+"""
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func, literal, select, union_all
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from app import db
+import models
+
+purge_cli = AppGroup('purge', help='Soft-delete purge commands.')
+
+_state_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+
+# Shown on the admin dashboard
+status = {
+    'running': False,
+    'last_run': None,
+    'lessons_purged': 0,
+    'parents_purged': 0,
+    'last_error': None,
+}
+
+
+# ------------------------
+# Global filter
+# ------------------------
+
+def _hide_deleted(execute_state):
+    if not execute_state.is_select or execute_state.execution_options.get('include_deleted'):
+        return
+    Course, User, Lesson = models.Course, models.User, models.Lesson
+    # Plain table columns keep these subqueries out of reach of the
+    # Course/User criteria below, which would otherwise empty them
+    deleted_courses = select(Course.__table__.c.id).where(Course.__table__.c.deleted_at.isnot(None))
+    deleted_users = select(User.__table__.c.id).where(User.__table__.c.deleted_at.isnot(None))
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(Course, Course.deleted_at.is_(None), include_aliases=True),
+        with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True),
+        with_loader_criteria(
+            Lesson,
+            Lesson.course_id.not_in(deleted_courses) & Lesson.user_id.not_in(deleted_users),
+            include_aliases=True
+        ),
+    )
+
+
+def soft_delete(obj):
+    """Hide ``obj`` right away; the purger removes it and its children later"""
+    obj.deleted_at = datetime.utcnow()
+
+
+# ------------------------
+# Purger
+# ------------------------
+
+def _including_deleted(model):
+    return model.query.execution_options(include_deleted=True)
+
+
+def _purge_lessons(column, parent_id, batch_size):
+    """Delete one chunk of lessons under a parent; returns how many went"""
+    from lessons.routes import delete_if_not_default
+    from progress import sync_progress_masks
+    Lesson = models.Lesson
+    rows = db.session.query(Lesson.id, Lesson.thumbnail, Lesson.course_id)\
+        .execution_options(include_deleted=True)\
+        .filter(column == parent_id)\
+        .limit(batch_size).all()
+    if not rows:
+        return 0
+    _including_deleted(Lesson).filter(Lesson.id.in_([lesson_id for lesson_id, _, _ in rows]))\
+        .delete(synchronize_session=False)
+    sync_progress_masks(db.session.connection(), sorted({course_id for _, _, course_id in rows}))
+    db.session.commit()
+    for _, thumbnail, _ in rows:
+        delete_if_not_default('static/lesson_thumbnails', thumbnail, Lesson.thumbnail.default.arg)
+    return len(rows)
+
+
+def _purge_parent(parent, lesson_column, batch_size, pause):
+    while True:
+        purged = _purge_lessons(lesson_column, parent.id, batch_size)
+        status['lessons_purged'] += purged
+        if purged < batch_size:
+            break
+        # Give other writers a turn at the lock between chunks
+        time.sleep(pause)
+
+    from lessons.routes import delete_if_not_default
+    if isinstance(parent, models.User):
+        models.PasswordResetRequest.query.filter_by(user_id=parent.id).delete(synchronize_session=False)
+        models.Enrollment.query.filter_by(user_id=parent.id).delete(synchronize_session=False)
+        media = ('static/user_pics', parent.image_file, 'default.png')
+    else:
+        models.Enrollment.query.filter_by(course_id=parent.id).delete(synchronize_session=False)
+        media = ('static/course_icons', parent.icon, models.Course.icon.default.arg)
+    _including_deleted(type(parent)).filter_by(id=parent.id).delete(synchronize_session=False)
+    db.session.commit()
+    delete_if_not_default(*media)
+    status['parents_purged'] += 1
+
+
+def purge_deleted(batch_size=None, pause=None):
+    """Remove every soft-deleted course and user, one small transaction at a time"""
+    config = current_app.config
+    batch_size = batch_size or config['PURGE_BATCH_SIZE']
+    pause = config['PURGE_PAUSE_SECONDS'] if pause is None else pause
+    Course, User, Lesson = models.Course, models.User, models.Lesson
+
+    purged = 0
+    for model, lesson_column in ((Course, Lesson.course_id), (User, Lesson.user_id)):
+        for parent in _including_deleted(model).filter(model.deleted_at.isnot(None)).order_by(model.deleted_at).all():
+            _purge_parent(parent, lesson_column, batch_size, pause)
+            purged += 1
+    status['last_run'] = datetime.utcnow()
+    return purged
+
+
+def pending_deletions():
+    """Soft-deleted rows still waiting for the purger, with lessons left"""
+    Course, User, Lesson = models.Course, models.User, models.Lesson
+    parents = [
+        select(literal('Course').label('kind'), Course.title.label('name'), Course.deleted_at,
+               func.count(Lesson.id).label('lessons_remaining'))
+        .outerjoin(Lesson, Lesson.course_id == Course.id)
+        .where(Course.deleted_at.isnot(None))
+        .group_by(Course.id),
+        select(literal('User').label('kind'), User.username.label('name'), User.deleted_at,
+               func.count(Lesson.id).label('lessons_remaining'))
+        .outerjoin(Lesson, Lesson.user_id == User.id)
+        .where(User.deleted_at.isnot(None))
+        .group_by(User.id),
+    ]
+    query = union_all(*parents).order_by('kind', 'deleted_at')
+    rows = db.session.execute(query, execution_options={'include_deleted': True})
+    return [dict(row._mapping) for row in rows]
+
+
+def _run_worker(app):
+    while True:
+        _wakeup.wait()
+        _wakeup.clear()
+        with app.app_context():
+            status['running'] = True
+            try:
+                purge_deleted()
+                status['last_error'] = None
+            except Exception as e:
+                db.session.rollback()
+                status['last_error'] = str(e)
+                app.logger.error(f'Purge failed: {e}')
+            finally:
+                status['running'] = False
+                db.session.remove()
+
+
+def wake_purger():
+    """Ask the background purger to run, starting it on first use"""
+    global _worker
+    app = current_app._get_current_object()
+    if not app.config['PURGE_IN_BACKGROUND']:
+        return
+    with _state_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, args=(app,), name='purger', daemon=True)
+            _worker.start()
+    _wakeup.set()
+
+
+def init_soft_delete(app):
+    app.config.setdefault('PURGE_IN_BACKGROUND', True)
+    app.config.setdefault('PURGE_BATCH_SIZE', 500)
+    app.config.setdefault('PURGE_PAUSE_SECONDS', 0.05)
+    if not event.contains(Session, 'do_orm_execute', _hide_deleted):
+        event.listen(Session, 'do_orm_execute', _hide_deleted)
+    app.cli.add_command(purge_cli)
+
+    if app.config['PURGE_IN_BACKGROUND']:
+        @app.before_request
+        def resume_purge():
+            # Pick up work a previous process left behind
+            if _worker is None:
+                wake_purger()
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@purge_cli.command('run')
+@click.option('--batch-size', type=int, default=None, help='Lessons deleted per transaction.')
+def purge_command(batch_size):
+    """Purge soft-deleted courses and users now."""
+    purged = purge_deleted(batch_size=batch_size)
+    click.echo(f'Purged {purged} courses/users and {status["lessons_purged"]} lessons.')
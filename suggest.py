@@ -0,0 +1,286 @@
+"""Course and lesson title suggestions from an in-memory prefix index.
+
+``/courses/suggest?q=`` matches the start of any word of a course or lesson
+title, ignoring case, accents and punctuation, without a database query.
+Each worker holds a ``TitleIndex``: the normalized titles in a list, and
+``array``s of packed ``slot << 8 | offset`` integers, one per word start,
+sorted by the title text from that offset on. There is one array per rank
+(course titles starting with the prefix, then lesson titles, then courses
+and lessons where a later word matches), so a lookup bisects to the first
+entry at or after the prefix in each and reads at most ``limit`` entries
+forward while they still start with it.
+
+Commits that touch a course or its lessons, including the admin bulk
+actions and the soft-delete purge, publish ``course:<id>`` on cache.py's
+invalidation bus; this worker then re-reads those courses and their
+lessons (two queries per commit) and replaces only their entries. Other
+workers' commits show up with the full rebuild every
+``SUGGEST_REBUILD_SECONDS``, which runs in a background thread and is
+swapped in when done. ``benchmarks/suggest_index.py`` reports memory and
+latency for 100k titles.
+"""
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy.orm import Session
+
+from app import db
+from cache import invalidation_bus
+import models
+
+Suggestion = namedtuple('Suggestion', 'kind id title slug course_id')
+
+_NON_WORD = re.compile(r'[\W_]+')
+_OFFSET_BITS = 8
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+# Title start before a later word, courses before lessons
+_RANKS = 4
+
+
+def normalize(title):
+    """Lower case, accents and punctuation stripped, single spaces"""
+    if not title.isascii():
+        decomposed = unicodedata.normalize('NFKD', title)
+        title = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', title.casefold()).strip()
+
+
+def _word_starts(text):
+    starts = [0] + [i + 1 for i, ch in enumerate(text) if ch == ' ']
+    return [start for start in starts if start <= _OFFSET_MASK]
+
+
+def _rank(kind, start):
+    return (start > 0) * 2 + (kind == 'lesson')
+
+
+class TitleIndex:
+    """Sorted word-start entries over normalized titles, updatable in place"""
+
+    def __init__(self):
+        self.texts = []          # normalized title per slot, None once freed
+        self.items = []          # Suggestion per slot
+        self.entries = [array('Q') for _ in range(_RANKS)]  # per rank
+        self.slots = {}          # (kind, id) -> slot
+        self.course_lessons = {}  # course id -> ids of its indexed lessons
+        self.free = []
+        self.lock = threading.Lock()
+
+    def _key(self, packed):
+        return self.texts[packed >> _OFFSET_BITS][packed & _OFFSET_MASK:]
+
+    @classmethod
+    def build(cls, suggestions):
+        """An index over ``suggestions`` at once, with one sort per rank"""
+        index = cls()
+        packed = [[] for _ in range(_RANKS)]
+        for slot, item in enumerate(suggestions):
+            text = normalize(item.title)
+            index.texts.append(text)
+            index.items.append(item)
+            index.slots[item.kind, item.id] = slot
+            if item.kind == 'lesson':
+                index.course_lessons.setdefault(item.course_id, set()).add(item.id)
+            for start in _word_starts(text):
+                packed[_rank(item.kind, start)].append(slot << _OFFSET_BITS | start)
+        for rank, entries in enumerate(packed):
+            entries.sort(key=index._key)
+            index.entries[rank] = array('Q', entries)
+        return index
+
+    def __len__(self):
+        return len(self.slots)
+
+    # Callers hold self.lock
+    def _add(self, item):
+        self._remove(item.kind, item.id)
+        text = normalize(item.title)
+        if self.free:
+            slot = self.free.pop()
+            self.texts[slot], self.items[slot] = text, item
+        else:
+            slot = len(self.texts)
+            self.texts.append(text)
+            self.items.append(item)
+        self.slots[item.kind, item.id] = slot
+        if item.kind == 'lesson':
+            self.course_lessons.setdefault(item.course_id, set()).add(item.id)
+        for start in _word_starts(text):
+            insort(self.entries[_rank(item.kind, start)], slot << _OFFSET_BITS | start, key=self._key)
+
+    def _remove(self, kind, id):
+        slot = self.slots.pop((kind, id), None)
+        if slot is None:
+            return
+        text, item = self.texts[slot], self.items[slot]
+        for start in _word_starts(text):
+            entries = self.entries[_rank(kind, start)]
+            packed = slot << _OFFSET_BITS | start
+            # Titles can repeat, so step past equal keys to this slot's entry
+            i = bisect_left(entries, text[start:], key=self._key)
+            while entries[i] != packed:
+                i += 1
+            del entries[i]
+        if kind == 'lesson':
+            self.course_lessons.get(item.course_id, set()).discard(id)
+        self.texts[slot] = self.items[slot] = None
+        self.free.append(slot)
+
+    def add(self, item):
+        with self.lock:
+            self._add(item)
+
+    def remove(self, kind, id):
+        with self.lock:
+            self._remove(kind, id)
+
+    def replace_course(self, course_id, course, lessons):
+        """Make the course's entry and its lessons match ``course`` and ``lessons``"""
+        with self.lock:
+            if course is None:
+                self._remove('course', course_id)
+            elif self._item('course', course_id) != course:
+                self._add(course)
+            current = {lesson.id: lesson for lesson in lessons}
+            for lesson_id in self.course_lessons.get(course_id, set()) - current.keys():
+                self._remove('lesson', lesson_id)
+            for lesson in lessons:
+                if self._item('lesson', lesson.id) != lesson:
+                    self._add(lesson)
+
+    def _item(self, kind, id):
+        slot = self.slots.get((kind, id))
+        return None if slot is None else self.items[slot]
+
+    def search(self, prefix, limit=10):
+        """Titles with a word starting with ``prefix``: title starts, then courses, then alphabetical"""
+        query = normalize(prefix)
+        if not query:
+            return []
+        found = {}  # slot -> Suggestion, in rank order
+        with self.lock:
+            for entries in self.entries:
+                i = bisect_left(entries, query, key=self._key)
+                for packed in entries[i:i + limit]:
+                    slot = packed >> _OFFSET_BITS
+                    if not self.texts[slot].startswith(query, packed & _OFFSET_MASK):
+                        break
+                    found.setdefault(slot, self.items[slot])
+                    if len(found) == limit:
+                        return list(found.values())
+        return list(found.values())
+
+
+# ------------------------
+# Loading from the database
+# ------------------------
+
+def _course_item(id, title):
+    return Suggestion('course', id, title, None, None)
+
+
+def _lesson_item(id, title, slug, course_id):
+    return Suggestion('lesson', id, title, slug, course_id)
+
+
+def load_suggestions():
+    """Every visible course and lesson (the soft-delete filter applies)"""
+    Course, Lesson = models.Course, models.Lesson
+    with Session(db.engine) as session:
+        courses = [_course_item(*row) for row in session.query(Course.id, Course.title)]
+        lessons = [_lesson_item(*row) for row in
+                   session.query(Lesson.id, Lesson.title, Lesson.slug, Lesson.course_id)]
+    return courses + lessons
+
+
+def _load_courses(course_ids):
+    """``{course id: (course or None, lessons)}`` for each of ``course_ids``"""
+    Course, Lesson = models.Course, models.Lesson
+    loaded = {course_id: (None, []) for course_id in course_ids}
+    with Session(db.engine) as session:
+        for row in session.query(Course.id, Course.title).filter(Course.id.in_(course_ids)):
+            loaded[row.id] = (_course_item(*row), [])
+        lessons = session.query(Lesson.id, Lesson.title, Lesson.slug, Lesson.course_id)\
+            .filter(Lesson.course_id.in_(course_ids))
+        for lesson in lessons:
+            course, course_lessons = loaded[lesson.course_id]
+            if course is not None:
+                course_lessons.append(_lesson_item(*lesson))
+    return loaded
+
+
+class Suggestions:
+    """This worker's index: built on first use, patched on commits, rebuilt periodically"""
+
+    def __init__(self, app):
+        self.app = app
+        self.rebuild_seconds = app.config['SUGGEST_REBUILD_SECONDS']
+        self.index = None
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        self.touched = set()  # courses changed while a rebuild was reading
+
+    def current(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self.index = TitleIndex.build(load_suggestions())
+                    self.built_at = time.monotonic()
+        elif time.monotonic() - self.built_at >= self.rebuild_seconds and not self.rebuilding:
+            with self.lock:
+                if not self.rebuilding:
+                    self.rebuilding = True
+                    threading.Thread(target=self._rebuild, name='suggest-index', daemon=True).start()
+        return self.index
+
+    def _rebuild(self):
+        try:
+            with self.app.app_context():
+                index = TitleIndex.build(load_suggestions())
+                with self.lock:
+                    self.index, touched, self.touched = index, self.touched, set()
+                    self.built_at = time.monotonic()
+                if touched:
+                    self._replace(index, touched)
+        except Exception as e:
+            self.app.logger.error(f'Suggestion index rebuild failed: {e}')
+            self.built_at = time.monotonic()  # retry after another interval
+        finally:
+            self.rebuilding = False
+
+    @staticmethod
+    def _replace(index, course_ids):
+        for course_id, (course, lessons) in _load_courses(sorted(course_ids)).items():
+            index.replace_course(course_id, course, lessons)
+
+    def courses_changed(self, course_ids):
+        if self.index is None or not course_ids:
+            return
+        if self.rebuilding:
+            self.touched.update(course_ids)
+        self._replace(self.index, course_ids)
+
+
+def suggest_titles(prefix, limit=10):
+    return current_app.extensions['suggest'].current().search(prefix, limit)
+
+
+def _on_commit(tags):
+    suggestions = current_app.extensions.get('suggest') if has_app_context() else None
+    if suggestions is None:
+        return
+    suggestions.courses_changed({int(tag.split(':', 1)[1]) for tag in tags if tag.startswith('course:')})
+
+
+def init_suggest(app):
+    """Call after ``init_cache`` (changes arrive on its invalidation bus)"""
+    app.config.setdefault('SUGGEST_REBUILD_SECONDS', 600.0)
+    app.extensions['suggest'] = Suggestions(app)
+    invalidation_bus.subscribe(_on_commit)
@@ -0,0 +1,68 @@
+"""Persistent Jinja bytecode cache.
+
+Compiled templates are written to ``TEMPLATE_CACHE_DIR`` (by default
+``instance/jinja_bytecode``), which every worker on the host shares, so a
+recycled worker loads bytecode instead of parsing and compiling each
+template again. Entries are keyed on the template's name and source
+checksum, so a deploy with changed templates never serves stale code.
+``flask templates compile`` fills the cache at deploy time.
+"""
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+templates_cli = AppGroup('templates', help='Template cache commands.')
+
+
+def init_template_cache(app):
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE', True)
+    app.config.setdefault('TEMPLATE_CACHE_DIR', None)
+    app.cli.add_command(templates_cli)
+    if not app.config['TEMPLATE_BYTECODE_CACHE']:
+        return
+    directory = app.config['TEMPLATE_CACHE_DIR'] or os.path.join(app.instance_path, 'jinja_bytecode')
+    os.makedirs(directory, exist_ok=True)
+    app.config['TEMPLATE_CACHE_DIR'] = directory
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def app_templates(app):
+    """Names of the templates under the app's own template folder"""
+    root = os.path.join(app.root_path, app.template_folder)
+    names = []
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            if filename.endswith('.html'):
+                path = os.path.relpath(os.path.join(directory, filename), root)
+                names.append(path.replace(os.sep, '/'))
+    return sorted(names)
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@templates_cli.command('compile')
+def compile_command():
+    """Compile every template into the bytecode cache."""
+    app = current_app._get_current_object()
+    if app.jinja_env.bytecode_cache is None:
+        raise click.ClickException('The bytecode cache is off; set TEMPLATE_BYTECODE_CACHE=true.')
+
+    failed = 0
+    started = time.perf_counter()
+    names = app_templates(app)
+    for name in names:
+        try:
+            app.jinja_env.get_template(name)
+        except TemplateSyntaxError as e:
+            failed += 1
+            click.secho(f'{name}:{e.lineno}: {e.message}', fg='red')
+    elapsed = (time.perf_counter() - started) * 1000
+    click.echo(f'Compiled {len(names) - failed} templates into {app.config["TEMPLATE_CACHE_DIR"]} in {elapsed:.0f} ms.')
+    if failed:
+        raise SystemExit(1)
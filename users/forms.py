@@ -26,12 +26,12 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField('Sign Up')
 
     def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
+        user = User.query.execution_options(include_deleted=True).filter_by(username=username.data).first()
         if user:
             raise ValidationError('Username already exists! Please choose a different one.')
 
     def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
+        user = User.query.execution_options(include_deleted=True).filter_by(email=email.data).first()
         if user:
             raise ValidationError('Email already exists! Please choose a different one.')
 
@@ -56,13 +56,13 @@ class UpdateProfileForm(FlaskForm):
 
     def validate_username(self, username):
         if username.data != current_user.username:
-            user = User.query.filter_by(username=username.data).first()
+            user = User.query.execution_options(include_deleted=True).filter_by(username=username.data).first()
             if user:
                 raise ValidationError('Username already exists! Please choose a different one.')
 
     def validate_email(self, email):
         if email.data != current_user.email:
-            user = User.query.filter_by(email=email.data).first()
+            user = User.query.execution_options(include_deleted=True).filter_by(email=email.data).first()
             if user:
                 raise ValidationError('Email already exists! Please choose a different one.')
 
@@ -1,13 +1,14 @@
 import os
 import secrets
-from PIL import Image
-from flask import render_template, url_for, flash, redirect, request, abort
+from flask import render_template, url_for, flash, redirect, request, abort, current_app
 from sqlalchemy import or_
 from .forms import RegistrationForm, LoginForm, UpdateProfileForm, RequestResetForm, ResetPasswordForm
-from app import db, bcrypt, mail
-from models import User, Lesson, Course
+from app import db, bcrypt
+from models import User, Lesson, Course, PasswordResetRequest
+from analytics import record_event
+from async_io import send_mail
 from flask_login import login_user, current_user, logout_user, login_required
-from flask_mail import Message
+from metrics import observe_upload
 from . import users
 
 
@@ -42,6 +43,7 @@ def login():
             # Update last login time
             from datetime import datetime
             user.last_login = datetime.utcnow()
+            record_event('logins')
             db.session.commit()
             
             login_user(user, remember=form.remember_me.data)
@@ -83,7 +85,7 @@ def reset_token(token):
         return redirect(url_for('main.home'))
     user = User.verify_reset_token(token)
     if user is None:
-        from app import app
+        app = current_app
         app.logger.info(f"Invalid token attempted: {token}")
         flash('That is an invalid or expired token', 'warning')
         return redirect(url_for('users.reset_request'))
@@ -92,6 +94,7 @@ def reset_token(token):
         hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
         user.password = hashed_password
         # Clear the reset token after successful use
+        PasswordResetRequest.query.filter_by(token=token).update({'used': True})
         user.last_reset_token = None
         db.session.commit()
         flash('Your password has been updated! You can now log in.', 'success')
@@ -152,25 +155,26 @@ def logout():
 @users.route("/author/<int:author_id>")
 def author(author_id: int):
     author_obj = User.query.get_or_404(author_id)
-    # Courses authored: any course that has lessons by this user
-    author_lessons = Lesson.query.filter_by(user_id=author_obj.id).all()
-    course_ids = sorted({l.course_id for l in author_lessons})
-    courses = Course.query.filter(Course.id.in_(course_ids)).all() if course_ids else []
-
-    total_courses = len(courses)
+    # Courses authored: any course that has lessons by this user. Left
+    # unevaluated; the template only runs it when its fragment isn't cached
+    courses = (
+        Course.query
+        .filter(Course.id.in_(db.session.query(Lesson.course_id).filter_by(user_id=author_obj.id)))
+        .order_by(Course.id)
+    )
     return render_template(
         "author.html",
         title=f"{author_obj.fname} {author_obj.lname}",
         author=author_obj,
-        courses=courses,
-        total_courses=total_courses
+        courses=courses
     )
 
 
 
 # Save uploaded images with random names and optional resizing
+@observe_upload
 def save_picture(form_picture, path, output_size=None):
-    from app import app
+    app = current_app
     
     random_hex = secrets.token_hex(8)
     _, f_ext = os.path.splitext(form_picture.filename)
@@ -180,6 +184,7 @@ def save_picture(form_picture, path, output_size=None):
     if f_ext.lower() == ".svg":
         form_picture.save(picture_path)
     else:
+        from PIL import Image  # slow to import, only needed for uploads
         i = Image.open(form_picture)
         if output_size:
             # Maintain aspect by fitting inside the box
@@ -190,7 +195,7 @@ def save_picture(form_picture, path, output_size=None):
 
 # Delete old files if they're not the default ones
 def delete_if_not_default(directory: str, filename: str, default_name: str) -> None:
-    from app import app
+    app = current_app
     
     if not filename or filename == default_name:
         return
@@ -201,7 +206,8 @@ def delete_if_not_default(directory: str, filename: str, default_name: str) -> N
 
 # Send password reset email 
 def send_reset_email(user):
-    from app import app
+    from flask_mail import Message  # loaded on first reset email, not at startup
+    app = current_app._get_current_object()
     
     token = user.get_reset_token()
     reset_url = url_for('users.reset_token', token=token, _external=True)
@@ -218,12 +224,19 @@ def send_reset_email(user):
         f"<p><a href=\"{reset_url}\">Reset Password</a></p>"
         f"<p>If you did not make this request then simply ignore this email and no changes will be made.</p>"
     )
+    email = user.email
+
+    def log_reset_link(e):
+        # Log and fallback to printing the URL for development convenience
+        app.logger.error(f"Failed to send reset email to {email}: {e}")
+        app.logger.info(f"Password reset link for {email}: {reset_url}")
+
     try:
-        mail.send(msg)
+        # Queued rather than sent inline unless ASYNC_MODE is off; a queued
+        # send that fails calls log_reset_link later
+        send_mail(msg, on_error=log_reset_link)
     except Exception as e:
-        # Log and fallback to printing the URL for development convenience
-        app.logger.error(f"Failed to send reset email to {user.email}: {e}")
-        app.logger.info(f"Password reset link for {user.email}: {reset_url}")
+        log_reset_link(e)
 
 
 def send_reset_emali(user):
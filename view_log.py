@@ -0,0 +1,200 @@
+"""Lesson view counts from a buffered, append-only event log.
+
+Every lesson page a reader gets, including ``304`` revalidations, becomes a
+``lesson_view`` event. Events collect in a per-process buffer and a
+background thread appends them in one batch every
+``ANALYTICS_FLUSH_SECONDS`` (or sooner once ``ANALYTICS_BATCH_SIZE`` are
+waiting). They go to a separate SQLite database, the ``analytics`` bind
+(``ANALYTICS_DATABASE_URL``), so counting readers never queues behind the
+main database's single writer lock.
+
+Every ``ANALYTICS_COMPACT_SECONDS`` the same thread folds the events into
+``lesson_view_count`` and ``course_view_count`` and deletes them, in one
+short transaction. Pages show counts with a primary key lookup, so they
+lag by up to a compaction interval; events still in a buffer when a worker
+dies are lost. ``flask analytics compact`` flushes and compacts on demand.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import func, insert, true
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from analytics import analytics_cli
+from app import db
+import models
+
+ANALYTICS_BIND = 'analytics'
+
+
+class ViewLog:
+    """Buffers view events and writes them to the analytics bind in batches"""
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+        self.batch_size = app.config['ANALYTICS_BATCH_SIZE']
+        self.flush_seconds = app.config['ANALYTICS_FLUSH_SECONDS']
+        self.compact_seconds = app.config['ANALYTICS_COMPACT_SECONDS']
+        self.buffer = deque(maxlen=app.config['ANALYTICS_BUFFER_MAX'])
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worker = None
+        self.last_compacted = time.monotonic()
+        # Counters for this worker, shown on the admin dashboard
+        self.status = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'compacted': 0,
+                       'last_compaction': None, 'last_error': None}
+
+    def record(self, lesson_id, course_id, user_id=None):
+        event = {'lesson_id': lesson_id, 'course_id': course_id, 'user_id': user_id,
+                 'viewed_at': datetime.utcnow()}
+        with self.lock:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.status['dropped'] += 1  # the deque drops the oldest
+            self.buffer.append(event)
+            self.status['recorded'] += 1
+            waiting = len(self.buffer)
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='view-log', daemon=True)
+                self.worker.start()
+        if waiting >= self.batch_size:
+            self.wakeup.set()
+
+    def flush(self):
+        """Append everything buffered so far; returns how many events went"""
+        with self.lock:
+            batch = list(self.buffer)
+            self.buffer.clear()
+        if not batch:
+            return 0
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(insert(models.LessonView.__table__), batch)
+        except Exception:
+            # Keep the events for the next attempt, newest ones first to go
+            with self.lock:
+                room = self.buffer.maxlen - len(self.buffer)
+                self.status['dropped'] += max(0, len(batch) - room)
+                self.buffer.extendleft(reversed(batch[-room:] if room else []))
+            raise
+        self.status['flushed'] += len(batch)
+        return len(batch)
+
+    def compact(self):
+        """Fold logged events into the count tables; returns how many were folded"""
+        events = models.LessonView.__table__
+        lessons = models.LessonViewCount.__table__
+        courses = models.CourseViewCount.__table__
+        # The first statement takes the write lock, so no batch can land
+        # between counting the events and deleting them
+        lesson_rows = sqlite_insert(lessons).from_select(
+            ['lesson_id', 'course_id', 'views'],
+            db.select(events.c.lesson_id, func.max(events.c.course_id), func.count())
+            .where(true()).group_by(events.c.lesson_id),  # WHERE: SQLite's upsert-from-select rule
+        )
+        lesson_rows = lesson_rows.on_conflict_do_update(
+            index_elements=['lesson_id'],
+            set_={'views': lessons.c.views + lesson_rows.excluded.views,
+                  'course_id': lesson_rows.excluded.course_id},
+        )
+        course_rows = sqlite_insert(courses).from_select(
+            ['course_id', 'views'],
+            db.select(events.c.course_id, func.count()).where(true()).group_by(events.c.course_id),
+        )
+        course_rows = course_rows.on_conflict_do_update(
+            index_elements=['course_id'],
+            set_={'views': courses.c.views + course_rows.excluded.views},
+        )
+        with self.engine.begin() as connection:
+            connection.execute(lesson_rows)
+            connection.execute(course_rows)
+            folded = connection.execute(events.delete()).rowcount
+        self.last_compacted = time.monotonic()
+        self.status['compacted'] += folded
+        self.status['last_compaction'] = datetime.utcnow()
+        return folded
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self.last_compacted >= self.compact_seconds:
+                    self.compact()
+                self.status['last_error'] = None
+            except Exception as e:
+                self.status['last_error'] = str(e)
+                self.app.logger.error(f'View log flush failed: {e}')
+
+
+def get_view_log():
+    return current_app.extensions['view_log']
+
+
+def record_lesson_view(lesson_id, course_id, user_id=None):
+    if current_app.config['ANALYTICS_VIEWS']:
+        get_view_log().record(lesson_id, course_id, user_id)
+
+
+def lesson_views(lesson_id):
+    counts = db.session.get(models.LessonViewCount, lesson_id)
+    return counts.views if counts else 0
+
+
+def course_views(course_id):
+    counts = db.session.get(models.CourseViewCount, course_id)
+    return counts.views if counts else 0
+
+
+# ------------------------
+# Setup
+# ------------------------
+
+def init_analytics_bind(app):
+    """Add the ``analytics`` bind; call before ``db.init_app``"""
+    app.config.setdefault('ANALYTICS_DATABASE_URL', 'sqlite:///analytics.db')
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(ANALYTICS_BIND, app.config['ANALYTICS_DATABASE_URL'])
+
+
+def init_view_log(app):
+    """Call after the models are imported"""
+    app.config.setdefault('ANALYTICS_VIEWS', True)
+    app.config.setdefault('ANALYTICS_BATCH_SIZE', 500)
+    app.config.setdefault('ANALYTICS_BUFFER_MAX', 50000)
+    app.config.setdefault('ANALYTICS_FLUSH_SECONDS', 2.0)
+    app.config.setdefault('ANALYTICS_COMPACT_SECONDS', 60.0)
+    with app.app_context():
+        # A scratch database of its own, so its tables are created here
+        # rather than by the main database's migrations
+        db.create_all(bind_key=ANALYTICS_BIND)
+        view_log = ViewLog(app, db.engines[ANALYTICS_BIND])
+    app.extensions['view_log'] = view_log
+    atexit.register(_flush_quietly, view_log)
+    app.jinja_env.globals.update(lesson_views=lesson_views, course_views=course_views)
+
+
+def _flush_quietly(view_log):
+    try:
+        view_log.flush()
+    except Exception:
+        pass
+
+
+# ------------------------
+# CLI
+# ------------------------
+
+@analytics_cli.command('compact')
+def compact_command():
+    """Write buffered lesson views and fold them into the view counts."""
+    view_log = get_view_log()
+    view_log.flush()
+    folded = view_log.compact()
+    click.echo(f'Folded {folded} lesson views into the counts.')